@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from assetreturns import generateLeaseholdPropertyForecast, HLStock, Property
+
+
+def propertyCandidate(ltv_percentages, forecast_factory=generateLeaseholdPropertyForecast, **fixed_kwargs):
+    """Options for one property, one per ltv_percentage, for AllocationOptimizer."""
+    return {f"{ltv_percentage:.0%} LTV": (forecast_factory, {**fixed_kwargs, "ltv_percentage": ltv_percentage})
+            for ltv_percentage in ltv_percentages}
+
+
+def stockCandidate(stock_values, price_to_earnings=21.73, **kwargs):
+    """Options for an HLStock holding, one per amount invested, for AllocationOptimizer."""
+    return {f"£{stock_value:,.0f}": (HLStock, {"stock_value": stock_value, "price_to_earnings": price_to_earnings,
+                                               **kwargs})
+            for stock_value in stock_values}
+
+
+def _evaluateOptions(options, years, annual_price_change_percentage):
+    # Cash needed up front and the nominal return at every horizon, for a list of (factory, kwargs) options.
+    cash_required = np.empty(len(options))
+    return_curves = np.empty((len(options), len(years)))
+    for i, (forecast_factory, kwargs) in enumerate(options):
+        forecast = forecast_factory(**kwargs)
+        cash_required[i] = forecast.initial_equity_cost + forecast.buy_expenses
+        if isinstance(forecast, Property):
+            cash_required[i] += forecast.mortgage.total_fees(0)
+        return_curves[i] = forecast.nominal_return_surface(years, [annual_price_change_percentage])[0]
+    return cash_required, return_curves
+
+
+class AllocationOptimizer:
+    """
+    Picks the mix of candidates with the largest nominal return at a horizon for a fixed amount of capital.
+
+    candidates maps each asset name to its options, {label: (forecast_factory, kwargs)} as built by propertyCandidate
+    and stockCandidate; a mix holds at most one option of each asset, e.g. one LTV of each property. Every option is
+    built and its return curve over years 1..years worked out once, split over a process pool when processes > 1.
+    Capital is what each option needs on the day of purchase (deposit, buy expenses and mortgage fees); later
+    contributions are not counted against it.
+
+    optimise solves the multiple-choice knapsack exactly by dynamic programming over capital in steps of
+    capital_step, keeping the best few mixes at every amount of capital so the runner-ups come out of the same pass.
+    Each option's cash is rounded up to a whole step, so every mix it returns is affordable.
+    """
+
+    def __init__(self, candidates, years=25, annual_price_change_percentage=0.01, processes=None, chunk_size=200):
+        self.names = list(candidates)
+        self.labels = [list(options) for options in candidates.values()]
+        self.years = np.arange(1, years + 1)
+        self.annual_price_change_percentage = annual_price_change_percentage
+        options = [option for options in candidates.values() for option in options.values()]
+        # Row of each asset's first option in the flat arrays.
+        self._offsets = np.cumsum([0] + [len(labels) for labels in self.labels])
+        chunks = [options[start:start + chunk_size] for start in range(0, len(options), chunk_size)]
+        arguments = (self.years, annual_price_change_percentage)
+        if processes and processes > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_evaluateOptions, chunks, *([argument] * len(chunks)
+                                                                        for argument in arguments)))
+        else:
+            results = [_evaluateOptions(chunk, *arguments) for chunk in chunks]
+        self.cash_required = np.concatenate([cash_required for cash_required, _ in results])
+        self.return_curves = np.concatenate([return_curves for _, return_curves in results])
+
+    def options(self):
+        """Every option with its cash required and nominal return at each horizon."""
+        frame = pd.DataFrame(self.return_curves, columns=[f"Year {year}" for year in self.years])
+        frame.insert(0, "Asset Name", np.repeat(self.names, np.diff(self._offsets)))
+        frame.insert(1, "Option", [label for labels in self.labels for label in labels])
+        frame.insert(2, "Cash Required", self.cash_required)
+        return frame
+
+    def _best(self, weights, values, cells, count):
+        # best[c] holds the `count` largest returns, best first, from capital c. sources[g, c, r] records where
+        # rank r at asset g came from: block 0 skips the asset, block b takes its option b - 1, each at a rank of
+        # the asset before.
+        best = np.full((cells + 1, count), -np.inf)
+        best[:, 0] = 0
+        sources = np.empty((len(self.names), cells + 1, count), dtype=np.int32)
+        for group, (start, stop) in enumerate(zip(self._offsets[:-1], self._offsets[1:])):
+            blocks = [best]
+            for option in range(start, stop):
+                taken = np.full((cells + 1, count), -np.inf)
+                if weights[option] <= cells:
+                    taken[weights[option]:] = best[:cells + 1 - weights[option]] + values[option]
+                blocks.append(taken)
+            candidates = np.concatenate(blocks, axis=1)
+            order = np.argsort(-candidates, axis=1, kind="stable")[:, :count]
+            sources[group] = order
+            best = np.take_along_axis(candidates, order, axis=1)
+        mixes = []
+        for rank in np.flatnonzero(best[cells] > -np.inf):
+            mix = []
+            cell = cells
+            rank_at = rank
+            for group in range(len(self.names) - 1, -1, -1):
+                block, rank_at = divmod(sources[group, cell, rank_at], count)
+                if block:
+                    option = self._offsets[group] + block - 1
+                    mix.append(option)
+                    cell -= weights[option]
+            mixes.append((best[cells, rank], sorted(mix)))
+        return mixes
+
+    def optimise(self, capital, horizon_years, capital_step=1000, runner_ups=5):
+        """
+        The best mix at horizon_years and the next runner_ups best, one row each, best first (Rank 0 is the chosen
+        mix).
+        """
+        if not 1 <= horizon_years <= len(self.years):
+            raise ValueError(f"horizon_years must be between 1 and {len(self.years)}")
+        values = self.return_curves[:, horizon_years - 1]
+        weights = np.ceil(self.cash_required / capital_step).astype(int)
+        ranked = self._best(weights, values, int(capital // capital_step), runner_ups + 1)
+        group_of = np.searchsorted(self._offsets, np.arange(len(values)), side="right") - 1
+        rows = []
+        for rank, (total, mix) in enumerate(ranked):
+            mix = list(mix)
+            cash_required = self.cash_required[mix].sum()
+            rows.append({"Rank": rank, "Nominal ROI": total, "Cash Required": cash_required,
+                         "Capital Left": capital - cash_required,
+                         "% ROI": total / cash_required if cash_required else 0.0,
+                         "Holdings": {self.names[group_of[option]]:
+                                      self.labels[group_of[option]][option - self._offsets[group_of[option]]]
+                                      for option in mix}})
+        return pd.DataFrame(rows)
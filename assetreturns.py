@@ -1,132 +1,470 @@
+import collections
+import functools
+import hashlib
+import json
+import os
 import numpy as np
-import numpy_financial
-import pandas as pd
 from abc import ABC, abstractmethod
-from tabulate import tabulate
-import altair as alt
 
+import instrumentation
 
-def calculateSDLT(second_property, property_value, is_first_time_buyer=False):
-    rates = [0.00, .02, 0.05, 0.10, 0.12]
-    thresholds = [125000, 250000, 925000, 1500000, 10000000]
-    total_tax = 0
-    remaining_taxable = property_value
 
-    # First-time buyer relief (mutually exclusive with second property surcharge)
-    if is_first_time_buyer and not second_property and property_value <= 500000:
-        # First-time buyer rates: 0% up to £300k, 5% on £300k-£500k
-        if property_value <= 300000:
-            return 0
-        else:
-            # 5% on the portion above £300k
-            return (property_value - 300000) * 0.05
-
-    # Second property surcharge (5% additional on all bands)
-    if second_property:
-        rates = [rate + 0.05 for rate in rates]
-
-    for i in range(len(thresholds) - 1, -1, -1):
-        threshold = thresholds[i]
-        rate = rates[i]
-        if i != 0:
-            lower_threshold = thresholds[i - 1]
-            if lower_threshold >= remaining_taxable:
-                continue
-            threshold_taxable = remaining_taxable - lower_threshold
-            remaining_taxable = lower_threshold
+class TaxBands:
+    """
+    Marginal tax bands: rates[i] applies to the part of a value above thresholds[i] (the first threshold is 0).
+    The tax owed at each threshold is summed once, so evaluating a whole array of values is a searchsorted and a
+    lookup.
+    """
+
+    def __init__(self, thresholds, rates):
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        self.cumulative_tax = np.concatenate([[0], np.cumsum(np.diff(self.thresholds) * self.rates[:-1])])
+
+    def tax(self, values):
+        values = np.asarray(values, dtype=float)
+        # A value sitting on a threshold is taxed entirely by the bands below it.
+        band = np.maximum(np.searchsorted(self.thresholds, values, side="left") - 1, 0)
+        return (self.cumulative_tax[band] + (values - self.thresholds[band]) * self.rates[band])[()]
+
+
+class SDLTSchedule:
+    def __init__(self, thresholds, rates, additional_property_surcharge, first_time_buyer_thresholds,
+                 first_time_buyer_rates, first_time_buyer_max_price):
+        self.standard = TaxBands(thresholds, rates)
+        self.additional_property = TaxBands(thresholds, [rate + additional_property_surcharge for rate in rates])
+        self.first_time_buyer = TaxBands(first_time_buyer_thresholds, first_time_buyer_rates)
+        self.first_time_buyer_max_price = first_time_buyer_max_price
+
+    def tax(self, second_property, property_value, is_first_time_buyer=False):
+        # First-time buyer relief is mutually exclusive with the second property surcharge.
+        if second_property:
+            return self.additional_property.tax(property_value)
+        standard_tax = self.standard.tax(property_value)
+        if not is_first_time_buyer:
+            return standard_tax
+        return np.where(np.asarray(property_value) <= self.first_time_buyer_max_price,
+                        self.first_time_buyer.tax(property_value), standard_tax)[()]
+
+
+class CapitalGainsSchedule:
+    def __init__(self, allowance, property_rate, other_rate):
+        self.allowance = allowance
+        self.property_rate = property_rate
+        self.other_rate = other_rate
+
+    def tax(self, is_property, price_gain):
+        capital_gains_tax_rate = self.property_rate if is_property else self.other_rate
+        # price_gain may be an array of gains.
+        price_gain = np.asarray(price_gain)
+        return np.where(price_gain <= self.allowance, 0, (price_gain - self.allowance) * capital_gains_tax_rate)[()]
+
+
+# Residential rates in England, keyed by tax year. Register other years (or hypothetical regimes) with
+# registerTaxYear or loadTaxYears rather than editing the functions below.
+SDLT_SCHEDULES = {
+    "2023-24": SDLTSchedule(thresholds=[0, 250000, 925000, 1500000], rates=[0.00, 0.05, 0.10, 0.12],
+                            additional_property_surcharge=0.03, first_time_buyer_thresholds=[0, 425000],
+                            first_time_buyer_rates=[0.00, 0.05], first_time_buyer_max_price=625000),
+    "2025-26": SDLTSchedule(thresholds=[0, 125000, 250000, 925000, 1500000], rates=[0.00, .02, 0.05, 0.10, 0.12],
+                            additional_property_surcharge=0.05, first_time_buyer_thresholds=[0, 300000],
+                            first_time_buyer_rates=[0.00, 0.05], first_time_buyer_max_price=500000),
+}
+# Higher rate taxpayer.
+CAPITAL_GAINS_SCHEDULES = {
+    "2022-23": CapitalGainsSchedule(allowance=12300, property_rate=0.28, other_rate=0.20),
+    "2023-24": CapitalGainsSchedule(allowance=6000, property_rate=0.28, other_rate=0.20),
+    "2025-26": CapitalGainsSchedule(allowance=3000, property_rate=0.24, other_rate=0.24),
+}
+DEFAULT_SDLT_TAX_YEAR = "2025-26"
+# The allowance and rates the forecasts have always been quoted with.
+DEFAULT_CAPITAL_GAINS_TAX_YEAR = "2022-23"
+
+
+def registerTaxYear(tax_year, sdlt=None, capital_gains=None):
+    """sdlt and capital_gains are SDLTSchedule/CapitalGainsSchedule kwargs (or instances)."""
+    if sdlt is not None:
+        SDLT_SCHEDULES[tax_year] = sdlt if isinstance(sdlt, SDLTSchedule) else SDLTSchedule(**sdlt)
+    if capital_gains is not None:
+        CAPITAL_GAINS_SCHEDULES[tax_year] = capital_gains if isinstance(
+            capital_gains, CapitalGainsSchedule) else CapitalGainsSchedule(**capital_gains)
+    _cachedSDLT.cache_clear()
+
+
+def loadTaxYears(path):
+    """
+    Registers every tax year in a JSON file shaped like
+    {"2026-27": {"sdlt": {...SDLTSchedule kwargs...}, "capital_gains": {...CapitalGainsSchedule kwargs...}}}.
+    """
+    with open(path) as tax_year_file:
+        for tax_year, schedules in json.load(tax_year_file).items():
+            registerTaxYear(tax_year, **schedules)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cachedSDLT(tax_year, second_property, property_value, is_first_time_buyer):
+    return SDLT_SCHEDULES[tax_year].tax(second_property, property_value, is_first_time_buyer)
+
+
+def calculateSDLT(second_property, property_value, is_first_time_buyer=False, tax_year=DEFAULT_SDLT_TAX_YEAR):
+    # property_value may be an array of prices; scalar calls are memoised.
+    if np.ndim(property_value) == 0:
+        return _cachedSDLT(tax_year, bool(second_property), float(property_value), bool(is_first_time_buyer))
+    return SDLT_SCHEDULES[tax_year].tax(second_property, property_value, is_first_time_buyer)
+
+
+class PaymentSchedule:
+    """
+    A payment table held as one read-only (4 x months) float64 array, columns in PaymentSchedule.COLUMNS order.
+    Unpacks like the (principle, interest, payment, early repayment) tuple the schedule engines return, and
+    to_frame() gives the pandas payment table as a view without copying.
+    """
+    __slots__ = ("columns", "_cumulative")
+    COLUMNS = ("Principle", "Interest", "Payment", "Early Repayment")
+
+    def __init__(self, principles, interests, payments, early_repayments):
+        self.columns = np.array([principles, interests, payments, early_repayments], dtype=float)
+        # Cached totals would go stale if the table were edited in place.
+        self.columns.setflags(write=False)
+        self._cumulative = None
+
+    @classmethod
+    def from_frame(cls, payment_table):
+        return cls(*(payment_table[column].to_numpy(dtype=float) for column in cls.COLUMNS))
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Wraps an existing (4 x months) array, e.g. a memory-mapped file, without copying it."""
+        schedule = cls.__new__(cls)
+        schedule.columns = np.asarray(columns)
+        schedule.columns.setflags(write=False)
+        schedule._cumulative = None
+        return schedule
+
+    def __getitem__(self, column_index):
+        return self.columns[column_index]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    @property
+    def months(self):
+        return self.columns.shape[1]
+
+    @property
+    def cumulative(self):
+        """Totals of the first k months (k = 0..months) of the interest, payment and early repayment columns."""
+        if self._cumulative is None:
+            cumulative = np.zeros((3, self.months + 1))
+            np.cumsum(self.columns[1:], axis=1, out=cumulative[:, 1:])
+            cumulative.setflags(write=False)
+            self._cumulative = tuple(cumulative)
+        return self._cumulative
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.columns.T, columns=list(self.COLUMNS), copy=False)
+
+
+class ScheduleCache:
+    """
+    Payment schedules keyed by everything that determines them: the schedule engine and its inputs. Recently used
+    schedules are kept in memory, least recently used first out once they exceed max_bytes. With a directory,
+    every schedule built is also written there as an .npy file named by a hash of its key, and later lookups
+    (in this process, another worker or after a restart) memory-map the file instead of rebuilding it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory=None, max_bytes=256 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._schedules = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(schedule_engine, principle, payment_months, periodic_interest_rate, monthly_installment,
+            early_repayment_months_and_amount={}):
+        return (f"{schedule_engine.__module__}.{schedule_engine.__qualname__}", float(principle),
+                int(payment_months), float(periodic_interest_rate), float(monthly_installment),
+                tuple(sorted((int(month), float(amount)) for month, amount in early_repayment_months_and_amount.items())))
+
+    def _path(self, key):
+        # repr round-trips floats exactly, so equal keys always hash to the same file.
+        digest = hashlib.sha256(repr((self.VERSION, key)).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.npy")
+
+    def schedule(self, schedule_engine, principle, payment_months, periodic_interest_rate, monthly_installment,
+                 early_repayment_months_and_amount={}):
+        key = self.key(schedule_engine, principle, payment_months, periodic_interest_rate, monthly_installment,
+                       early_repayment_months_and_amount)
+        if key in self._schedules:
+            self.hits += 1
+            self._schedules.move_to_end(key)
+            return self._schedules[key]
+
+        path = self._path(key) if self.directory is not None else None
+        if path is not None and os.path.exists(path):
+            self.disk_hits += 1
+            schedule = PaymentSchedule.from_columns(np.load(path, mmap_mode="r"))
         else:
-            threshold_taxable = remaining_taxable
-        threshold_tax = threshold_taxable * rate
-        total_tax += threshold_tax
-    return total_tax
+            self.misses += 1
+            schedule = PaymentSchedule(*schedule_engine(principle, payment_months, periodic_interest_rate,
+                                                        monthly_installment, early_repayment_months_and_amount))
+            if path is not None:
+                # Written under a temporary name and renamed, so concurrent workers never see half a file.
+                temporary_path = f"{path}.{os.getpid()}.partial"
+                with open(temporary_path, "wb") as schedule_file:
+                    np.save(schedule_file, schedule.columns)
+                os.replace(temporary_path, path)
+
+        self._schedules[key] = schedule
+        self._bytes += schedule.columns.nbytes
+        while self._bytes > self.max_bytes and len(self._schedules) > 1:
+            _, evicted = self._schedules.popitem(last=False)
+            self._bytes -= evicted.columns.nbytes
+        return schedule
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._schedules), "bytes": self._bytes}
+
+    def clear(self):
+        """Empties the in-memory layer and resets the statistics; files on disk are kept."""
+        self._schedules.clear()
+        self._bytes = 0
+        self.hits = self.disk_hits = self.misses = 0
 
 
 class Mortgage(ABC):
+    __slots__ = ()
 
     @property
     def principle(self):
         return self._principle
 
+    @property
+    def schedule(self):
+        return PaymentSchedule.from_frame(self.payment_table)
+
+    # Prefix sums over the payment table: cumulative_x[k] is the total of the first k months, so any
+    # "total over N years" query is a single lookup. Subclasses that hold a schedule cache these.
+    @property
+    def cumulative_interest(self):
+        return self.schedule.cumulative[0]
+
+    @property
+    def cumulative_payments(self):
+        return self.schedule.cumulative[1]
+
+    @property
+    def cumulative_early_repayments(self):
+        return self.schedule.cumulative[2]
+
+    @staticmethod
+    def _total_over(cumulative, years):
+        # years may be an array of horizons.
+        return cumulative[np.clip(np.asarray(years) * 12, 0, len(cumulative) - 1)]
+
     def __total_repayments(self, years):
-        return self.payment_table["Payment"][0:years * 12].sum()
+        return self._total_over(self.cumulative_payments, years)
 
     def total_payments(self, years):
-        return self.payment_table["Payment"][0:years * 12].sum()
+        return self._total_over(self.cumulative_payments, years)
 
     def total_principle_paid(self, years):
         return self.__total_repayments(years) - self.total_interest(years)
 
     def total_interest(self, years):
         # TODO calculate interest total
-        return self.payment_table["Interest"][0:years * 12].sum()
+        return self._total_over(self.cumulative_interest, years)
+
+    def total_early_repayments(self, years):
+        return self._total_over(self.cumulative_early_repayments, years)
+
+    def outstanding_balance(self, months):
+        """Balance left to pay off after `months` payments; zero once the term is over. months may be an array."""
+        principles, interests, payments, _ = self.schedule
+        months = np.asarray(months)
+        index = np.clip(months - 1, 0, len(principles) - 1)
+        balance = principles[index] + interests[index] - payments[index]
+        return np.where(months < len(principles), np.where(months <= 0, self.principle, balance), 0)[()]
 
     def total_fees(self, years):
         return self.total_interest(years) + 1000
 
 
+def recurrenceSchedule(principle, payment_months, periodic_interest_rate, monthly_installment,
+                       early_repayment_months_and_amount={}):
+    """
+    Amortisation schedule built month by month on plain floats.
+    Returns (principle, interest, payment, early repayment) float64 columns. The order of operations matches the
+    original payment table so totals agree with previously quoted figures to the last bit.
+    """
+    # Python lists of plain floats are several times quicker to fill than indexing into NumPy arrays.
+    monthly_installment = float(monthly_installment)
+    balance = float(principle)
+    interest = periodic_interest_rate * balance
+    payment = monthly_installment
+    balances = [balance]
+    interests = [interest]
+    payments = [payment]
+    early_repayments = np.zeros(payment_months)
+    for i in range(1, payment_months):
+        balance = balance + interest - payment
+        interest = balance * periodic_interest_rate
+        month = i + 1
+        if month in early_repayment_months_and_amount:
+            # The percentage applies to the balance at the start of the repayment month.
+            early_repayment = early_repayment_months_and_amount[month] * balance
+            early_repayments[i] = early_repayment
+            payment = min(monthly_installment + early_repayment, balance + interest)
+        else:
+            payment = min(monthly_installment, balance + interest)
+        balances.append(balance)
+        interests.append(interest)
+        payments.append(payment)
+
+    payments[-1] = balances[-1] + interests[-1]
+    return np.array(balances), np.array(interests), np.array(payments), early_repayments
+
+
+def closedFormSchedule(principle, payment_months, periodic_interest_rate, monthly_installment,
+                       early_repayment_months_and_amount={}):
+    """
+    Amortisation schedule evaluated with the closed-form annuity balance, one NumPy pass per segment between
+    early repayment months. Same columns as recurrenceSchedule, agreeing to floating point tolerance.
+    """
+    months_elapsed = np.arange(payment_months, dtype=float)
+    growth = (1 + periodic_interest_rate) ** months_elapsed
+    if periodic_interest_rate == 0:
+        annuity = months_elapsed
+    else:
+        annuity = (growth - 1) / periodic_interest_rate
+
+    early_repayment_indices = sorted(month - 1 for month in early_repayment_months_and_amount
+                                     if 1 <= month - 1 < payment_months)
+    balances = np.empty(payment_months)
+    early_repayments = np.zeros(payment_months)
+    payments = np.full(payment_months, float(monthly_installment))
+
+    segment_start = 0
+    opening_balance = principle
+    for segment_end in early_repayment_indices + [payment_months - 1]:
+        segment_length = segment_end - segment_start + 1
+        balances[segment_start:segment_end + 1] = (opening_balance * growth[:segment_length]
+                                                   - monthly_installment * annuity[:segment_length])
+        if segment_end in early_repayment_indices:
+            month = segment_end + 1
+            early_repayments[segment_end] = early_repayment_months_and_amount[month] * balances[segment_end]
+            payments[segment_end] += early_repayments[segment_end]
+        opening_balance = balances[segment_end] * (1 + periodic_interest_rate) - payments[segment_end]
+        segment_start = segment_end + 1
+
+    interests = balances * periodic_interest_rate
+    amount_due = balances + interests
+    paid_off = np.flatnonzero(amount_due <= payments)
+    if len(paid_off):
+        # Everything after the month the balance is cleared is zero.
+        payoff_index = paid_off[0]
+        payments[payoff_index] = amount_due[payoff_index]
+        balances[payoff_index + 1:] = 0
+        interests[payoff_index + 1:] = 0
+        payments[payoff_index + 1:] = 0
+        early_repayments[payoff_index + 1:] = 0
+
+    payments[-1] = balances[-1] + interests[-1]
+    return balances, interests, payments, early_repayments
+
+
 class AbstractMortgage(Mortgage):
     """
     Mortgage with some generation logic based on interest rates and monthly repayments.
     A Repayment or InterestOnly mortgage sublcass can then provide appropriate interest rates
     and monthly repayments.
     """
-    def _render_mortgage_payment_table(self):
-        pass
+    __slots__ = ("_principle", "length", "periodic_interest_rate", "monthly_installment",
+                 "early_repayment_months_and_amount", "_schedule")
+    # Swap for closedFormSchedule in a subclass when agreement to floating point tolerance is enough.
+    schedule_engine = staticmethod(recurrenceSchedule)
+    # Shared by every mortgage; set to ScheduleCache(directory) to persist schedules, or None to always rebuild.
+    schedule_cache = ScheduleCache(os.environ.get("ASSETRETURNS_SCHEDULE_CACHE"))
 
     def __init__(self, principle, length, periodic_interest_rate, monthly_installment, early_repayment_months_and_amount={}):
         self._principle = principle
-        payment_months = length * 12
-
+        self.length = length
+        self.periodic_interest_rate = periodic_interest_rate
         self.monthly_installment = monthly_installment
-        self.payment_table = pd.DataFrame(index=np.arange(0, payment_months),
-                                          columns=["Principle", "Interest", "Payment", "Early Repayment"])
-        self.payment_table.loc[0] = [principle, periodic_interest_rate * principle, self.monthly_installment, 0]
-        # Default this column to 0
-        self.payment_table["Early Repayment"].values[:] = 0
-        for i in range(1, payment_months):
-            previous_row = self.payment_table.loc[i - 1]
-            previous_principle = previous_row["Principle"]
-            previous_interest = previous_row["Interest"]
-            previous_payment = previous_row["Payment"]
-            current_row = self.payment_table.loc[i]
-            current_row["Principle"] = previous_principle + previous_interest - previous_payment
-            current_row["Interest"] = self.payment_table.loc[i]["Principle"] * periodic_interest_rate
-            month = i +1
-            if month in early_repayment_months_and_amount:
-                principle_percentage_to_repay = early_repayment_months_and_amount[month]
-                start_of_year_index = (month / 12) * 12-1
-                start_of_year_row = self.payment_table.loc[start_of_year_index]
-                current_row["Early Repayment"] =  principle_percentage_to_repay * start_of_year_row["Principle"]
-
-            current_row["Payment"] = min(self.monthly_installment+current_row["Early Repayment"], current_row["Principle"] + current_row["Interest"])
-
-        # TODO simplify this, last row should just be remaining balance, only line 81 seems to need to stay
-        last_row = self.payment_table.loc[payment_months - 1]
-        last_row["Payment"] = last_row["Principle"] + last_row["Interest"]
-        # self.payment_table = pd.concat([self.payment_table, pd.Series([principle, 1, 0])])
-        # self.payment_table = self.payment_table.append(pd.DataFrame([principle, 1, 0], ))
-        # TODO create dataframe for interest generation? Or use algorithm
+        self.early_repayment_months_and_amount = early_repayment_months_and_amount
+        # The schedule is only generated on first use; the factories only need monthly_installment.
+        self._schedule = None
+
+    @property
+    def schedule(self):
+        """The payment table as a PaymentSchedule."""
+        if self._schedule is None:
+            arguments = (self._principle, self.length * 12, self.periodic_interest_rate, self.monthly_installment,
+                         self.early_repayment_months_and_amount)
+            if self.schedule_cache is None:
+                self._schedule = PaymentSchedule(*self.schedule_engine(*arguments))
+            else:
+                self._schedule = self.schedule_cache.schedule(self.schedule_engine, *arguments)
+        return self._schedule
+
+    @property
+    def payment_table(self):
+        # A pandas view for the notebooks; the mortgage only keeps the arrays.
+        return self.schedule.to_frame()
 
 
 class InterestOnlyMortgage(AbstractMortgage):
+    __slots__ = ("interest_rate",)
+
     def __init__(self, principle, length, interest_rate):
         # Thought this would be the same as RepaymentMortgages but comparison calculators tell me it seems to be calculated
         # interest_rate / 12!
         periodic_interest_rate = interest_rate / 12
         monthly_installment = principle * periodic_interest_rate
         super().__init__(principle, length, periodic_interest_rate, monthly_installment)
+        self.interest_rate = interest_rate
+
+    @classmethod
+    def max_principle(cls, monthly_installment, length, interest_rate):
+        return np.asarray(monthly_installment, dtype=float) / (np.asarray(interest_rate, dtype=float) / 12)
 
     def total_fees(self, years):
         return self.total_interest(years) + 2000
 
 
 class RepaymentMortgage(AbstractMortgage):
+    __slots__ = ("interest_rate",)
+
     def __init__(self, principle, length, interest_rate, early_repayment_months_and_amount={}):
+        import numpy_financial
+
         payment_months = length * 12
         periodic_interest_rate = (1 + interest_rate) ** (1 / 12) - 1
 
         monthly_installment = 1 * numpy_financial.pmt(periodic_interest_rate, payment_months, principle) * -1
         super().__init__(principle, length, periodic_interest_rate, monthly_installment, early_repayment_months_and_amount)
+        self.interest_rate = interest_rate
+
+    @classmethod
+    def max_principle(cls, monthly_installment, length, interest_rate, early_repayment_months_and_amount={}):
+        """Inverse of the pmt installment: the principal `monthly_installment` repays over the term."""
+        import numpy_financial
+
+        periodic_interest_rate = (1 + np.asarray(interest_rate, dtype=float)) ** (1 / 12) - 1
+        return numpy_financial.pv(periodic_interest_rate, length * 12, -np.asarray(monthly_installment, dtype=float))
 
     @property
     def principle(self):
@@ -134,30 +472,288 @@ class RepaymentMortgage(AbstractMortgage):
 
     def total_interest(self, years):
         # TODO calculate interest total
-        return self.payment_table["Interest"][0:years * 12].sum()
+        return self._total_over(self.cumulative_interest, years)
 
     def total_fees(self, years):
         return self.total_interest(years) + 1000
 
 
-interest_rate = 0.0187
-interest_rate = 0.0359
+def ratePath(rate_schedule, payment_months):
+    """
+    Annual rate for each month of the term from a rate schedule: either a per-month array of rates, or a list of
+    (months, rate) pieces such as [(24, 0.045), (None, 0.0799)] for a two year fix reverting to a standard variable
+    rate. A piece's rate may itself be an array of monthly rates, e.g. a tracker's base rate path plus its margin;
+    months=None runs to the end of the term. The last rate holds for any months the schedule doesn't reach.
+    """
+    if not isinstance(rate_schedule[0], (tuple, list)):
+        rates = np.asarray(rate_schedule, dtype=float)
+    else:
+        pieces = []
+        for months, rate in rate_schedule:
+            months = payment_months - sum(len(piece) for piece in pieces) if months is None else months
+            pieces.append(np.broadcast_to(np.asarray(rate, dtype=float), np.shape(rate) or (months,))[:months])
+        rates = np.concatenate(pieces)
+    rates = rates[:payment_months]
+    return np.pad(rates, (0, payment_months - len(rates)), mode="edge")
+
+
+@functools.lru_cache(maxsize=4096)
+def _segmentedSchedule(principle, payment_months, segments):
+    """
+    (segment columns, closing balance) for the opening `segments` of a variable rate term, each a (months, annual
+    rate) run. Keyed by the whole prefix, so products that start with the same fix share its segments.
+    """
+    import numpy_financial
 
+    if segments[:-1]:
+        previous_columns, balance = _segmentedSchedule(principle, payment_months, segments[:-1])
+    else:
+        previous_columns, balance = (), float(principle)
+    months, interest_rate = segments[-1]
+    elapsed_months = sum(segment_months for segment_months, _ in segments[:-1])
+    periodic_interest_rate = (1 + interest_rate) ** (1 / 12) - 1
+    # Recalculated at each reset on the outstanding balance over the remaining term, as MortgageBatch does.
+    monthly_installment = float(-numpy_financial.pmt(periodic_interest_rate, payment_months - elapsed_months, balance))
+    balances, interests, payments = [], [], []
+    for _ in range(months):
+        interest = balance * periodic_interest_rate
+        payment = min(monthly_installment, balance + interest)
+        balances.append(balance)
+        interests.append(interest)
+        payments.append(payment)
+        balance = balance + interest - payment
+    columns = np.array([balances, interests, payments])
+    columns.setflags(write=False)
+    return previous_columns + (columns,), balance
+
+
+class VariableRateMortgage(AbstractMortgage):
+    """
+    Repayment mortgage whose rate follows a schedule (see ratePath), e.g. a 2 or 5 year fix then the lender's SVR or
+    a tracker. The installment is recalculated on the outstanding balance over the remaining term at every rate
+    change, and product_fees (arrangement, booking, valuation...) are counted in total_fees. With a single rate the
+    schedule matches RepaymentMortgage.
+
+    The schedule is computed one run of equal rates at a time and each run is cached by the runs before it, so a
+    set of products that share an initial fix only compute that fix once.
+    """
+    __slots__ = ("interest_rates", "product_fees")
+
+    def __init__(self, principle, length, rate_schedule, product_fees=1000):
+        import numpy_financial
+
+        payment_months = length * 12
+        self.interest_rates = ratePath(rate_schedule, payment_months)
+        self.interest_rates.setflags(write=False)
+        periodic_interest_rate = (1 + self.interest_rates[0]) ** (1 / 12) - 1
+        monthly_installment = -numpy_financial.pmt(periodic_interest_rate, payment_months, principle)
+        super().__init__(principle, length, periodic_interest_rate, monthly_installment)
+        self.product_fees = product_fees
+
+    @property
+    def segments(self):
+        """(months, annual rate) for each run of months at the same rate."""
+        change_months = np.flatnonzero(np.diff(self.interest_rates)) + 1
+        starts = np.concatenate([[0], change_months])
+        ends = np.concatenate([change_months, [len(self.interest_rates)]])
+        return tuple((int(end - start), float(self.interest_rates[start])) for start, end in zip(starts, ends))
+
+    @property
+    def schedule(self):
+        if self._schedule is None:
+            segment_columns, _ = _segmentedSchedule(float(self._principle), self.length * 12, self.segments)
+            balances, interests, payments = np.concatenate(segment_columns, axis=1)
+            payments[-1] = balances[-1] + interests[-1]
+            self._schedule = PaymentSchedule(balances, interests, payments, np.zeros(len(balances)))
+        return self._schedule
+
+    def total_fees(self, years):
+        return self.total_interest(years) + self.product_fees
+
+    @staticmethod
+    def batch(principles, length, rate_schedules):
+        """
+        A MortgageBatch pricing many rate paths together: rate_schedules is one schedule per mortgage (or a
+        (mortgages x months) array of rates), and each row matches the equivalent VariableRateMortgage.
+        """
+        rate_paths = np.array([ratePath(rate_schedule, length * 12) for rate_schedule in rate_schedules])
+        return MortgageBatch(principles, length, rate_paths[:, 0], interest_rate_paths=rate_paths)
+
+
+@functools.lru_cache(maxsize=1024)
+def _refinanceHistory(property_value, monthly_gross_rental, length, annual_price_change_percentage,
+                      annual_rent_growth, mortgage_searcher, MortgageClass, mortgage_kwargs, products):
+    """
+    (start month, months, mortgage, equity released) for each of the opening `products` of a refinance chain, each a
+    (years, interest rate, ltv_percentage, release_equity) product; mortgage_kwargs are the sorted (name, value) pairs
+    every product's MortgageClass also takes. Keyed by the whole prefix, so chains that share their opening products
+    only size and schedule those once. Products that would start once the term is over are left out.
+    """
+    if products[:-1]:
+        history = _refinanceHistory(property_value, monthly_gross_rental, length, annual_price_change_percentage,
+                                    annual_rent_growth, mortgage_searcher, MortgageClass, mortgage_kwargs,
+                                    products[:-1])
+        start_month, months, mortgage, _ = history[-1]
+        start_month += months
+        if start_month >= length * 12:
+            return history
+        balance = float(mortgage.outstanding_balance(months))
+    else:
+        history, start_month, balance = (), 0, None
+    years, interest_rate, ltv_percentage, release_equity = products[-1]
+    remaining_years = length - start_month // 12
+    # Sized by the lender's rules on today's value and rent, over what is left of the original term.
+    largest = mortgage_searcher(MortgageClass, monthly_gross_rental * (1 + annual_rent_growth) ** (start_month // 12),
+                                property_value * (1 + annual_price_change_percentage) ** (start_month / 12),
+                                ltv_percentage=ltv_percentage, length=remaining_years, interest_rate=interest_rate,
+                                **dict(mortgage_kwargs))
+    if balance is None or release_equity or largest.principle <= balance:
+        mortgage = largest
+    else:
+        mortgage = MortgageClass(principle=balance, length=remaining_years, interest_rate=interest_rate,
+                                 **dict(mortgage_kwargs))
+    released = 0.0 if balance is None else float(mortgage.principle) - balance
+    months = remaining_years * 12 if years is None else min(years * 12, remaining_years * 12)
+    return history + ((start_month, months, mortgage, released),)
+
+
+class RefinanceChain(AbstractMortgage):
+    """
+    A property's borrowing as a chain of products, remortgaging at the end of each fix, e.g.
+    [(2, 0.045), (5, 0.05, 0.75, True), (None, 0.06)] for a two year fix, then a five year fix releasing equity up to
+    75% LTV, then a product for the rest of the term. Each product is (years, interest_rate[, ltv_percentage
+    [, release_equity]]); years=None, or running out of products, holds the last one to the end of the term. A fix
+    that runs past the end of the term is cut short there, and any products after it are ignored.
+
+    Every product is sized by mortgage_searcher (BTLmortgageFactory by default: the rental stress test and the LTV
+    cap) on the property value grown at annual_price_change_percentage and the rent grown at annual_rent_growth,
+    over what is left of the original term. Without release_equity the balance carries over, paid down to whatever
+    the lender will still lend; with it the loan is topped up to the most the lender allows and the difference is
+    paid out. Product fees after the first and equity released land in the payment of the product's first month, so
+    the Payment column is the cash that actually changes hands, while total_fees counts interest and every product
+    fee less equity released. Property's payoff, interest and cash flow queries work unchanged.
+
+    Any other keyword arguments go to MortgageClass for every product, e.g. tax_rate and MortgageClassToDecorate for
+    TaxDeductibleMortgage, whose relief then applies to the interest across the whole chain.
+
+    Products are sized and scheduled through a cache keyed by the chain up to that product, so chains that only
+    differ later on share their history and only compute the divergent tail.
+    """
+    __slots__ = ("products", "product_fees", "_history")
+
+    def __init__(self, property_value, monthly_gross_rental, products, length=25, ltv_percentage=0.75,
+                 annual_price_change_percentage=0.01, annual_rent_growth=0, mortgage_searcher=None,
+                 MortgageClass=RepaymentMortgage, product_fees=1000, **mortgage_kwargs):
+        mortgage_searcher = BTLmortgageFactory if mortgage_searcher is None else mortgage_searcher
+        self.products = tuple((product[0], float(product[1]),
+                               float(product[2]) if len(product) > 2 else ltv_percentage,
+                               bool(product[3]) if len(product) > 3 else False) for product in products)
+        self._history = _refinanceHistory(float(property_value), float(monthly_gross_rental), length,
+                                          float(annual_price_change_percentage), float(annual_rent_growth),
+                                          mortgage_searcher, MortgageClass, tuple(sorted(mortgage_kwargs.items())),
+                                          self.products)
+        first_mortgage = self._history[0][2]
+        # Wrappers such as TaxDeductibleMortgage keep the rate on the mortgage they wrap.
+        super().__init__(first_mortgage.principle, length,
+                         getattr(first_mortgage, "wrapped_mortgage", first_mortgage).periodic_interest_rate,
+                         first_mortgage.monthly_installment)
+        self.product_fees = product_fees
+
+    @property
+    def mortgages(self):
+        """The product mortgages in order, each covering its own months of the chain."""
+        return [mortgage for _, _, mortgage, _ in self._history]
+
+    @property
+    def start_months(self):
+        return np.array([start_month for start_month, _, _, _ in self._history])
+
+    @property
+    def equity_released(self):
+        """Equity released (negative where the loan had to be paid down) at the start of each product."""
+        return np.array([released for _, _, _, released in self._history])
+
+    @property
+    def schedule(self):
+        if self._schedule is None:
+            pieces = [mortgage.schedule.columns[:3, :months] for _, months, mortgage, _ in self._history]
+            # The last product runs on to the end of the term.
+            start_month, months, mortgage, _ = self._history[-1]
+            pieces.append(mortgage.schedule.columns[:3, months:self.length * 12 - start_month])
+            balances, interests, payments = np.concatenate(pieces, axis=1)
+            payments[self.start_months[1:]] += self.product_fees - self.equity_released[1:]
+            self._schedule = PaymentSchedule(balances, interests, payments, np.zeros(len(balances)))
+        return self._schedule
+
+    def _started(self, years):
+        # Which products have begun within each horizon; the first is taken out at purchase.
+        months = np.maximum(np.asarray(years) * 12, 1)
+        return self.start_months < months[..., np.newaxis]
+
+    def outstanding_balance(self, months):
+        principles, interests, payments, _ = self.schedule
+        # Fees and equity released are paid alongside the installment but never touch the balance.
+        adjustments = np.zeros(len(payments))
+        adjustments[self.start_months[1:]] = self.product_fees - self.equity_released[1:]
+        months = np.asarray(months)
+        index = np.clip(months - 1, 0, len(principles) - 1)
+        balance = principles[index] + interests[index] - (payments[index] - adjustments[index])
+        return np.where(months < len(principles), np.where(months <= 0, self.principle, balance), 0)[()]
+
+    def total_interest(self, years):
+        # Every product is the same kind of mortgage, so one that reports less interest than is paid (tax relief)
+        # reports the same share of it throughout.
+        first_mortgage = self._history[0][2]
+        paid_interest = first_mortgage.cumulative_interest[-1]
+        share = first_mortgage.total_interest(self.length) / paid_interest if paid_interest else 1
+        return super().total_interest(years) * share
+
+    def total_principle_paid(self, years):
+        released = np.where(self._started(years), self.equity_released, 0).sum(axis=-1)
+        return (self.principle + released - self.outstanding_balance(np.asarray(years) * 12))[()]
+
+    def total_fees(self, years):
+        started = self._started(years)
+        return (self.total_interest(years) + self.product_fees * started.sum(axis=-1)
+                - np.where(started, self.equity_released, 0).sum(axis=-1))[()]
 
 # print(Mortgage(372000, 25, interest_rate).payment_table)
 # mortgage = Mortgage(75000, 25, interest_rate)
 # print(mortgage.payment_table)
 
 class TaxDeductibleMortgage(Mortgage):
+    __slots__ = ("wrapped_mortgage", "tax_rate")
+
     def __init__(self, tax_rate, MortgageClassToDecorate, *mortgage_class_args, **mortgage_class_kwargs):
         super().__init__()
         self.wrapped_mortgage = MortgageClassToDecorate(*mortgage_class_args, **mortgage_class_kwargs)
         self.tax_rate = tax_rate
 
+    @classmethod
+    def max_principle(cls, monthly_installment, tax_rate, MortgageClassToDecorate, **mortgage_class_kwargs):
+        # Installments are those of the wrapped mortgage.
+        return maxPrinciple(MortgageClassToDecorate, monthly_installment, **mortgage_class_kwargs)
+
+    @property
+    def schedule(self):
+        return self.wrapped_mortgage.schedule
+
     @property
     def payment_table(self):
         return self.wrapped_mortgage.payment_table
 
+    @property
+    def cumulative_interest(self):
+        return self.wrapped_mortgage.cumulative_interest
+
+    @property
+    def cumulative_payments(self):
+        return self.wrapped_mortgage.cumulative_payments
+
+    @property
+    def cumulative_early_repayments(self):
+        return self.wrapped_mortgage.cumulative_early_repayments
+
     @property
     def monthly_installment(self):
         return self.wrapped_mortgage.monthly_installment
@@ -174,15 +770,38 @@ class TaxDeductibleMortgage(Mortgage):
         return self.wrapped_mortgage.total_interest(years) * (1 - self.tax_rate)
 
 class EarlyRepaymentMortgage(Mortgage):
+    __slots__ = ("wrapped_mortgage", "tax_rate")
+
     def __init__(self, tax_rate, MortgageClassToDecorate, *mortgage_class_args, **mortgage_class_kwargs):
         super().__init__()
         self.wrapped_mortgage = MortgageClassToDecorate(*mortgage_class_args, **mortgage_class_kwargs)
         self.tax_rate = tax_rate
 
+    @classmethod
+    def max_principle(cls, monthly_installment, tax_rate, MortgageClassToDecorate, **mortgage_class_kwargs):
+        # Installments are those of the wrapped mortgage.
+        return maxPrinciple(MortgageClassToDecorate, monthly_installment, **mortgage_class_kwargs)
+
+    @property
+    def schedule(self):
+        return self.wrapped_mortgage.schedule
+
     @property
     def payment_table(self):
         return self.wrapped_mortgage.payment_table
 
+    @property
+    def cumulative_interest(self):
+        return self.wrapped_mortgage.cumulative_interest
+
+    @property
+    def cumulative_payments(self):
+        return self.wrapped_mortgage.cumulative_payments
+
+    @property
+    def cumulative_early_repayments(self):
+        return self.wrapped_mortgage.cumulative_early_repayments
+
     @property
     def monthly_installment(self):
         return self.wrapped_mortgage.monthly_installment
@@ -199,11 +818,190 @@ class EarlyRepaymentMortgage(Mortgage):
         return self.wrapped_mortgage.total_interest(years)
 
 
+class MortgageBatch:
+    """
+    Many RepaymentMortgage/InterestOnlyMortgage schedules held as (n_mortgages x months) arrays, one per payment table
+    column. Mortgages shorter than the longest term are padded with zeros after their final payment.
+    The month by month recurrence is stepped across every mortgage at once, in the same order of operations as the
+    equivalent single mortgage object, and totals are lookups into running totals of each row as with
+    Mortgage.cumulative_interest. Rates and installments come from NumPy's array power, which can differ from the
+    scalar power a single mortgage uses in the last bit, so rows agree with single mortgages to floating point
+    tolerance, though usually exactly.
+    interest_rate_paths optionally gives an annual rate per mortgage per month (or one shared path). Whenever a
+    mortgage's rate changes its installment is recalculated on the outstanding balance over the remaining term.
+    """
+
+    def __init__(self, principles, lengths, interest_rates, early_repayment_plans=None, interest_only=False,
+                 interest_rate_paths=None):
+        principles, lengths, interest_rates, interest_only = np.broadcast_arrays(
+            np.asarray(principles, dtype=float), np.asarray(lengths, dtype=int), np.asarray(interest_rates, dtype=float),
+            np.asarray(interest_only, dtype=bool))
+        self.principles = principles.ravel().copy()
+        self.lengths = lengths.ravel().copy()
+        self.interest_rates = interest_rates.ravel().copy()
+        self.interest_only = interest_only.ravel().copy()
+        mortgage_count = len(self.principles)
+        self.payment_months = self.lengths * 12
+        months = int(self.payment_months.max()) if mortgage_count else 0
+
+        self.periodic_interest_rates = self._periodic_interest_rates(self.interest_rates, self.interest_only)
+        self.monthly_installments = self._installments(self.principles, self.periodic_interest_rates,
+                                                       self.payment_months, self.interest_only)
+        if interest_rate_paths is not None:
+            interest_rate_paths = np.broadcast_to(np.asarray(interest_rate_paths, dtype=float),
+                                                  (mortgage_count, np.shape(interest_rate_paths)[-1]))
+            if interest_rate_paths.shape[1] < months:
+                # The last rate on each path holds for the rest of the term.
+                interest_rate_paths = np.pad(interest_rate_paths, ((0, 0), (0, months - interest_rate_paths.shape[1])),
+                                             mode="edge")
+
+        early_repayments_by_month = self._group_early_repayments(early_repayment_plans, mortgage_count)
+
+        # Column-major so that each month's slice across the batch is contiguous.
+        self.balances = np.empty((mortgage_count, months), order="F")
+        self.interest = np.empty((mortgage_count, months), order="F")
+        self.payments = np.empty((mortgage_count, months), order="F")
+        self.early_repayments = np.zeros((mortgage_count, months), order="F")
+        self._cumulative = None
+        if months == 0:
+            return
+
+        last_month_index = self.payment_months - 1
+        interest_rates = self.interest_rates
+        periodic_interest_rates = self.periodic_interest_rates
+        monthly_installments = self.monthly_installments
+        balance = self.principles.copy()
+        interest = periodic_interest_rates * balance
+        payment = monthly_installments.copy()
+        for i in range(months):
+            if i > 0:
+                balance = balance + interest - payment
+            if interest_rate_paths is not None:
+                remaining_months = self.payment_months - i
+                reset = (interest_rate_paths[:, i] != interest_rates) & (remaining_months > 0)
+                if reset.any():
+                    interest_rates = np.where(reset, interest_rate_paths[:, i], interest_rates)
+                    periodic_interest_rates = np.where(
+                        reset, self._periodic_interest_rates(interest_rates, self.interest_only),
+                        periodic_interest_rates)
+                    monthly_installments = np.where(
+                        reset, self._installments(balance, periodic_interest_rates, np.maximum(remaining_months, 1),
+                                                  self.interest_only),
+                        monthly_installments)
+                    if i == 0:
+                        payment = monthly_installments.copy()
+            if i > 0 or interest_rate_paths is not None:
+                interest = balance * periodic_interest_rates
+            if i > 0:
+                amount_due = balance + interest
+                if i in early_repayments_by_month:
+                    indices, percentages = early_repayments_by_month[i]
+                    early_repayment = self.early_repayments[:, i]
+                    early_repayment[indices] = percentages * balance[indices]
+                    payment = np.minimum(monthly_installments + early_repayment, amount_due)
+                else:
+                    payment = np.minimum(monthly_installments, amount_due)
+            final_payment = last_month_index == i
+            if final_payment.any():
+                payment = np.where(final_payment, balance + interest, payment)
+            self.balances[:, i] = balance
+            self.interest[:, i] = interest
+            self.payments[:, i] = payment
+
+    @staticmethod
+    def _periodic_interest_rates(interest_rates, interest_only):
+        # Same conventions as InterestOnlyMortgage and RepaymentMortgage.
+        return np.where(interest_only, interest_rates / 12, (1 + interest_rates) ** (1 / 12) - 1)
+
+    @staticmethod
+    def _installments(balances, periodic_interest_rates, remaining_months, interest_only):
+        import numpy_financial
+
+        return np.where(interest_only, balances * periodic_interest_rates,
+                        -numpy_financial.pmt(periodic_interest_rates, remaining_months, balances))
+
+    def _group_early_repayments(self, early_repayment_plans, mortgage_count):
+        # {month index: (mortgage indices, percentages)}, so each month only touches the mortgages repaying in it.
+        if early_repayment_plans is None:
+            return {}
+        if len(early_repayment_plans) != mortgage_count:
+            raise ValueError(f"Expected {mortgage_count} early repayment plans, got {len(early_repayment_plans)}")
+        grouped = {}
+        for mortgage_index, plan in enumerate(early_repayment_plans):
+            for month, percentage in (plan or {}).items():
+                # Month 1 and months past the end of the term never trigger, as with AbstractMortgage.
+                if 1 < month <= self.payment_months[mortgage_index]:
+                    grouped.setdefault(month - 1, ([], []))
+                    grouped[month - 1][0].append(mortgage_index)
+                    grouped[month - 1][1].append(percentage)
+        return {month_index: (np.array(indices), np.array(percentages, dtype=float))
+                for month_index, (indices, percentages) in grouped.items()}
+
+    def __len__(self):
+        return len(self.principles)
+
+    @property
+    def cumulative(self):
+        """Totals of the first k months (k = 0..months) of the interest and payment columns, one row per mortgage."""
+        if self._cumulative is None:
+            cumulative = np.zeros((2, len(self), self.interest.shape[1] + 1))
+            np.cumsum(self.interest, axis=1, out=cumulative[0, :, 1:])
+            np.cumsum(self.payments, axis=1, out=cumulative[1, :, 1:])
+            cumulative.setflags(write=False)
+            self._cumulative = tuple(cumulative)
+        return self._cumulative
+
+    @staticmethod
+    def _column_total(cumulative, years):
+        # years may be an array of horizons, giving one column per horizon.
+        return cumulative[:, np.clip(np.asarray(years) * 12, 0, cumulative.shape[1] - 1)]
+
+    def total_interest(self, years):
+        return self._column_total(self.cumulative[0], years)
+
+    def total_payments(self, years):
+        return self._column_total(self.cumulative[1], years)
+
+    def total_principle_paid(self, years):
+        return self.total_payments(years) - self.total_interest(years)
+
+    def total_fees(self, years):
+        return self.total_interest(years) + np.where(self.interest_only, 2000, 1000)
+
+    def balance_at(self, month):
+        """Outstanding balance after `month` payments, the amount Property.sell_expenses pays off on sale."""
+        if month <= 0:
+            return self.principles.copy()
+        if month > self.balances.shape[1]:
+            return np.zeros(len(self))
+        i = month - 1
+        return np.where(month < self.payment_months,
+                        self.balances[:, i] + self.interest[:, i] - self.payments[:, i], 0.0)
+
+    def payment_table(self, index):
+        """The single mortgage payment table for one row of the batch."""
+        import pandas as pd
+
+        months = self.payment_months[index]
+        return pd.DataFrame({"Principle": self.balances[index, :months], "Interest": self.interest[index, :months],
+                             "Payment": self.payments[index, :months],
+                             "Early Repayment": self.early_repayments[index, :months]})
+
+
 # print(TaxDeductibleMortgage(372000, 25, interest_rate, 0.2).payment_table)
 # print(TaxDeductibleMortgage(372000, 25, interest_rate, 0.2).total_interest)
 
 # Property value = net cash inflows each year (after interest only mortgage/repayment mortgage + fees, taking into account tax reductions), over x years +projected vlaue - fees and taxes of buying and sale - original price.)
 
+def annualisedReturn(total_percentage, years):
+    """Year on year return that compounds to total_percentage over `years`, mirrored for losses."""
+    # TODO deal with negative total percentages in a more robust way
+    total_percentage = np.asarray(total_percentage)
+    negative = total_percentage < 0
+    result = (np.where(negative, -total_percentage, total_percentage) + 1) ** (1 / np.asarray(years)) - 1
+    return np.where(negative, -result, result)[()]
+
+
 class Investment:
     # def initial_equity_cost():
     # def gross_buy_price():
@@ -211,6 +1009,7 @@ class Investment:
     # def calculate_profits():
     # def initial_equity():
     # Handle capital appreciation here.
+    # years and annual_price_change_percentage may be broadcastable arrays; see nominal_return_surface.
     def nominal_return_on_investment(self, years, annual_price_change_percentage, annual_inflation_percentage):
         buy_fees = self.buy_expenses
         sell_price = self.buy_price * (1 + annual_price_change_percentage) ** years
@@ -232,30 +1031,89 @@ class Investment:
                                                annual_inflation_percentage):
         total_percentage = self.percentage_return_on_investment(years, annual_price_change_percentage,
                                                                 annual_inflation_percentage)
-        # TODO deal with negative total percentages in a more robust way
-        if total_percentage < 0:
-            total_percentage *= -1
-            result = (total_percentage + 1) ** (1 / years) - 1
-            result *= -1
-            return result
-        return (total_percentage + 1) ** (1 / years) - 1
-
-
-def calculateCapitalGains(is_property, price_gain):
-    capital_gains_allowance = 12300
-    if (price_gain <= capital_gains_allowance):
-        return 0
-    else:
-        if is_property:
-            capital_gains_tax_rate = 0.28
-        else:
-            capital_gains_tax_rate = 0.20
-        return (price_gain - capital_gains_allowance) * capital_gains_tax_rate
+        return annualisedReturn(total_percentage, years)
+
+    def profit_in_year(self, year):
+        """calculate_profits for year `year` alone (year 1 is the first year); year may be an array."""
+        year = np.asarray(year)
+        previous_profits = np.where(year > 1, self.calculate_profits(np.maximum(year - 1, 0)), 0)
+        return (self.calculate_profits(year) - previous_profits)[()]
+
+    # Return surfaces: one row per annual_price_change_percentage, one column per horizon in years, evaluated in a
+    # single broadcast pass rather than one call per (growth, year) pair.
+    @staticmethod
+    def _surface_axes(years, annual_price_change_percentages):
+        return np.asarray(years)[np.newaxis, :], np.asarray(annual_price_change_percentages, dtype=float)[:, np.newaxis]
+
+    def nominal_return_surface(self, years, annual_price_change_percentages, annual_inflation_percentage=0):
+        years, annual_price_change_percentages = self._surface_axes(years, annual_price_change_percentages)
+        return self.nominal_return_on_investment(years, annual_price_change_percentages, annual_inflation_percentage)
+
+    def percentage_return_surface(self, years, annual_price_change_percentages, annual_inflation_percentage=0):
+        years, annual_price_change_percentages = self._surface_axes(years, annual_price_change_percentages)
+        return self.percentage_return_on_investment(years, annual_price_change_percentages,
+                                                    annual_inflation_percentage)
+
+    def annual_percentage_return_surface(self, years, annual_price_change_percentages, annual_inflation_percentage=0):
+        years, annual_price_change_percentages = self._surface_axes(years, annual_price_change_percentages)
+        return self.annual_percentage_return_on_investment(years, annual_price_change_percentages,
+                                                           annual_inflation_percentage)
+
+
+def calculateCapitalGains(is_property, price_gain, tax_year=DEFAULT_CAPITAL_GAINS_TAX_YEAR):
+    return CAPITAL_GAINS_SCHEDULES[tax_year].tax(is_property, price_gain)
+
+
+class PropertyLedger:
+    """
+    A property's month by month cash, months 0..years*12, held as one read-only (columns x months) float64 array with
+    running totals alongside, so totals to date and per-year figures are lookups. Month 0 is the purchase.
+    """
+    __slots__ = ("columns", "cumulative")
+    COLUMNS = ("Gross Rent", "Agency Fees", "Rental Tax", "Charges", "Mortgage Payments")
+
+    def __init__(self, gross_rent, agency_fees, rental_tax, charges, mortgage_payments):
+        self.columns = np.array([gross_rent, agency_fees, rental_tax, charges, mortgage_payments], dtype=float)
+        self.cumulative = np.cumsum(self.columns, axis=1)
+        self.columns.setflags(write=False)
+        self.cumulative.setflags(write=False)
+
+    @property
+    def years(self):
+        return (self.columns.shape[1] - 1) // 12
+
+    def _column(self, column):
+        return self.COLUMNS.index(column)
+
+    def total(self, column, years):
+        """Total of a column over the first `years` years; years may be an array."""
+        return self.cumulative[self._column(column), np.asarray(years) * 12][()]
+
+    def in_year(self, column, year):
+        """Total of a column during year `year` alone (year 1 is the first year)."""
+        year = np.asarray(year)
+        return (self.total(column, year) - self.total(column, np.maximum(year - 1, 0)))[()]
+
+    def net_rent(self, years):
+        return self.total("Gross Rent", years) - self.total("Agency Fees", years) - self.total("Rental Tax", years)
+
+    def net_cash_flows(self):
+        """Rent after fees and tax, less charges and mortgage payments, month by month."""
+        gross_rent, agency_fees, rental_tax, charges, mortgage_payments = self.columns
+        return gross_rent - agency_fees - rental_tax - charges - mortgage_payments
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.columns.T, columns=list(self.COLUMNS), copy=False)
 
 
 class Property(Investment):
+    # The ledger covers at least this many years, more if a longer horizon is asked for.
+    LEDGER_YEARS = 50
+
     def __init__(self, second_property, property_value, mortgage, monthly_gross_rental, rental_tax,
-                 months_occupied_out_of_12, agency_percentage):
+                 months_occupied_out_of_12, agency_percentage, annual_rent_growth=0, void_months=None):
         SOLICITOR_FEES = 3776
         self._buy_fees = calculateSDLT(second_property, property_value) + SOLICITOR_FEES
         self.property_value = property_value
@@ -264,6 +1122,11 @@ class Property(Investment):
         self.agency_percentage = agency_percentage
         self.rental_tax = rental_tax
         self.mortgage = mortgage
+        # Rent rises by annual_rent_growth at the start of each year. void_months lists calendar months (1-12) empty
+        # every year; otherwise each month is let for months_occupied_out_of_12 / 12 of the time.
+        self.annual_rent_growth = annual_rent_growth
+        self.void_months = void_months
+        self._ledger = None
 
     @property
     def buy_expenses(self):
@@ -274,44 +1137,146 @@ class Property(Investment):
         return self.property_value
 
     def calculate_profits(self, years):
-        return self.monthly_gross_rental * self.months_occupied_out_of_12 * years * (
-                1 - self.agency_percentage - self.rental_tax) - self.mortgage.total_fees(years)
+        if self.annual_rent_growth == 0 and self.void_months is None:
+            return self.monthly_gross_rental * self.months_occupied_out_of_12 * years * (
+                    1 - self.agency_percentage - self.rental_tax) - self.mortgage.total_fees(years)
+        return self.ledger(np.max(years)).net_rent(years) - self.mortgage.total_fees(years)
 
     @property
     def initial_equity_cost(self):
         return self.property_value - self.mortgage.principle
 
     def sell_expenses(self, sell_price, years):
-        if len(self.mortgage.payment_table.index) > years * 12:
-            mortgage_row = self.mortgage.payment_table.loc[years * 12 - 1]
-            mortgage_to_payoff = mortgage_row["Principle"] + mortgage_row["Interest"] - mortgage_row["Payment"]
-        else:
-            mortgage_to_payoff = 0
+        mortgage_to_payoff = self.mortgage.outstanding_balance(np.asarray(years) * 12)
         solicitor_fees = 4000
         capital_gains_tax = calculateCapitalGains(True, sell_price - self.buy_price)
         return capital_gains_tax + solicitor_fees + mortgage_to_payoff
 
+    def _monthly_charges(self, months):
+        return np.zeros(months)
+
+    def ledger(self, years=0):
+        """The PropertyLedger, built on first use and rebuilt (at least twice as long) only for a longer horizon."""
+        if self._ledger is None or self._ledger.years < years:
+            self._ledger = self._build_ledger(max(int(years), self.LEDGER_YEARS,
+                                                  2 * self._ledger.years if self._ledger is not None else 0))
+        return self._ledger
+
+    def _build_ledger(self, years):
+        months = years * 12
+        year_index = np.arange(months) // 12
+        if self.void_months is None:
+            occupancy = np.full(months, self.months_occupied_out_of_12 / 12)
+        else:
+            occupancy = np.where(np.isin(np.arange(months) % 12 + 1, list(self.void_months)), 0.0, 1.0)
+        gross_rent = np.zeros(months + 1)
+        gross_rent[1:] = self.monthly_gross_rental * (1 + self.annual_rent_growth) ** year_index * occupancy
+        charges = np.zeros(months + 1)
+        charges[1:] = self._monthly_charges(months)
+        mortgage_payments = np.zeros(months + 1)
+        mortgage_payments[1:] = self._monthly_mortgage_costs(years)
+        return PropertyLedger(gross_rent, gross_rent * self.agency_percentage, gross_rent * self.rental_tax, charges,
+                              mortgage_payments)
+
+    def _monthly_mortgage_costs(self, years):
+        months = years * 12
+        _, interests, payments, _ = self.mortgage.schedule
+        paid_months = min(months, len(payments))
+        costs = np.zeros(months)
+        costs[:paid_months] = payments[:paid_months]
+        # Wrappers such as TaxDeductibleMortgage report less interest than is paid; the difference comes back as relief.
+        paid_interest = self.mortgage.cumulative_interest[paid_months]
+        if paid_interest:
+            relief = 1 - self.mortgage.total_interest(years) / paid_interest
+            costs[:paid_months] -= interests[:paid_months] * relief
+        return costs
+
+    def monthly_cash_flows(self, years, annual_price_change_percentage):
+        """
+        Money into (+) and out of (-) the investor's pocket for months 0..years*12: deposit and fees up front, net rent
+        less mortgage payments each month, then the sale. Unlike nominal_return_on_investment, principal repaid is
+        money spent (it comes back through a smaller payoff at sale).
+        """
+        years = int(years)
+        cash_flows = self.ledger(years).net_cash_flows()[:years * 12 + 1].copy()
+        cash_flows[0] = -(self.initial_equity_cost + self.buy_expenses + self.mortgage.total_fees(0))
+        sell_price = self.buy_price * (1 + annual_price_change_percentage) ** years
+        cash_flows[-1] += sell_price - self.sell_expenses(sell_price, years)
+        return cash_flows
+
 
 class LeaseholdProperty(Property):
     def __init__(self, second_property, property_value, mortgage, monthly_gross_rental, rental_tax,
                  months_occupied_out_of_12, agency_percentage, annual_service_charge, annual_ground_rent,
-                 will_you_live_in_this=True):
+                 will_you_live_in_this=True, annual_rent_growth=0, void_months=None, annual_charge_indexation=0):
         super().__init__(second_property, property_value, mortgage, monthly_gross_rental, rental_tax,
-                         months_occupied_out_of_12, agency_percentage)
+                         months_occupied_out_of_12, agency_percentage, annual_rent_growth, void_months)
         self.annual_service_charge = annual_service_charge
         self.annual_ground_rent = annual_ground_rent
         self.will_you_live_in_this = will_you_live_in_this
+        # Charges rise by this at the start of each year.
+        self.annual_charge_indexation = annual_charge_indexation
 
     def calculate_profits(self, years):
-        if self.will_you_live_in_this:
-            return super().calculate_profits(years) - (self.annual_service_charge + self.annual_ground_rent)
-        else:
-            return super().calculate_profits(years) - (self.annual_service_charge + self.annual_ground_rent) * (
-                        1 - self.rental_tax)
+        # Service charge and ground rent are paid in every year held, totalled from the ledger's Charges column.
+        years = np.asarray(years)
+        total_charges = np.zeros(np.max(years) * 12 + 1)
+        total_charges[1:] = np.cumsum(self._monthly_charges(np.max(years) * 12))
+        return super().calculate_profits(years) - total_charges[years * 12][()]
+
+    def _monthly_charges(self, months):
+        # Charges are paid every year of ownership, spread evenly over the months.
+        monthly_charges = (self.annual_service_charge + self.annual_ground_rent) / 12 * (
+                1 + self.annual_charge_indexation) ** (np.arange(months) // 12)
+        if not self.will_you_live_in_this:
+            monthly_charges *= 1 - self.rental_tax
+        return monthly_charges
+
+
+def equityFutureValue(stock_value, earnings_yield, years, yearly_topups=(), monthly_contribution=0,
+                      annual_platform_fee=0):
+    """
+    Value of a holding after each horizon in `years`, growing by its earnings yield (1 / P/E) a year net of a platform
+    fee charged on the value. yearly_topups[k] is paid in at the end of year k + 1 and monthly_contribution at the end
+    of every month, both compounding from then on.
+
+    stock_value, earnings_yield, monthly_contribution, annual_platform_fee and the leading axes of yearly_topups
+    broadcast together, e.g. a column of P/E assumptions or one contribution schedule per row; the result has that
+    batch shape followed by the shape of years.
+    """
+    years = np.asarray(years)
+    horizon = int(years.max(initial=0))
+    topups = np.asarray(yearly_topups, dtype=float)
+    batch = np.broadcast_shapes(np.shape(stock_value), np.shape(earnings_yield), np.shape(monthly_contribution),
+                                np.shape(annual_platform_fee), topups.shape[:-1])
+    annual_growth = (1 + np.asarray(earnings_yield, dtype=float)) * (1 - np.asarray(annual_platform_fee, dtype=float))
+    annual_growth = np.broadcast_to(annual_growth, batch)[..., np.newaxis]
+    growth = np.broadcast_to(annual_growth, batch + (horizon,))
+    # Multiplying the buy price through year by year, as a loop would.
+    values = np.cumprod(np.concatenate([np.broadcast_to(np.asarray(stock_value, dtype=float), batch)[..., np.newaxis],
+                                        growth], axis=-1), axis=-1)
+    if topups.size:
+        # Each top-up grows for the years after it is paid: a convolution of the schedule with the growth powers,
+        # taken as the growth to date times the running total of top-ups discounted back to the purchase.
+        paid = np.zeros(batch + (horizon + 1,))
+        paid[..., 1:min(topups.shape[-1], horizon) + 1] = topups[..., :horizon]
+        growth_to_date = np.cumprod(np.concatenate([np.ones(batch + (1,)), growth], axis=-1), axis=-1)
+        values = values + growth_to_date * np.cumsum(paid / growth_to_date, axis=-1)
+    monthly_contribution = np.asarray(monthly_contribution, dtype=float)
+    if monthly_contribution.any():
+        # Geometric series of contributions compounding monthly at the same annual rate.
+        elapsed_years = np.arange(horizon + 1)
+        monthly_growth = annual_growth ** (1 / 12)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            contributed = np.where(monthly_growth == 1, 12 * elapsed_years,
+                                   (annual_growth ** elapsed_years - 1) / (monthly_growth - 1))
+        values = values + monthly_contribution[..., np.newaxis] * contributed
+    return values[..., np.maximum(years, 0)]
 
 
 class HLStock(Investment):
-    def __init__(self, stock_value, price_to_earnings, yearly_topups=[]):
+    def __init__(self, stock_value, price_to_earnings, yearly_topups=[], monthly_contribution=0,
+                 annual_platform_fee=0):
         self.ESTIMATED_FX_SPREAD = 0.00259669736
         self.ESTIMATED_FX_CHARGE = 0.00998212157
         self.ESTIMATED_BUY_COMMISSION = 11.95
@@ -321,6 +1286,8 @@ class HLStock(Investment):
         self.stock_value = stock_value
         self.price_to_earnings = price_to_earnings
         self.yearly_topups = yearly_topups
+        self.monthly_contribution = monthly_contribution
+        self.annual_platform_fee = annual_platform_fee
 
     @property
     def buy_expenses(self):
@@ -331,18 +1298,9 @@ class HLStock(Investment):
         return self.stock_value
 
     def calculate_profits(self, years):
-        future_value = self.buy_price
-        for year in range(1, years + 1):
-            #print(year-1)
-            future_value = future_value * (1 + (1.0 / self.price_to_earnings))
-            if len(self.yearly_topups) >= year:
-                #print(future_value)
-                #print(self.yearly_topups[year-1])
-                future_value += self.yearly_topups[year-1]
-                #print(future_value)
-                #print()
-        future_value -= self.buy_price
-        return future_value
+        return (equityFutureValue(self.buy_price, 1.0 / np.asarray(self.price_to_earnings, dtype=float), years,
+                                  self.yearly_topups, self.monthly_contribution, self.annual_platform_fee)
+                - self.buy_price)[()]
 
     @property
     def initial_equity_cost(self):
@@ -352,35 +1310,140 @@ class HLStock(Investment):
         # TODO consider CGT, it seems negligible because the gain is so avoidable...
         return (self.ESTIMATED_FX_CHARGE) * self.stock_value + self.ESTIMATED_SELL_COMMISSION
 
+    def monthly_cash_flows(self, years, annual_price_change_percentage):
+        """Purchase up front, top-ups and contributions as they are paid in, then the sale; see Property.monthly_cash_flows.
+        """
+        years = int(years)
+        cash_flows = np.zeros(years * 12 + 1)
+        cash_flows[0] = -(self.initial_equity_cost + self.buy_expenses)
+        cash_flows[1:] -= self.monthly_contribution
+        for year, topup in enumerate(self.yearly_topups[:years], start=1):
+            cash_flows[year * 12] -= topup
+        sell_price = self.buy_price * (1 + annual_price_change_percentage) ** years
+        cash_flows[-1] += sell_price - self.sell_expenses(sell_price, years) + self.calculate_profits(years)
+        return cash_flows
+
+
+def stockBenchmarkReturns(stock_value, price_to_earnings, years, annual_price_change_percentage=0, yearly_topups=(),
+                          monthly_contribution=0, annual_platform_fee=0):
+    """
+    HLStock nominal_return_on_investment for a range of stock benchmarks in one call: one row per entry of
+    price_to_earnings (and of any other per-benchmark argument), one column per horizon in years.
+    """
+    years = np.atleast_1d(np.asarray(years))
+    benchmark = HLStock(stock_value, 1)
+    profits = np.atleast_2d(equityFutureValue(stock_value, 1.0 / np.asarray(price_to_earnings, dtype=float), years,
+                                              yearly_topups, monthly_contribution, annual_platform_fee)) - stock_value
+    sell_price = stock_value * (1 + annual_price_change_percentage) ** years
+    return (sell_price - benchmark.sell_expenses(sell_price, years) - benchmark.buy_expenses + profits
+            - benchmark.initial_equity_cost)
+
+
+# HSBC, Mojo, Skipton
+# BENCHMARK_INTEREST_RATE = 0.055
+# Metro
+BENCHMARK_INTEREST_RATE = 0.05
+# HSBC, Mojo, Skipton
+# BTL_RENTAL_COVER = 1.45
+# Metro
+BTL_RENTAL_COVER = 1.4
+
+
+def _solveMaxPrinciple(mortgageClass, monthly_installment, smallest_principle, largest_principle, **kwargs):
+    # Root-finding fallback for mortgage classes without a closed-form max_principle. Mortgages build their schedule
+    # lazily, so each evaluation only computes monthly_installment.
+    def excess_installment(principle):
+        instrumentation.count("_solveMaxPrinciple evaluations")
+        return mortgageClass(principle=principle, **kwargs).monthly_installment - monthly_installment
+
+    low, high = smallest_principle, largest_principle
+    low_excess, high_excess = excess_installment(low), excess_installment(high)
+    if high_excess <= 0:
+        return np.inf
+    if low_excess > 0:
+        return -np.inf
+    # Illinois variant of regula falsi; installments are close to linear in the principal so this converges quickly.
+    for _ in range(100):
+        principle = high - high_excess * (high - low) / (high_excess - low_excess)
+        excess = excess_installment(principle)
+        if excess == 0 or high - low < 1e-6:
+            return principle
+        if excess < 0:
+            low, low_excess = principle, excess
+            high_excess /= 2
+        else:
+            high, high_excess = principle, excess
+            low_excess /= 2
+    return low
+
+
+def maxPrinciple(mortgageClass, monthly_installment, **kwargs):
+    """
+    Largest principal whose monthly_installment does not exceed `monthly_installment`, found by inverting the annuity
+    formula when the class provides max_principle, otherwise by root finding on the installment.
+    """
+    if hasattr(mortgageClass, "max_principle"):
+        return mortgageClass.max_principle(monthly_installment, **kwargs)
+    installments = np.asarray(monthly_installment, dtype=float)
+    # Bracket well beyond any sensible loan so the root finder always has a sign change.
+    solved = [_solveMaxPrinciple(mortgageClass, installment, 0, installment * 12 * 1000, **kwargs)
+              for installment in installments.ravel()]
+    return np.reshape(solved, installments.shape)[()]
+
+
+def _bisectionPrinciple(smallest_principle, largest_principle, max_principle):
+    # Walks the same midpoints the original £1 bisection over mortgage objects visited, deciding each step against the
+    # solved maximum instead of building a mortgage. Forecasts therefore keep the principal they have always been
+    # quoted with, and the search also stops when a midpoint lands exactly on the maximum.
+    if np.ndim(smallest_principle) == np.ndim(largest_principle) == np.ndim(max_principle) == 0:
+        # Plain floats are far quicker than 0-d arrays for the single mortgage the factories ask for.
+        principle = min(largest_principle, max_principle)
+        steps = 0
+        while smallest_principle < largest_principle:
+            steps += 1
+            principle = (largest_principle + smallest_principle) / 2
+            if principle > max_principle:
+                largest_principle = principle - 1
+            elif principle < max_principle:
+                smallest_principle = principle + 1
+            else:
+                break
+        instrumentation.count("_bisectionPrinciple steps", steps)
+        return principle
+    smallest_principle, largest_principle, max_principle = np.broadcast_arrays(
+        np.asarray(smallest_principle, dtype=float), np.asarray(largest_principle, dtype=float),
+        np.asarray(max_principle, dtype=float))
+    smallest_principle = smallest_principle.copy()
+    largest_principle = largest_principle.copy()
+    principle = np.minimum(largest_principle, max_principle)
+    searching = smallest_principle < largest_principle
+    while searching.any():
+        instrumentation.count("_bisectionPrinciple steps", int(searching.sum()))
+        principle_to_check = (largest_principle + smallest_principle) / 2
+        principle = np.where(searching, principle_to_check, principle)
+        too_large = searching & (principle_to_check > max_principle)
+        too_small = searching & (principle_to_check < max_principle)
+        exact = searching & ~too_large & ~too_small
+        largest_principle = np.where(too_large, principle_to_check - 1, largest_principle)
+        smallest_principle = np.where(too_small, principle_to_check + 1, smallest_principle)
+        largest_principle = np.where(exact, smallest_principle, largest_principle)
+        searching = smallest_principle < largest_principle
+    return principle[()]
+
 
 def _mortgageFactory(mortgageClass, monthly_gross_rental_floor, smallest_principle, largest_principle, **kwargs):
-    # HSBC, Mojo, Skipton
-    # BENCHMARK_INTEREST_RATE = 0.055
-    # Metro
-    BENCHMARK_INTEREST_RATE = 0.05
     original_interest_rate = kwargs["interest_rate"]
     kwargs["interest_rate"] = BENCHMARK_INTEREST_RATE
-    while smallest_principle < largest_principle:
-        # print(f"smallest_principle {smallest_principle}, largest_principle {largest_principle}")
-        principle_to_check = (largest_principle + smallest_principle) / 2
-        kwargs["principle"] = principle_to_check
-        mortgage_to_check = mortgageClass(**kwargs)
-        monthly_installment = mortgage_to_check.monthly_installment
-        # print(f"monthly_gross_rental_floor {monthly_gross_rental_floor}, monthly_installment {monthly_installment}")
-        if monthly_gross_rental_floor < monthly_installment:
-            largest_principle = principle_to_check - 1
-        elif monthly_gross_rental_floor > monthly_installment:
-            smallest_principle = principle_to_check + 1
+    # The largest principal whose stress-tested installment stays within the rental floor.
+    max_principle = maxPrinciple(mortgageClass, monthly_gross_rental_floor, **kwargs)
+    kwargs["principle"] = float(_bisectionPrinciple(smallest_principle, largest_principle, max_principle))
     kwargs["interest_rate"] = original_interest_rate
     max_mortgage_that_passes_checks = mortgageClass(**kwargs)
     return max_mortgage_that_passes_checks
 
 
 def BTLmortgageFactory(MortgageClass, monthly_gross_rental, property_price, ltv_percentage, **kwargs):
-    # HSBC, Mojo, Skipton
-    # monthly_gross_rental_floor = monthly_gross_rental / 1.45
-    # Metro
-    monthly_gross_rental_floor = monthly_gross_rental / 1.4
+    monthly_gross_rental_floor = monthly_gross_rental / BTL_RENTAL_COVER
 
     return _mortgageFactory(MortgageClass, monthly_gross_rental_floor, 0, property_price * ltv_percentage,
                             **kwargs)
@@ -394,7 +1457,16 @@ def mortgageFactory(MortgageClass, monthly_gross_rental, property_price, ltv_per
                             **kwargs)
 
 
-interest_rate = 0.017
+def BTLmaxPrinciple(MortgageClass, monthly_gross_rental, property_price, ltv_percentage, **kwargs):
+    """
+    The principal BTLmortgageFactory would lend, for arrays of rents and property prices at once.
+    Pass the result to MortgageBatch to build the schedules.
+    """
+    kwargs["interest_rate"] = BENCHMARK_INTEREST_RATE
+    monthly_gross_rental_floor = np.asarray(monthly_gross_rental, dtype=float) / BTL_RENTAL_COVER
+    max_principle = maxPrinciple(MortgageClass, monthly_gross_rental_floor, **kwargs)
+    return _bisectionPrinciple(0, np.asarray(property_price, dtype=float) * ltv_percentage, max_principle)
+
 
 
 # print(InterestOnlyMortgage(75000, 25, interest_rate).payment_table)
@@ -442,170 +1514,17 @@ def generateLiveInLandlordPropertyForecast(is_second_property, principle, ltv_pe
 # TODO mortgatefactory shoudl have an ltv limit.
 # TODO taxpayer model
 
+
+def __getattr__(name):
+    # The report layer needs pandas and tabulate, so it is only imported when asked for.
+    if name == "generateHeaderTableAndGraphSource":
+        import report
+
+        return report.generateHeaderTableAndGraphSource
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
-    ltv_percentage = 0.75
-    interest_rate = 0.0259
-    # interest_rate = 0.05
-    # interest_rate = 0.0146
-    asset_dictionary = {}
-
-    # asset_dictionary["BRK.B 21 P/E"] = HLStock(250000, 21.73)
-
-    #     asset_dictionary["BRK.B 15 P/E"] = HLStock(150000, 15)
-
-    #     asset_dictionary["BRK.B 10 P/E"] = HLStock(150000, 10)
-
-    #     # asset_dictionary["BRK.B 7 P/E"] = HLStock(200000, 7)
-
-    #     property_forecast = generatePropertyForecast(True, 100000, ltv_percentage=ltv_percentage, monthly_gross_rental=750, rental_tax=0.45,
-    #                                                  months_occupied_out_of_12=10,
-    #                                                  agency_percentage=.2, MortgageClass=TaxDeductibleMortgage,
-    #                                                  MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
-    #                                                  interest_rate=0.03)
-    #     #asset_dictionary["High Yield Property"] = property_forecast
-
-    #     property_forecast = generatePropertyForecast(True, 220000, ltv_percentage=ltv_percentage, monthly_gross_rental=800, rental_tax=0.45,
-    #                                                  months_occupied_out_of_12=10,
-    #                                                  agency_percentage=.2, MortgageClass=TaxDeductibleMortgage,
-    #                                                  MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
-    #                                                  interest_rate=0.03)
-    #     #asset_dictionary["Albany Gardens, Hythe"] = property_forecast
-
-    #     property_forecast = generatePropertyForecast(True, 220000, ltv_percentage=ltv_percentage, monthly_gross_rental=800, rental_tax=0.2,
-    #                                                  months_occupied_out_of_12=10,
-    #                                                  agency_percentage=.2, MortgageClass=TaxDeductibleMortgage,
-    #                                                  MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
-    #                                                  interest_rate=0.03)
-    #     #asset_dictionary["Albany Gardens, Hythe, Non Resident"] = property_forecast
-
-    #     property_forecast = generatePropertyForecast(True, 100000, ltv_percentage=ltv_percentage, monthly_gross_rental=750, rental_tax=0.45,
-    #                                                  months_occupied_out_of_12=10,
-    #                                                  agency_percentage=.2, MortgageClass=TaxDeductibleMortgage,
-    #                                                  MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
-    #                                                  interest_rate=0.10)
-    #     asset_dictionary["10% Interest World Property"] = property_forecast
-
-    property_forecast = generateLeaseholdPropertyForecast(True, 750000, ltv_percentage=ltv_percentage,
-                                                          monthly_gross_rental=(700 + 700 * 3), rental_tax=0.45,
-                                                          months_occupied_out_of_12=10,
-                                                          agency_percentage=.2, annual_service_charge=1500,
-                                                          annual_ground_rent=90, mortgage_searcher=mortgageFactory,
-                                                          MortgageClass=TaxDeductibleMortgage,
-                                                          MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2,
-                                                          length=25,
-                                                          interest_rate=0.0259)
-
-    asset_dictionary["Cookham House"] = property_forecast
-
-    #     property_forecast = generateLiveInLandlordPropertyForecast(False, 525000, 0.8, monthly_gross_rental=(500 + 100 * 2),
-    #                                                                rental_tax=0.45,
-    #                                                                months_occupied_out_of_12=10,
-    #                                                                agency_percentage=.2,
-    #                                                                MortgageClass=TaxDeductibleMortgage,
-    #                                                                MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2,
-    #                                                                length=25,
-    #                                                                interest_rate=0.0259)
-    #     #asset_dictionary["Grandby House"] = property_forecast
-
-    lixing_agency_percentage = (0.075 + 0.025) * 1.20
-    asset_dictionary["2 Bed 1 bath long and waterson"] = generateLeaseholdPropertyForecast(True, 690000,
-                                                                                           ltv_percentage=ltv_percentage,
-                                                                                           # monthly_gross_rental=700 * 4.3,
-                                                                                           monthly_gross_rental=625,
-                                                                                           rental_tax=0,
-                                                                                           months_occupied_out_of_12=12,
-                                                                                           agency_percentage=lixing_agency_percentage,
-                                                                                           annual_service_charge=7 * 677,
-                                                                                           annual_ground_rent=600,
-                                                                                           mortgage_searcher=mortgageFactory,
-                                                                                           MortgageClass=RepaymentMortgage,
-                                                                                           length=25,
-                                                                                           interest_rate=interest_rate)
-
-    #     asset_dictionary["3 Bed 2 bath long and waterson"] = generateLeaseholdPropertyForecast(True, 1180000, ltv_percentage=ltv_percentage, monthly_gross_rental=1100*4.3, rental_tax=0.45,
-    #                                                  months_occupied_out_of_12=10,
-    #                                                  agency_percentage=.2, annual_service_charge=7*1264, annual_ground_rent=600, MortgageClass=TaxDeductibleMortgage,
-    #                                                  MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
-    #                                                  interest_rate=0.0259)
-
-    atlas_price = 980000
-    # atlas_price = 900000
-
-    # Recently sold for this price.
-    heron_property_price = 535000
-    heron_property_price = 600000
-    asset_dictionary["Heron - Studio"] = generateLeaseholdPropertyForecast(True, heron_property_price,
-                                                                           ltv_percentage=ltv_percentage,
-                                                                           # monthly_gross_rental=3467,
-                                                                           monthly_gross_rental=0,
-                                                                           rental_tax=0,
-                                                                           months_occupied_out_of_12=10,
-                                                                           agency_percentage=0,
-                                                                           annual_service_charge=3967,
-                                                                           annual_ground_rent=300,
-                                                                           mortgage_searcher=mortgageFactory,
-                                                                           MortgageClass=RepaymentMortgage,
-                                                                           length=25,
-                                                                           interest_rate=interest_rate)
-
-
-    # asset_dictionary["BRK.B 40 P/E"] = HLStock(250000, 40, yearly_principle_repayment-2535*12)
-    # asset_dictionary["BRK.B 40 P/E"] = HLStock(535000*.25, 40, yearly_principle_repayment-2535*12)
-
-    def generateHeaderTableAndGraphSource():
-
-        headers = ["Asset Name", "Initial Equity Cost", "Nominal ROI", "% ROI", "% ROI Year on Year", "Nominal Profit"]
-        table = []
-
-        years_to_forecast = 50
-        graph_source = pd.DataFrame(index=np.arange(0, years_to_forecast * len(asset_dictionary)),
-                                    columns=["Asset Name", "Year", "Nominal ROI", "% ROI Year on Year", "% ROI",
-                                             "Nominal Profit"])
-        inflation_rate = 0.01
-        j = 0
-        for key, value in asset_dictionary.items():
-
-            for i in range(0, years_to_forecast):
-                years = i + 1
-                # graph_source.loc[i] = [[key, value.initial_equity_cost + value.nominal_return_on_investment(years, 0, 0), value.percentage_return_on_investment(years, 0, 0), value.annual_percentage_return_on_investment(years, 0, 0)]]
-                if years == 1:
-                    roi_this_year = value.percentage_return_on_investment(years, inflation_rate, 0)
-                    profit_this_year = value.calculate_profits(years)
-                else:
-                    roi_this_year = value.percentage_return_on_investment(years, inflation_rate,
-                                                                          0) - value.percentage_return_on_investment(
-                        years - 1, inflation_rate, 0)
-                    profit_this_year = value.calculate_profits(years) - value.calculate_profits(years - 1)
-                graph_source.loc[j + i] = [key, years,
-                                           value.nominal_return_on_investment(years, inflation_rate, 0),
-                                           value.annual_percentage_return_on_investment(years, inflation_rate, 0),
-                                           roi_this_year, profit_this_year]
-                row = [key, value.initial_equity_cost, value.nominal_return_on_investment(25, 0, 0),
-                       value.percentage_return_on_investment(25, 0.01, 0),
-                       value.annual_percentage_return_on_investment(25, inflation_rate, 0), profit_this_year]
-            table.append(row)
-            # print(f"{key} {years} {value.initial_equity_cost + value.nominal_return_on_investment(years, 0, 0)}")
-            j += years_to_forecast
-        return headers, table, graph_source
-
-
-    (headers, table, graph_source) = generateHeaderTableAndGraphSource()
-    print(tabulate(table, headers, tablefmt="presto"))
-    alt.renderers.enable('html')
-
-stock_price_to_earnings = 35
-# stock_price_to_earnings = 80
-cost_of_renting_alone = 2535
-cost_of_renting_alone = 2250
-cost_of_renting_alone = 1842
-cost_of_renting_alone = 2000
-cost_of_renting_alone = 2250
-atlas_fully_rented_out = 3467
-atlas_fully_rented_out = 3067
-atlas_studio_property_price = 550000
-
-# TODO model typical stocks, BRK.A / Index funds?
-# TODO would be nice to know what what interest rate a given property becomes not worth it.
-# Double check profit and loss maths are correct
-# alt.Chart(graph_source).mark_line().encode(x='Year', y='Nominal ROI', color='Asset Name', strokeDash='Asset Name').properties(width=700, height=700)
-# alt.Chart(graph_source[graph_source["Asset Name"] == "10% Interest World Property"]).mark_line().encode(x='Year', y='Nominal ROI', color='Asset Name', strokeDash='Asset Name')
\ No newline at end of file
+    import report
+
+    report.main()
@@ -0,0 +1,158 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from assetreturns import Property
+from montecarlo import pathMortgage, pathProperty
+
+METRICS = {
+    "nominal": "nominal_return_on_investment",
+    "percentage": "percentage_return_on_investment",
+    "annual_percentage": "annual_percentage_return_on_investment",
+}
+
+
+def _monthIndex(dates):
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return np.asarray(dates.year * 12 + dates.month - 1)
+
+
+def loadSeries(path, column, date_column="Date", cache_directory=None):
+    """
+    A monthly series from a CSV or Parquet (needs pyarrow) file, as (first month, values) where months count from
+    year 0 (year * 12 + month - 1) and values is a read-only memory-mapped float64 array.
+
+    The file is parsed once: the values are saved as .npy in cache_directory (next to the file by default), and later
+    loads map that copy until the file changes. Rows may come in any order but must cover consecutive months.
+    """
+    status = os.stat(path)
+    key = hashlib.sha256(repr((os.path.abspath(path), column, date_column, status.st_size,
+                               status.st_mtime_ns)).encode()).hexdigest()
+    directory = cache_directory or os.path.dirname(os.path.abspath(path))
+    cache_path = os.path.join(directory, f".{os.path.basename(path)}.{key[:16]}.npy")
+    if not os.path.exists(cache_path):
+        frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        months = _monthIndex(frame[date_column])
+        order = np.argsort(months)
+        months = months[order]
+        if len(months) and not np.array_equal(months, np.arange(months[0], months[0] + len(months))):
+            raise ValueError(f"{path} does not hold one {column} value for each consecutive month")
+        # The first month rides along as the leading element, so one file holds the whole series.
+        series = np.concatenate([months[:1], frame[column].to_numpy(dtype=float)[order]])
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{cache_path}.{os.getpid()}.partial"
+        with open(temporary_path, "wb") as cache_file:
+            np.save(cache_file, series)
+        os.replace(temporary_path, cache_path)
+    series = np.load(cache_path, mmap_mode="r")
+    return int(series[0]), series[1:]
+
+
+class Backtest:
+    """
+    Realised returns of the forecasts over history rather than at a constant growth rate and mortgage rate. Every
+    month in the series is the start of a window, and all windows are evaluated at once as NumPy arrays, the way
+    MonteCarloSimulation evaluates its paths.
+
+    house_price_index and equity_index are monthly index levels and mortgage_rates the annual mortgage rate each
+    month as a decimal, all starting at first_month (see loadSeries). A property's price grows with the house price
+    index over the window, and its mortgage is re-fixed at the historical rate every rate_reset_years from the
+    purchase. HLStock's price follows the equity index and its earnings yield is added on top, as in the forecast,
+    so equity_index must be a price index: a total return index would count dividends twice. Rent and occupancy stay
+    as forecast. Each window runs for up to `years` years; horizons that run past the end of the series are NaN.
+    """
+
+    def __init__(self, house_price_index, mortgage_rates, equity_index, first_month=0, years=25, rate_reset_years=5,
+                 chunk_size=5000):
+        self.house_price_index = house_price_index
+        self.mortgage_rates = mortgage_rates
+        self.equity_index = equity_index
+        self.first_month = first_month
+        self.years = years
+        self.rate_reset_years = rate_reset_years
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_files(cls, house_price_index, mortgage_rates, equity_index, cache_directory=None, **kwargs):
+        """
+        Loads each series with loadSeries from a (path, column) pair, or a (path, column, date_column) triple, and
+        keeps the months all three cover.
+        """
+        loaded = [loadSeries(*source, cache_directory=cache_directory)
+                  for source in (house_price_index, mortgage_rates, equity_index)]
+        first_month = max(first for first, _ in loaded)
+        last_month = min(first + len(values) for first, values in loaded)
+        if last_month <= first_month:
+            raise ValueError("the series have no months in common")
+        house_price_index, mortgage_rates, equity_index = (values[first_month - first:last_month - first]
+                                                           for first, values in loaded)
+        return cls(house_price_index, mortgage_rates, equity_index, first_month, **kwargs)
+
+    @property
+    def window_count(self):
+        return len(self.house_price_index)
+
+    @property
+    def start_months(self):
+        """Start month of every window, as numpy datetime64 months."""
+        return np.datetime64("1970-01", "M") + (self.first_month - 1970 * 12) + np.arange(self.window_count)
+
+    def _annualised_growth(self, index, starts, years):
+        # Index level at the end of each (window, horizon), NaN past the end of the series.
+        end = starts[:, np.newaxis] + years * 12
+        inside = end < len(index)
+        growth = np.asarray(index)[np.where(inside, end, 0)] / np.asarray(index)[starts][:, np.newaxis]
+        return np.where(inside, growth ** (1 / years) - 1, np.nan)
+
+    def _interest_rate_paths(self, starts, payment_months):
+        # The rate at the latest reset, holding the last rate once the series runs out.
+        reset_months = self.rate_reset_years * 12
+        months = starts[:, np.newaxis] + np.arange(payment_months) // reset_months * reset_months
+        return np.asarray(self.mortgage_rates)[np.minimum(months, len(self.mortgage_rates) - 1)]
+
+    def window_returns(self, asset, starts, metric="percentage"):
+        """(len(starts) x years) returns of one asset for windows starting at the given month offsets."""
+        starts = np.asarray(starts)
+        years = np.arange(1, self.years + 1)[np.newaxis, :]
+        if isinstance(asset, Property):
+            index = self.house_price_index
+            window_asset = pathProperty(asset, pathMortgage(asset.mortgage, len(starts), self.years * 12 + 1,
+                                                            lambda interest_rate, payment_months:
+                                                            self._interest_rate_paths(starts, payment_months)),
+                                        self.years)
+        else:
+            window_asset = asset
+            index = self.equity_index
+        returns = getattr(window_asset, METRICS[metric])(years, self._annualised_growth(index, starts, years), 0)
+        return np.broadcast_to(returns, (len(starts), self.years))
+
+    def realised_returns(self, asset, metric="percentage"):
+        """(windows x years) returns of one asset, one row per start month."""
+        return np.concatenate([self.window_returns(asset, np.arange(start, min(start + self.chunk_size,
+                                                                               self.window_count)), metric)
+                               for start in range(0, self.window_count, self.chunk_size)])
+
+    def distribution(self, asset_dictionary, holding_periods=None, percentiles=(5, 50, 95), metric="percentage"):
+        """
+        Spread of realised returns across every window that fits each holding period: one row per (asset, holding
+        period in years) with the window count, mean, worst, best and a P<percentile> column per band.
+        """
+        holding_periods = np.arange(1, self.years + 1) if holding_periods is None else np.asarray(holding_periods)
+        if holding_periods.max(initial=0) > self.years:
+            raise ValueError(f"holding periods run for at most the backtest's {self.years} years")
+        frames = []
+        for asset_name, asset in asset_dictionary.items():
+            returns = self.realised_returns(asset, metric)[:, holding_periods - 1]
+            counts = np.isfinite(returns).sum(axis=0)
+            # Holding periods longer than the history have no windows at all; zeros stand in and are masked below.
+            filled = np.where(counts > 0, returns, 0)
+            frame = pd.DataFrame({"Asset Name": asset_name, "Holding Years": holding_periods, "Windows": counts,
+                                  "Mean": np.nanmean(filled, axis=0), "Worst": np.nanmin(filled, axis=0),
+                                  "Best": np.nanmax(filled, axis=0)})
+            for percentile, band in zip(percentiles, np.nanpercentile(filled, percentiles, axis=0)):
+                frame[f"P{percentile}"] = band
+            frame.loc[counts == 0, "Mean":] = np.nan
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
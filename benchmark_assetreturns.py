@@ -0,0 +1,341 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+import warnings
+
+import numpy as np
+import numpy_financial
+import pandas as pd
+
+from assetreturns import recurrenceSchedule, closedFormSchedule, RepaymentMortgage, MortgageBatch
+from assetreturns import BTLmortgageFactory, BTLmaxPrinciple, generateLeaseholdPropertyForecast, mortgageFactory
+from assetreturns import TaxDeductibleMortgage, InterestOnlyMortgage, AbstractMortgage, HLStock, calculateSDLT
+from assetreturns import _cachedSDLT, stockBenchmarkReturns
+from report import generateHeaderTableAndGraphSource, streamReport
+from valuation import cashFlowMatrix, internalRateOfReturn
+
+
+def legacyPaymentTable(principle, payment_months, periodic_interest_rate, monthly_installment,
+                       early_repayment_months_and_amount={}):
+    # The row by row .loc loop AbstractMortgage used before the schedule engines, kept as the baseline to beat.
+    payment_table = pd.DataFrame(index=np.arange(0, payment_months),
+                                 columns=["Principle", "Interest", "Payment", "Early Repayment"])
+    payment_table.loc[0] = [principle, periodic_interest_rate * principle, monthly_installment, 0]
+    payment_table["Early Repayment"].values[:] = 0
+    for i in range(1, payment_months):
+        previous_row = payment_table.loc[i - 1]
+        current_row = payment_table.loc[i]
+        current_row["Principle"] = previous_row["Principle"] + previous_row["Interest"] - previous_row["Payment"]
+        current_row["Interest"] = payment_table.loc[i]["Principle"] * periodic_interest_rate
+        month = i + 1
+        if month in early_repayment_months_and_amount:
+            start_of_year_row = payment_table.loc[(month / 12) * 12 - 1]
+            current_row["Early Repayment"] = early_repayment_months_and_amount[month] * start_of_year_row["Principle"]
+        current_row["Payment"] = min(monthly_installment + current_row["Early Repayment"],
+                                     current_row["Principle"] + current_row["Interest"])
+    last_row = payment_table.loc[payment_months - 1]
+    last_row["Payment"] = last_row["Principle"] + last_row["Interest"]
+    return payment_table
+
+
+def _best_of(function, number, repeat=5):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def benchmarkScheduleEngines(principle=372000, length=25, interest_rate=0.0359,
+                             early_repayment_months_and_amount={12: 0.1, 24: 0.1, 36: 0.1}):
+    payment_months = length * 12
+    periodic_interest_rate = (1 + interest_rate) ** (1 / 12) - 1
+    monthly_installment = -numpy_financial.pmt(periodic_interest_rate, payment_months, principle)
+    args = (principle, payment_months, periodic_interest_rate, monthly_installment, early_repayment_months_and_amount)
+
+    with warnings.catch_warnings():
+        # The legacy loop relies on chained assignment.
+        warnings.simplefilter("ignore")
+        legacy = legacyPaymentTable(*args)
+        legacy_seconds = _best_of(lambda: legacyPaymentTable(*args), number=1, repeat=3)
+
+    recurrence = recurrenceSchedule(*args)
+    closed_form = closedFormSchedule(*args)
+    legacy_columns = [legacy[column].to_numpy(dtype=float) for column in legacy.columns]
+    assert all(np.array_equal(old, new) for old, new in zip(legacy_columns, recurrence))
+    assert all(np.allclose(old, new, rtol=1e-9, atol=1e-6) for old, new in zip(legacy_columns, closed_form))
+
+    return {
+        "legacy .loc loop": legacy_seconds,
+        "recurrenceSchedule": _best_of(lambda: recurrenceSchedule(*args), number=200),
+        "closedFormSchedule": _best_of(lambda: closedFormSchedule(*args), number=200),
+        "RepaymentMortgage": _best_of(
+            lambda: RepaymentMortgage(principle, length, interest_rate, early_repayment_months_and_amount).schedule,
+            number=200),
+    }
+
+
+def benchmarkMortgageBatch(mortgage_count=100000, seed=0):
+    random = np.random.default_rng(seed)
+    principles = random.uniform(50000, 500000, mortgage_count)
+    lengths = random.choice([10, 15, 25], mortgage_count)
+    interest_rates = random.uniform(0.01, 0.06, mortgage_count)
+    batch_seconds = _best_of(lambda: MortgageBatch(principles, lengths, interest_rates), number=1, repeat=3)
+    single_seconds = _best_of(lambda: RepaymentMortgage(principles[0], int(lengths[0]), interest_rates[0]).schedule,
+                              number=50)
+    return {
+        f"MortgageBatch x{mortgage_count}": batch_seconds,
+        f"RepaymentMortgage x{mortgage_count} (extrapolated)": single_seconds * mortgage_count,
+    }
+
+
+def benchmarkMortgageFactory(property_count=100000, seed=0):
+    random = np.random.default_rng(seed)
+    rents = random.uniform(300, 5000, property_count)
+    prices = random.uniform(50000, 1000000, property_count)
+    factory_seconds = _best_of(lambda: BTLmortgageFactory(RepaymentMortgage, rents[0], prices[0], 0.75, length=25,
+                                                          interest_rate=0.03), number=200)
+    return {
+        f"BTLmaxPrinciple x{property_count}": _best_of(
+            lambda: BTLmaxPrinciple(RepaymentMortgage, rents, prices, 0.75, length=25, interest_rate=0.03),
+            number=1, repeat=3),
+        f"BTLmortgageFactory x{property_count} (extrapolated)": factory_seconds * property_count,
+    }
+
+
+def benchmarkInternalRateOfReturn(series_count=2000, seed=0):
+    forecast = generateLeaseholdPropertyForecast(
+        True, 750000, ltv_percentage=0.75, monthly_gross_rental=2800, rental_tax=0.45, months_occupied_out_of_12=10,
+        agency_percentage=.2, annual_service_charge=1500, annual_ground_rent=90, mortgage_searcher=mortgageFactory,
+        MortgageClass=TaxDeductibleMortgage, MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
+        interest_rate=0.0259)
+    growth = np.random.default_rng(seed).uniform(-0.02, 0.05, series_count)
+    cash_flows = cashFlowMatrix([forecast] * series_count, 25, growth)
+    return {
+        f"internalRateOfReturn x{series_count}": _best_of(lambda: internalRateOfReturn(cash_flows), number=1, repeat=3),
+        f"numpy_financial.irr x{series_count} (extrapolated)": _best_of(
+            lambda: numpy_financial.irr(cash_flows[0]), number=1, repeat=3) * series_count,
+    }
+
+
+def measureMortgageMemory(mortgage_count=1000, length=25, interest_rate=0.0359):
+    """Bytes held per mortgage once its schedule, prefix sums and payment_table view have all been used."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        mortgages = [RepaymentMortgage(372000 + i, length, interest_rate) for i in range(mortgage_count)]
+        for mortgage in mortgages:
+            mortgage.total_interest(length)
+            mortgage.outstanding_balance(60)
+            mortgage.payment_table
+        return (tracemalloc.get_traced_memory()[0] - before) / mortgage_count
+    finally:
+        tracemalloc.stop()
+
+
+def _suitePortfolio():
+    # The three properties the report is run against, plus a stock benchmark.
+    common = dict(ltv_percentage=0.75, mortgage_searcher=mortgageFactory, length=25)
+    return {
+        "Cookham House": generateLeaseholdPropertyForecast(
+            True, 750000, monthly_gross_rental=2800, rental_tax=0.45, months_occupied_out_of_12=10,
+            agency_percentage=.2, annual_service_charge=1500, annual_ground_rent=90, MortgageClass=TaxDeductibleMortgage,
+            MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, interest_rate=0.0259, **common),
+        "2 Bed 1 bath long and waterson": generateLeaseholdPropertyForecast(
+            True, 690000, monthly_gross_rental=625, rental_tax=0, months_occupied_out_of_12=12,
+            agency_percentage=0.12, annual_service_charge=4739, annual_ground_rent=600, MortgageClass=RepaymentMortgage,
+            interest_rate=0.0259, **common),
+        "Heron - Studio": generateLeaseholdPropertyForecast(
+            True, 600000, monthly_gross_rental=0, rental_tax=0, months_occupied_out_of_12=10, agency_percentage=0,
+            annual_service_charge=3967, annual_ground_rent=300, MortgageClass=RepaymentMortgage, interest_rate=0.0259,
+            **common),
+        "BRK.B 21 P/E": HLStock(250000, 21.73),
+    }
+
+
+def _constructMortgages(MortgageClass, lengths, principles):
+    for length in lengths:
+        for principle in principles:
+            MortgageClass(principle, length, 0.0359).total_interest(length)
+
+
+def _nominalReturns(portfolio, years):
+    for investment in portfolio.values():
+        for year in years:
+            investment.nominal_return_on_investment(year, 0.01, 0)
+
+
+def _scalarSDLT(prices):
+    _cachedSDLT.cache_clear()
+    for price in prices:
+        calculateSDLT(True, price)
+
+
+def suiteCases():
+    """name: (function, operations per call). Throughput is reported as operations per second."""
+    random = np.random.default_rng(0)
+    lengths = [5, 10, 15, 20, 25, 30, 35, 40]
+    principles = random.uniform(50000, 500000, 10)
+    rents = random.uniform(300, 5000, 50)
+    prices = random.uniform(50000, 3000000, 100000)
+    portfolio = _suitePortfolio()
+    years = range(1, 51)
+    return {
+        "RepaymentMortgage construction, 5-40 year terms": (
+            lambda: _constructMortgages(RepaymentMortgage, lengths, principles), len(lengths) * len(principles)),
+        "InterestOnlyMortgage construction, 5-40 year terms": (
+            lambda: _constructMortgages(InterestOnlyMortgage, lengths, principles), len(lengths) * len(principles)),
+        "mortgageFactory solve": (
+            lambda: [mortgageFactory(TaxDeductibleMortgage, rent, 500000, 0.75, tax_rate=0.2,
+                                     MortgageClassToDecorate=RepaymentMortgage, length=25, interest_rate=0.03)
+                     for rent in rents], len(rents)),
+        "BTLmortgageFactory solve": (
+            lambda: [BTLmortgageFactory(RepaymentMortgage, rent, 500000, 0.75, length=25, interest_rate=0.03)
+                     for rent in rents], len(rents)),
+        "nominal_return_on_investment, 1-50 years": (
+            lambda: _nominalReturns(portfolio, years), len(portfolio) * len(years)),
+        "stockBenchmarkReturns, 100 P/E x 50 years": (
+            lambda: stockBenchmarkReturns(200000, np.linspace(5, 40, 100), years, 0.01, [1000] * 25), 100 * len(years)),
+        "calculateSDLT, 100k price array": (lambda: calculateSDLT(True, prices), len(prices)),
+        "calculateSDLT, 10k scalar calls": (lambda: _scalarSDLT(prices[:10000]), 10000),
+        "generateHeaderTableAndGraphSource, 4 assets x 50 years": (
+            lambda: generateHeaderTableAndGraphSource(portfolio), 1),
+        "streamReport, 1000 assets x 50 years": (
+            lambda: sum(len(chunk) for chunk in streamReport(
+                (f"{asset_name} {i}", investment) for i in range(250) for asset_name, investment in portfolio.items())),
+            1000),
+    }
+
+
+def measure(function, operations, repeat=5):
+    """Best of `repeat` timed runs after a warm-up, and the peak memory allocated by one run."""
+    function()
+    seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "operations_per_second": operations / seconds, "peak_bytes": peak_bytes}
+
+
+def runSuite(names=None, repeat=5):
+    # Construction is timed cold: a shared schedule cache would otherwise serve every repeat after the first.
+    schedule_cache = AbstractMortgage.schedule_cache
+    AbstractMortgage.schedule_cache = None
+    try:
+        return {name: measure(function, operations, repeat)
+                for name, (function, operations) in suiteCases().items() if names is None or name in names}
+    finally:
+        AbstractMortgage.schedule_cache = schedule_cache
+
+
+def loadHistory(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path) as history_file:
+        return json.load(history_file)
+
+
+def findRegressions(results, history, threshold=0.25, memory_threshold=0.25, window=5):
+    """
+    Benchmarks slower (or using more peak memory) than the best of the last `window` recorded runs by more than the
+    threshold fraction. Benchmarks with no history pass.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = [run["results"][name] for run in history[-window:] if name in run["results"]]
+        if not previous:
+            continue
+        best_seconds = min(run["seconds"] for run in previous)
+        best_peak_bytes = min(run["peak_bytes"] for run in previous)
+        if result["seconds"] > best_seconds * (1 + threshold):
+            regressions.append(f"{name}: {result['seconds']:.4g} s against {best_seconds:.4g} s")
+        if result["peak_bytes"] > best_peak_bytes * (1 + memory_threshold):
+            regressions.append(f"{name}: peak {result['peak_bytes']} bytes against {best_peak_bytes}")
+    return regressions
+
+
+def recordRun(history_path, results):
+    history = loadHistory(history_path)
+    history.append({
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    })
+    temporary_path = history_path + ".partial"
+    with open(temporary_path, "w") as history_file:
+        json.dump(history, history_file, indent=1)
+    os.replace(temporary_path, history_path)
+
+
+def _timeInFreshInterpreter(code, repeat):
+    # Best of `repeat` fresh interpreters; the snippet prints the seconds it measured.
+    return min(float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout) for _ in range(repeat))
+
+
+def measureImportTime(module="assetreturns", repeat=5):
+    return _timeInFreshInterpreter(
+        f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)", repeat)
+
+
+def measureWorkerSpawnTime(module="assetreturns", processes=4, repeat=3):
+    """Seconds to start a spawn-method process pool whose workers each import `module`."""
+    return _timeInFreshInterpreter(
+        "import concurrent.futures, multiprocessing, time\n"
+        "start = time.perf_counter()\n"
+        f"with concurrent.futures.ProcessPoolExecutor({processes}, "
+        "mp_context=multiprocessing.get_context('spawn')) as executor:\n"
+        f"    list(executor.map(exec, ['import {module}'] * {processes}))\n"
+        "print(time.perf_counter() - start)", repeat)
+
+
+def printComparisons():
+    results = benchmarkScheduleEngines()
+    baseline = results["legacy .loc loop"]
+    for name, seconds in results.items():
+        print(f"{name:<22} {seconds * 1e6:>12.1f} us  {baseline / seconds:>8.1f}x")
+    for name, seconds in {**benchmarkMortgageBatch(), **benchmarkMortgageFactory(),
+                          **benchmarkInternalRateOfReturn()}.items():
+        print(f"{name:<45} {seconds:>8.3f} s")
+    # Four schedule columns and three prefix sums of float64 are the floor.
+    payload = (4 * 25 * 12 + 3 * (25 * 12 + 1)) * 8
+    print(f"{'bytes per 25 year mortgage':<45} {measureMortgageMemory():>8.0f}  (float64 payload {payload})")
+    print(f"{'import assetreturns':<45} {measureImportTime():>8.3f} s")
+    print(f"{'spawn 4 workers importing assetreturns':<45} {measureWorkerSpawnTime():>8.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the forecasting hot paths and gates regressions.")
+    parser.add_argument("--history", default="benchmark_history.json", help="JSON file runs are appended to")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fail when a benchmark is this fraction slower than its recent best")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="fail when peak memory grows by this fraction over its recent best")
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-record", action="store_true", help="compare against the history without adding to it")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="also print the speed-ups over the legacy implementations")
+    arguments = parser.parse_args()
+
+    results = runSuite(arguments.only, arguments.repeat)
+    for name, result in results.items():
+        print(f"{name:<55} {result['seconds'] * 1e3:>10.2f} ms {result['operations_per_second']:>14.1f} ops/s "
+              f"{result['peak_bytes'] / 2 ** 20:>8.2f} MiB peak")
+    if arguments.comparisons:
+        printComparisons()
+
+    regressions = findRegressions(results, loadHistory(arguments.history), arguments.threshold,
+                                  arguments.memory_threshold)
+    if not arguments.no_record and not regressions:
+        recordRun(arguments.history, results)
+    if regressions:
+        print("Regressions:", *regressions, sep="\n  ")
+        sys.exit(1)
@@ -0,0 +1,122 @@
+import numpy as np
+
+from assetreturns import AbstractMortgage, Investment, generateLeaseholdPropertyForecast
+
+METRICS = {
+    "nominal": "nominal_return_on_investment",
+    "percentage": "percentage_return_on_investment",
+    "annual_percentage": "annual_percentage_return_on_investment",
+}
+GROWTH = "annual_price_change_percentage"
+
+
+def _mortgageKey(mortgage):
+    if hasattr(mortgage, "wrapped_mortgage"):
+        return type(mortgage), getattr(mortgage, "tax_rate", None), _mortgageKey(mortgage.wrapped_mortgage)
+    if isinstance(mortgage, AbstractMortgage):
+        # Variable rate products also differ by their rate path and fees, refinance chains by their later products.
+        return (type(mortgage), mortgage.principle, mortgage.length, mortgage.periodic_interest_rate,
+                mortgage.monthly_installment, tuple(sorted(mortgage.early_repayment_months_and_amount.items())),
+                getattr(mortgage, "segments", None), getattr(mortgage, "product_fees", None),
+                getattr(mortgage, "products", None))
+    # Mortgages we can't describe are never shared.
+    return id(mortgage)
+
+
+class MortgageMemo:
+    """
+    Hands back an already built mortgage, schedule and prefix sums included, whenever a searcher produces one
+    identical to an earlier result. Iterating on rent under mortgageFactory, for example, keeps the same loan.
+    """
+
+    def __init__(self):
+        self._mortgages = {}
+        self.hits = 0
+
+    def wrap(self, mortgage_searcher):
+        def cached_searcher(*args, **kwargs):
+            mortgage = mortgage_searcher(*args, **kwargs)
+            key = _mortgageKey(mortgage)
+            if key in self._mortgages:
+                self.hits += 1
+                return self._mortgages[key]
+            self._mortgages[key] = mortgage
+            return mortgage
+        return cached_searcher
+
+
+def bracketedRoot(function, low, high, tolerance=1e-8, max_iterations=100):
+    """
+    Roots of a vector of functions at once with the Illinois variant of regula falsi. low and high set the shape;
+    function(x, active) evaluates the active entries at x[active]. Entries whose bracket has no sign change come back
+    as NaN.
+    """
+    low, high = (array.astype(float) for array in np.broadcast_arrays(low, high))
+    everything = np.ones(low.shape, dtype=bool)
+    low_value = function(low, everything)
+    high_value = function(high, everything)
+    root = np.where(low_value == 0, low, np.where(high_value == 0, high, np.nan))
+    active = np.sign(low_value) * np.sign(high_value) < 0
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            trial = np.where(active, high - high_value * (high - low) / (high_value - low_value), low)
+        value = np.zeros(low.shape)
+        value[active] = function(trial, active)[active]
+        converged = active & ((np.abs(value) <= tolerance) | (np.abs(high - low) <= tolerance))
+        root = np.where(converged, trial, root)
+        active &= ~converged
+        # Keep the bracket around the sign change, halving the stale end's value so it can't stall.
+        same_side_as_high = active & (np.sign(value) == np.sign(high_value))
+        same_side_as_low = active & ~same_side_as_high
+        low_value = np.where(same_side_as_high, low_value / 2, low_value)
+        high_value = np.where(same_side_as_low, high_value / 2, high_value)
+        high, high_value = np.where(same_side_as_high, trial, high), np.where(same_side_as_high, value, high_value)
+        low, low_value = np.where(same_side_as_low, trial, low), np.where(same_side_as_low, value, low_value)
+    return np.where(active, (low + high) / 2, root)
+
+
+def solveBreakEven(parameter, low, high, scenarios, forecast_factory=generateLeaseholdPropertyForecast, target=0,
+                   metric="nominal", years=25, annual_price_change_percentage=0.01, tolerance=1e-8,
+                   max_iterations=100):
+    """
+    Value of `parameter` at which each scenario's return stops beating the target, e.g. the interest rate above
+    which a property loses money over 25 years, or the rent at which it matches an HLStock benchmark.
+
+    scenarios is a list of forecast_factory kwargs, one per asset; parameter is any of those kwargs (interest_rate,
+    monthly_gross_rental, principle, ...) or "annual_price_change_percentage". target is a number, or an Investment
+    whose return under the same metric, horizon and growth is matched. metric is "nominal", "percentage" or
+    "annual_percentage". low/high bracket the answer (scalars or one per scenario); NaN where the bracket holds no
+    break-even.
+
+    All scenarios are iterated together. Identical mortgages are reused between iterations and scenarios, and when
+    solving for growth each forecast is built only once.
+    """
+    memo = MortgageMemo()
+    scenarios = [dict(scenario) for scenario in scenarios]
+    for scenario in scenarios:
+        if "mortgage_searcher" in scenario:
+            scenario["mortgage_searcher"] = memo.wrap(scenario["mortgage_searcher"])
+    if parameter == GROWTH:
+        forecasts = [forecast_factory(**scenario) for scenario in scenarios]
+
+    def excess_return(investment, growth):
+        achieved = getattr(investment, METRICS[metric])(years, growth, 0)
+        if isinstance(target, Investment):
+            return achieved - getattr(target, METRICS[metric])(years, growth, 0)
+        return achieved - target
+
+    def evaluate(values, active):
+        excess = np.zeros(len(scenarios))
+        for i in np.flatnonzero(active):
+            if parameter == GROWTH:
+                excess[i] = excess_return(forecasts[i], values[i])
+            else:
+                forecast = forecast_factory(**{**scenarios[i], parameter: values[i]})
+                excess[i] = excess_return(forecast, annual_price_change_percentage)
+        return excess
+
+    low = np.broadcast_to(np.asarray(low, dtype=float), len(scenarios))
+    high = np.broadcast_to(np.asarray(high, dtype=float), len(scenarios))
+    return bracketedRoot(evaluate, low, high, tolerance, max_iterations)
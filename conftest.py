@@ -0,0 +1,23 @@
+import pytest
+
+from assetreturns import generateLeaseholdPropertyForecast, mortgageFactory, TaxDeductibleMortgage, RepaymentMortgage
+
+
+@pytest.fixture
+def leasehold_property():
+    """A tax deductible repayment mortgaged leasehold, as used across the forecast and simulation tests."""
+    return generateLeaseholdPropertyForecast(True, 750000, ltv_percentage=0.75, monthly_gross_rental=2800,
+                                             rental_tax=0.45, months_occupied_out_of_12=10, agency_percentage=.2,
+                                             annual_service_charge=1500, annual_ground_rent=90,
+                                             mortgage_searcher=mortgageFactory, MortgageClass=TaxDeductibleMortgage,
+                                             MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25,
+                                             interest_rate=0.0259)
+
+
+@pytest.fixture
+def leasehold_scenario():
+    """generateLeaseholdPropertyForecast kwargs for a fully let leasehold."""
+    return dict(is_second_property=True, principle=690000, ltv_percentage=0.75, monthly_gross_rental=2500,
+                rental_tax=0, months_occupied_out_of_12=12, agency_percentage=0.12, annual_service_charge=4739,
+                annual_ground_rent=600, mortgage_searcher=mortgageFactory, MortgageClass=RepaymentMortgage,
+                length=25, interest_rate=0.0259)
@@ -0,0 +1,170 @@
+import contextlib
+import cProfile
+import collections
+import functools
+import importlib
+import json
+import os
+import threading
+import time
+
+# The active Recorder, None when instrumentation is off.
+recorder = None
+
+# "module:Class.attribute" or "module:function"; the module defaults to assetreturns.
+HOOKS = (
+    "AbstractMortgage.__init__",
+    "AbstractMortgage.schedule",
+    "VariableRateMortgage.schedule",
+    "RefinanceChain.schedule",
+    "_mortgageFactory",
+    "maxPrinciple",
+    "calculateSDLT",
+    "calculateCapitalGains",
+    "Investment.nominal_return_on_investment",
+    "Investment.percentage_return_on_investment",
+    "Investment.annual_percentage_return_on_investment",
+    "Property.calculate_profits",
+    "LeaseholdProperty.calculate_profits",
+    "HLStock.calculate_profits",
+    "Property.sell_expenses",
+    "HLStock.sell_expenses",
+    "report:generateHeaderTableAndGraphSource",
+)
+
+
+class Recorder:
+    """
+    Call counts and inclusive wall time per hooked function, plus any counters, for one profile() block.
+    With trace=True every call is also kept as a Chrome trace event for a flame graph; with cprofile=True the block
+    runs under cProfile as well.
+    """
+
+    def __init__(self, trace=False):
+        self.calls = collections.Counter()
+        self.seconds = collections.defaultdict(float)
+        self.max_seconds = collections.defaultdict(float)
+        self.counters = collections.Counter()
+        self.trace_events = [] if trace else None
+        self.profiler = None
+        self._origin = time.perf_counter()
+
+    def record(self, name, start, end):
+        elapsed = end - start
+        self.calls[name] += 1
+        self.seconds[name] += elapsed
+        if elapsed > self.max_seconds[name]:
+            self.max_seconds[name] = elapsed
+        if self.trace_events is not None:
+            self.trace_events.append({"name": name, "ph": "X", "ts": (start - self._origin) * 1e6,
+                                      "dur": elapsed * 1e6, "pid": os.getpid(), "tid": threading.get_ident()})
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def table(self):
+        """One row per hooked function called, slowest total first. Times include the hooked functions it calls."""
+        import pandas as pd
+
+        names = sorted(self.calls, key=self.seconds.get, reverse=True)
+        return pd.DataFrame({
+            "Function": names,
+            "Calls": [self.calls[name] for name in names],
+            "Total Seconds": [self.seconds[name] for name in names],
+            "Mean Seconds": [self.seconds[name] / self.calls[name] for name in names],
+            "Max Seconds": [self.max_seconds[name] for name in names],
+        })
+
+    def write_trace(self, path):
+        """Chrome trace JSON, readable by chrome://tracing, Perfetto or speedscope."""
+        if self.trace_events is None:
+            raise ValueError("profile(trace=True) is needed to record a trace")
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+    def dump_stats(self, path):
+        """cProfile statistics for pstats, snakeviz or gprof2dot."""
+        if self.profiler is None:
+            raise ValueError("profile(cprofile=True) is needed to record cProfile statistics")
+        self.profiler.dump_stats(path)
+
+
+def count(name, amount=1):
+    if recorder is not None:
+        recorder.count(name, amount)
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        active = recorder
+        if active is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            active.record(name, start, time.perf_counter())
+    return timed
+
+
+def _resolve(hook):
+    module_name, _, path = hook.rpartition(":")
+    owner = importlib.import_module(module_name or "assetreturns")
+    *owner_path, attribute = path.split(".")
+    for name in owner_path:
+        owner = getattr(owner, name)
+    return owner, attribute
+
+
+def _patch(hooks):
+    # Every hook is resolved before any is swapped, so a hook that doesn't resolve leaves nothing wrapped.
+    replacements = []
+    for hook in hooks:
+        owner, attribute = _resolve(hook)
+        original = vars(owner)[attribute]
+        name = hook.rpartition(":")[2]
+        if isinstance(original, property):
+            replacement = property(_timed(name, original.fget), original.fset, original.fdel, original.__doc__)
+        elif isinstance(original, (staticmethod, classmethod)):
+            replacement = type(original)(_timed(name, original.__func__))
+        else:
+            replacement = _timed(name, original)
+        replacements.append((owner, attribute, original, replacement))
+    patches = []
+    for owner, attribute, original, replacement in replacements:
+        setattr(owner, attribute, replacement)
+        patches.append((owner, attribute, original))
+    return patches
+
+
+@contextlib.contextmanager
+def profile(hooks=HOOKS, trace=False, cprofile=False):
+    """
+    Times every hook for the duration of the block and yields the Recorder:
+
+        with instrumentation.profile() as recorder:
+            generateHeaderTableAndGraphSource(asset_dictionary)
+        print(recorder.table())
+
+    The hooks are swapped for timing wrappers only inside the block, so nothing is paid when profiling is off; only
+    count() calls stay in the code, behind one check of `recorder`. Recording is per process, so sweeps on a process
+    pool should profile inside the worker function.
+    """
+    global recorder
+    if recorder is not None:
+        raise RuntimeError("instrumentation.profile() is already active")
+    active = Recorder(trace)
+    patches = _patch(hooks)
+    recorder = active
+    if cprofile:
+        active.profiler = cProfile.Profile()
+        active.profiler.enable()
+    try:
+        yield active
+    finally:
+        if active.profiler is not None:
+            active.profiler.disable()
+        recorder = None
+        for owner, attribute, original in reversed(patches):
+            setattr(owner, attribute, original)
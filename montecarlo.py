@@ -0,0 +1,218 @@
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from assetreturns import Property, RepaymentMortgage, InterestOnlyMortgage, MortgageBatch
+
+
+class _PathMortgage:
+    """
+    Stands in for a Property's mortgage with one schedule per simulated path, so the Property's own profit and sell
+    expense formulas evaluate every path at once. Totals come back as (paths x years) arrays.
+    """
+
+    def __init__(self, principle, cumulative_interest, outstanding_balances, interest_factor, fees):
+        self.principle = principle
+        self._cumulative_interest = cumulative_interest
+        self._outstanding_balances = outstanding_balances
+        self._interest_factor = interest_factor
+        # Fees other than interest paid within 0, 1, 2... years, e.g. each refinance's product fee less equity released.
+        self._fees = fees
+
+    def total_interest(self, years):
+        return self._cumulative_interest[:, np.asarray(years).ravel() * 12] * self._interest_factor
+
+    def total_fees(self, years):
+        return self.total_interest(years) + self._fees[np.asarray(years).ravel()]
+
+    def outstanding_balance(self, months):
+        return self._outstanding_balances[:, np.asarray(months).ravel()]
+
+
+def _underlyingMortgage(mortgage):
+    while hasattr(mortgage, "wrapped_mortgage"):
+        mortgage = mortgage.wrapped_mortgage
+    return mortgage
+
+
+def pathMortgage(mortgage, path_count, months, interest_rate_paths):
+    """
+    A _PathMortgage covering months 0..months-1 of every path. interest_rate_paths(interest_rate, payment_months) gives
+    the (path_count x payment_months) annual rate of each path and month; it is only asked for when the underlying
+    product can be rebuilt as a MortgageBatch.
+    """
+    underlying = _underlyingMortgage(mortgage)
+    length = underlying.length
+    # Wrappers such as TaxDeductibleMortgage scale interest and add fees, and a RefinanceChain pays a fee (less any
+    # equity released) at each remortgage; recover both from the totals.
+    paid_interest = mortgage.cumulative_interest[-1]
+    interest_factor = mortgage.total_interest(length) / paid_interest if paid_interest else 1
+    horizons = np.arange((months - 1) // 12 + 1)
+    fees = mortgage.total_fees(horizons) - mortgage.total_interest(horizons)
+    payment_months = length * 12
+    if isinstance(underlying, (RepaymentMortgage, InterestOnlyMortgage)):
+        batch = MortgageBatch(
+            np.full(path_count, underlying.principle), length, underlying.interest_rate,
+            [underlying.early_repayment_months_and_amount] * path_count if isinstance(
+                underlying, RepaymentMortgage) else None,
+            interest_only=isinstance(underlying, InterestOnlyMortgage),
+            interest_rate_paths=interest_rate_paths(underlying.interest_rate, payment_months))
+        interest = batch.interest
+        outstanding = batch.balances + batch.interest - batch.payments
+    else:
+        # Rate resets need the product's installment rules; other mortgages keep their own schedule.
+        interest = np.broadcast_to(underlying.schedule.columns[1], (path_count, payment_months))
+        outstanding = np.broadcast_to(underlying.outstanding_balance(np.arange(1, payment_months + 1)),
+                                      (path_count, payment_months))
+
+    cumulative_interest = np.zeros((path_count, months))
+    cumulative_interest[:, 1:payment_months + 1] = np.cumsum(interest[:, :months - 1], axis=1)
+    if payment_months + 1 < months:
+        cumulative_interest[:, payment_months + 1:] = cumulative_interest[:, [payment_months]]
+    outstanding_balances = np.zeros((path_count, months))
+    outstanding_balances[:, 0] = underlying.principle
+    outstanding_balances[:, 1:payment_months] = outstanding[:, :min(payment_months, months) - 1]
+    return _PathMortgage(mortgage.principle, cumulative_interest, outstanding_balances, interest_factor, fees)
+
+
+def _occupiedMonths(asset):
+    # Months let in a year: months_occupied_out_of_12, or whatever the calendar void months leave.
+    if asset.void_months is None:
+        return asset.months_occupied_out_of_12
+    return 12 - len(set(asset.void_months) & set(range(1, 13)))
+
+
+def pathProperty(asset, mortgage, years, occupied_months=None):
+    """
+    A copy of a Property evaluating every path at once over horizons 1..years: mortgage is a _PathMortgage, and
+    occupied_months the (paths x years) months let in each year, the asset's own occupancy by default. Rent growth
+    and void months are folded into an occupancy weighted by each year's rent, so calculate_profits reproduces the
+    ledger's net rent without building a ledger per path.
+    """
+    path_asset = copy.copy(asset)
+    path_asset.mortgage = mortgage
+    path_asset._ledger = None
+    if occupied_months is None and asset.annual_rent_growth == 0 and asset.void_months is None:
+        return path_asset
+    if occupied_months is None:
+        occupied_months = np.full((1, years), float(_occupiedMonths(asset)))
+    rent_index = (1 + asset.annual_rent_growth) ** np.arange(years)
+    # calculate_profits multiplies the average occupancy back up by the horizon.
+    path_asset.months_occupied_out_of_12 = np.cumsum(occupied_months * rent_index, axis=1) / np.arange(1, years + 1)
+    path_asset.annual_rent_growth = 0
+    path_asset.void_months = None
+    return path_asset
+
+
+class MonteCarloSimulation:
+    """
+    Stochastic counterpart to the deterministic forecasts: house prices, equity prices, mortgage rate resets and
+    rental voids are drawn per path, and every asset is evaluated across all paths as NumPy arrays.
+
+    Annual growth is lognormal with the given mean and volatility. Mortgage rates move by a normal shock at every
+    reset and are fixed in between. With rental_voids, occupied months per year are binomial around
+    months_occupied_out_of_12. With every volatility at zero and rental_voids off, each path reproduces the
+    deterministic forecast at house_price_growth/equity_growth.
+
+    Paths are simulated chunk_size at a time, so peak memory is one asset's (path_count x years) results plus one
+    chunk's schedules. Every chunk gets its own child of the seed, so results for a given seed and chunk_size do not
+    depend on how many processes are used.
+    """
+
+    def __init__(self, path_count=10000, years=50, seed=None, house_price_growth=0.01, house_price_volatility=0.05,
+                 equity_growth=0.01, equity_volatility=0.15, interest_rate_volatility=0.01, rate_reset_years=5,
+                 minimum_interest_rate=0.0, rental_voids=True, chunk_size=5000):
+        self.path_count = path_count
+        self.years = years
+        self.seed = seed
+        self.house_price_growth = house_price_growth
+        self.house_price_volatility = house_price_volatility
+        self.equity_growth = equity_growth
+        self.equity_volatility = equity_volatility
+        self.interest_rate_volatility = interest_rate_volatility
+        self.rate_reset_years = rate_reset_years
+        self.minimum_interest_rate = minimum_interest_rate
+        self.rental_voids = rental_voids
+        self.chunk_size = chunk_size
+
+    def _chunks(self):
+        chunk_count = -(-self.path_count // self.chunk_size)
+        seeds = np.random.SeedSequence(self.seed).spawn(chunk_count)
+        sizes = [min(self.chunk_size, self.path_count - i * self.chunk_size) for i in range(chunk_count)]
+        return list(zip(seeds, sizes))
+
+    def _growth_index(self, random, path_count, growth, volatility):
+        # Cumulative price index after 1..years years, lognormal with arithmetic mean growth.
+        log_returns = random.normal(np.log1p(growth) - volatility ** 2 / 2, volatility, (path_count, self.years))
+        return np.exp(np.cumsum(log_returns, axis=1))
+
+    def _interest_rate_paths(self, random, path_count, interest_rate, payment_months):
+        reset_months = self.rate_reset_years * 12
+        reset_count = max(-(-payment_months // reset_months), 1)
+        shocks = random.normal(0, self.interest_rate_volatility * np.sqrt(self.rate_reset_years),
+                               (path_count, reset_count))
+        shocks[:, 0] = 0
+        rates = np.maximum(interest_rate + np.cumsum(shocks, axis=1), self.minimum_interest_rate)
+        return np.repeat(rates, reset_months, axis=1)[:, :payment_months]
+
+    def _path_mortgage(self, random, path_count, mortgage):
+        return pathMortgage(mortgage, path_count, self.years * 12 + 1,
+                            lambda interest_rate, payment_months: self._interest_rate_paths(
+                                random, path_count, interest_rate, payment_months))
+
+    def simulate_asset(self, asset, seed_sequence, path_count, metric="percentage"):
+        """(path_count x years) returns of one asset for one chunk of paths."""
+        random = np.random.default_rng(seed_sequence)
+        # Draw every stream for every asset, so all assets in a chunk see the same market (common random numbers).
+        house_price_index = self._growth_index(random, path_count, self.house_price_growth,
+                                               self.house_price_volatility)
+        equity_index = self._growth_index(random, path_count, self.equity_growth, self.equity_volatility)
+        void_random = np.random.default_rng(random.integers(2 ** 63))
+        rate_random = np.random.default_rng(random.integers(2 ** 63))
+
+        years = np.arange(1, self.years + 1)[np.newaxis, :]
+        if isinstance(asset, Property):
+            price_index = house_price_index
+            occupied_months = None
+            if self.rental_voids:
+                occupied_months = void_random.binomial(12, _occupiedMonths(asset) / 12, (path_count, self.years))
+            path_asset = pathProperty(asset, self._path_mortgage(rate_random, path_count, asset.mortgage), self.years,
+                                      occupied_months)
+        else:
+            path_asset = asset
+            price_index = equity_index
+        # The deterministic formulas take a constant growth rate; the annualised rate reproduces each path's index.
+        annualised_growth = price_index ** (1 / years) - 1
+        if metric == "nominal":
+            return path_asset.nominal_return_on_investment(years, annualised_growth, 0)
+        if metric == "annual_percentage":
+            return path_asset.annual_percentage_return_on_investment(years, annualised_growth, 0)
+        return path_asset.percentage_return_on_investment(years, annualised_growth, 0)
+
+    def simulate(self, asset, metric="percentage", processes=None):
+        """(path_count x years) returns of one asset across every path."""
+        chunks = self._chunks()
+        arguments = ([asset] * len(chunks), [seed for seed, _ in chunks], [size for _, size in chunks],
+                     [metric] * len(chunks))
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(self.simulate_asset, *arguments))
+        else:
+            results = list(map(self.simulate_asset, *arguments))
+        return np.concatenate(results)
+
+    def percentile_bands(self, asset_dictionary, percentiles=(5, 50, 95), metric="percentage", processes=None):
+        """
+        Percentiles of each asset's return by year, laid out like the report's graph source: one row per
+        (asset, year) with a P<percentile> column per band.
+        """
+        frames = []
+        for asset_name, asset in asset_dictionary.items():
+            bands = np.percentile(self.simulate(asset, metric, processes), percentiles, axis=0)
+            frame = pd.DataFrame({"Asset Name": asset_name, "Year": np.arange(1, self.years + 1)})
+            for percentile, band in zip(percentiles, bands):
+                frame[f"P{percentile}"] = band
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from assetreturns import RepaymentMortgage, equityFutureValue
+
+
+class OverpaymentOptimizer:
+    """
+    Searches early_repayment_months_and_amount plans for a RepaymentMortgage: overpay a percentage of the balance at
+    the start of each of the first overpayment_years anniversaries (month 13, 25, ...), at most yearly_cap of the
+    balance a year (the usual penalty free allowance) and cash_budget in all. Each plan is compared with paying the
+    same cash into a stock benchmark at the same dates instead.
+
+    Plans are evaluated thousands at a time: the month by month recurrence is stepped across every plan at once as
+    NumPy arrays, starting from the unmodified mortgage's own schedule at the first anniversary, since nothing before
+    it differs between plans. Figures are nominal and to the end of the term.
+    """
+
+    def __init__(self, principle, length, interest_rate, cash_budget, yearly_cap=0.1, overpayment_years=10,
+                 percentages=None, price_to_earnings=21.73, annual_platform_fee=0):
+        self.mortgage = RepaymentMortgage(principle, length, interest_rate)
+        self.cash_budget = cash_budget
+        self.yearly_cap = yearly_cap
+        self.overpayment_years = min(overpayment_years, length - 1)
+        self.percentages = (np.linspace(0, yearly_cap, 5) if percentages is None
+                            else np.asarray(percentages, dtype=float))
+        if self.percentages.max(initial=0) > yearly_cap:
+            raise ValueError(f"overpayment percentages must not exceed the yearly cap of {yearly_cap}")
+        self.price_to_earnings = price_to_earnings
+        self.annual_platform_fee = annual_platform_fee
+
+    @property
+    def overpayment_months(self):
+        """Month numbers, as used by early_repayment_months_and_amount, of each possible overpayment."""
+        return 12 * np.arange(1, self.overpayment_years + 1) + 1
+
+    def early_repayment_plan(self, percentages):
+        """The early_repayment_months_and_amount dict for one row of plan percentages."""
+        return {int(month): float(percentage) for month, percentage in zip(self.overpayment_months, percentages)
+                if percentage > 0}
+
+    def candidate_plans(self, count=10000, seed=None):
+        """
+        (plans x overpayment_years) percentages: no overpayment, the cap for the first k years, each percentage
+        every year, then random plans from the percentage grid, without duplicates.
+        """
+        years = self.overpayment_years
+        structured = [np.zeros(years)]
+        structured += [np.where(np.arange(years) < k, self.yearly_cap, 0) for k in range(1, years + 1)]
+        structured += [np.full(years, percentage) for percentage in self.percentages]
+        random = np.random.default_rng(seed).choice(self.percentages, (count, years))
+        plans = np.concatenate([np.array(structured), random])
+        # First occurrences in their original order, so the structured plans always come first.
+        _, first = np.unique(plans, axis=0, return_index=True)
+        return plans[np.sort(first)][:count]
+
+    def evaluate(self, plans):
+        """
+        Outcome of each row of plan percentages, as a dict of arrays: the cash actually overpaid, the liquidity kept
+        out of cash_budget, interest saved over the term, growth the same cash would have made in the stock
+        benchmark, the month the mortgage is paid off, and the percentages actually applied. Overpayments are
+        trimmed once the budget runs out or the balance is cleared, so those are what early_repayment_plan should
+        be given to reproduce a plan.
+        """
+        plans = np.atleast_2d(np.asarray(plans, dtype=float))
+        plan_count = len(plans)
+        principles, interests, payments, _ = self.mortgage.schedule
+        payment_months = len(principles)
+        periodic_interest_rate = self.mortgage.periodic_interest_rate
+        monthly_installment = float(self.mortgage.monthly_installment)
+        # Every plan shares the unmodified schedule up to the first anniversary.
+        start = 12
+        balance = np.full(plan_count, principles[start])
+        total_interest = np.full(plan_count, self.mortgage.cumulative_interest[start])
+        remaining_budget = np.full(plan_count, float(self.cash_budget))
+        overpaid = np.zeros((plan_count, self.overpayment_years))
+        percentages = np.zeros((plan_count, self.overpayment_years))
+        payoff_month = np.full(plan_count, payment_months)
+        for i in range(start, payment_months):
+            interest = balance * periodic_interest_rate
+            amount_due = balance + interest
+            year, anniversary = divmod(i, 12)
+            if anniversary == 0 and year <= self.overpayment_years:
+                early_repayment = np.minimum(plans[:, year - 1] * balance, remaining_budget)
+                payment = np.minimum(monthly_installment + early_repayment, amount_due)
+                # Only what the balance still needed counts as overpaid when this payment clears it.
+                overpaid[:, year - 1] = np.where(payment < amount_due, early_repayment,
+                                                 np.maximum(payment - monthly_installment, 0))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    percentages[:, year - 1] = np.where(balance > 0, overpaid[:, year - 1] / balance, 0)
+                remaining_budget -= overpaid[:, year - 1]
+            else:
+                payment = np.minimum(monthly_installment, amount_due)
+            if i == payment_months - 1:
+                payment = amount_due
+            payoff_month = np.where((payoff_month == payment_months) & (payment >= amount_due) & (balance > 0),
+                                    i + 1, payoff_month)
+            total_interest = total_interest + interest
+            balance = balance + interest - payment
+
+        cash_overpaid = overpaid.sum(axis=1)
+        # Each overpayment at month 12k + 1 is a top-up at the end of year k, left to grow to the end of the term.
+        invested = equityFutureValue(0, 1 / self.price_to_earnings, self.mortgage.length, overpaid,
+                                     annual_platform_fee=self.annual_platform_fee)
+        return {"Cash Overpaid": cash_overpaid, "Liquidity Kept": remaining_budget,
+                "Interest Saved": self.mortgage.cumulative_interest[-1] - total_interest,
+                "Investment Growth": invested - cash_overpaid, "Payoff Month": payoff_month,
+                "Percentages": percentages}
+
+    def search(self, candidate_count=10000, seed=None, batch_size=5000):
+        """
+        The frontier of interest saved against liquidity kept: every evaluated plan that saves more interest than
+        any plan keeping at least as much cash back, most liquid first. "Overpay Advantage" is the interest saved
+        less what the same cash would have grown by in the stock benchmark.
+        """
+        plans = self.candidate_plans(candidate_count, seed)
+        results = [self.evaluate(plans[start:start + batch_size]) for start in range(0, len(plans), batch_size)]
+        outcomes = pd.DataFrame({name: np.concatenate([result[name] for result in results])
+                                 for name in results[0] if name != "Percentages"})
+        outcomes["Overpay Advantage"] = outcomes["Interest Saved"] - outcomes["Investment Growth"]
+        outcomes["Plan"] = [self.early_repayment_plan(percentages)
+                            for result in results for percentages in result["Percentages"]]
+        outcomes = outcomes.sort_values(["Liquidity Kept", "Interest Saved"], ascending=[False, False],
+                                        kind="stable")
+        best_so_far = outcomes["Interest Saved"].cummax().shift(fill_value=-np.inf)
+        return outcomes[outcomes["Interest Saved"] > best_so_far].reset_index(drop=True)
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from assetreturns import Property, HLStock
+from valuation import internalRateOfReturn
+
+
+class Portfolio:
+    """
+    Holdings and candidates on one monthly timeline, months 0..years*12. Each asset is bought at the start of its
+    start_year and sold at the end of the timeline, at a shared annual_price_change_percentage.
+
+    Every asset's cash flows are split into CATEGORIES (money in +, out -) and kept, with its market value and
+    outstanding debt each month, as one row of (assets x ...) arrays. Aggregate equity, leverage, cash requirement
+    and returns are then single sums over the asset axis. Adding, replacing or removing an asset only evaluates that
+    asset; after changing an asset in place, call refresh(name).
+    """
+
+    CATEGORIES = ("Deposits", "Net Rent", "Mortgage Payments", "Contributions", "Sale Proceeds")
+
+    def __init__(self, years=25, annual_price_change_percentage=0.01):
+        self.years = years
+        self.annual_price_change_percentage = annual_price_change_percentage
+        self._names = []
+        self._assets = {}
+        self._start_years = {}
+        self._cash_flows = np.zeros((0, len(self.CATEGORIES), self.months))
+        self._values = np.zeros((0, self.months))
+        self._debts = np.zeros((0, self.months))
+
+    @property
+    def months(self):
+        return self.years * 12 + 1
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._assets
+
+    def __getitem__(self, name):
+        return self._assets[name]
+
+    def __setitem__(self, name, investment):
+        self.add(name, investment)
+
+    def __delitem__(self, name):
+        row = self._names.index(name)
+        keep = np.arange(len(self._names)) != row
+        self._cash_flows, self._values, self._debts = (self._cash_flows[keep], self._values[keep],
+                                                       self._debts[keep])
+        del self._names[row], self._assets[name], self._start_years[name]
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def add(self, name, investment, start_year=0):
+        """Adds an asset, or replaces the one with the same name, evaluating only it."""
+        if not 0 <= start_year < self.years:
+            raise ValueError(f"start_year must fall within the portfolio's {self.years} years")
+        self._assets[name] = investment
+        self._start_years[name] = start_year
+        cash_flows, values, debts = self._evaluate(investment, start_year)
+        if name in self._names:
+            row = self._names.index(name)
+            self._cash_flows[row], self._values[row], self._debts[row] = cash_flows, values, debts
+        else:
+            self._names.append(name)
+            self._cash_flows = np.concatenate([self._cash_flows, cash_flows[np.newaxis]])
+            self._values = np.concatenate([self._values, values[np.newaxis]])
+            self._debts = np.concatenate([self._debts, debts[np.newaxis]])
+
+    def refresh(self, name):
+        """Re-evaluates one asset after it was changed in place."""
+        self.add(name, self._assets[name], self._start_years[name])
+
+    def _evaluate(self, investment, start_year):
+        instrumentation.count("Portfolio asset evaluations")
+        years = self.years - start_year
+        months = np.arange(years * 12 + 1)
+        growth = self.annual_price_change_percentage
+        cash_flows = np.zeros((len(self.CATEGORIES), len(months)))
+        deposits, net_rent, mortgage_payments, contributions, sale_proceeds = cash_flows
+        debts = np.zeros(len(months))
+        sell_price = investment.buy_price * (1 + growth) ** years
+        if isinstance(investment, Property):
+            gross_rent, agency_fees, rental_tax, charges, payments = investment.ledger(years).columns[:, :len(months)]
+            net_rent[:] = gross_rent - agency_fees - rental_tax - charges
+            mortgage_payments[:] = -payments
+            deposits[0] = -(investment.initial_equity_cost + investment.buy_expenses
+                            + investment.mortgage.total_fees(0))
+            sale_proceeds[-1] = sell_price - investment.sell_expenses(sell_price, years)
+            debts[:] = investment.mortgage.outstanding_balance(months)
+            values = investment.buy_price * (1 + growth) ** (months / 12)
+        elif isinstance(investment, HLStock):
+            deposits[0] = -(investment.initial_equity_cost + investment.buy_expenses)
+            contributions[1:] = -investment.monthly_contribution
+            for year, topup in enumerate(investment.yearly_topups[:years], start=1):
+                contributions[year * 12] -= topup
+            sale_proceeds[-1] = (sell_price - investment.sell_expenses(sell_price, years)
+                                 + investment.calculate_profits(years))
+            # Earnings accrue a year at a time.
+            values = (investment.buy_price * (1 + growth) ** (months / 12)
+                      + investment.calculate_profits(months // 12))
+        else:
+            # Anything else only offers its net cash flows.
+            total = investment.monthly_cash_flows(years, growth)
+            deposits[0], net_rent[1:-1], sale_proceeds[-1] = total[0], total[1:-1], total[-1]
+            values = np.full(len(months), float(investment.buy_price))
+        # Nothing is held before the start year, or after the sale at the end of the timeline.
+        values = values.copy()
+        values[-1] = 0
+        debts[-1] = 0
+        offset = start_year * 12
+        shifted = np.zeros((len(self.CATEGORIES), self.months)), np.zeros(self.months), np.zeros(self.months)
+        shifted[0][:, offset:] = cash_flows
+        shifted[1][offset:] = values
+        shifted[2][offset:] = debts
+        return shifted
+
+    @property
+    def cash_flows(self):
+        """(categories x months) portfolio cash flows."""
+        return self._cash_flows.sum(axis=0)
+
+    def timeline(self):
+        """The portfolio month by month: cash flows by category, net and cumulative cash, value, debt and equity."""
+        cash_flows = self.cash_flows
+        net_cash_flows = cash_flows.sum(axis=0)
+        values = self._values.sum(axis=0)
+        debts = self._debts.sum(axis=0)
+        frame = pd.DataFrame(cash_flows.T, columns=list(self.CATEGORIES))
+        frame.insert(0, "Month", np.arange(self.months))
+        frame["Net Cash Flow"] = net_cash_flows
+        frame["Cumulative Cash"] = np.cumsum(net_cash_flows)
+        frame["Value"] = values
+        frame["Debt"] = debts
+        frame["Equity"] = values - debts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frame["Leverage"] = np.where(values > 0, debts / values, 0)
+        return frame
+
+    def summary(self):
+        """
+        Cash requirement (the most cash ever out of pocket at once), peak leverage, the net gain once everything is
+        sold, ROI on the cash requirement, and the annual IRR of the combined cash flows.
+        """
+        net_cash_flows = self.cash_flows.sum(axis=0)
+        cumulative_cash = np.cumsum(net_cash_flows)
+        cash_requirement = max(-cumulative_cash.min(initial=0), 0)
+        values = self._values.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            leverage = np.where(values > 0, self._debts.sum(axis=0) / values, 0)
+        net_gain = cumulative_cash[-1]
+        return {"Cash Requirement": cash_requirement, "Peak Leverage": leverage.max(initial=0),
+                "Net Gain": net_gain, "ROI": net_gain / cash_requirement if cash_requirement else np.nan,
+                "IRR": internalRateOfReturn(net_cash_flows) if len(self) else np.nan}
+
+    def asset_summary(self):
+        """Per asset: cash put in, net gain, ROI on it and IRR, all from the shared arrays in one pass."""
+        net_cash_flows = self._cash_flows.sum(axis=1)
+        cash_requirement = np.maximum(-np.cumsum(net_cash_flows, axis=1).min(axis=1, initial=0), 0)
+        net_gain = net_cash_flows.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            roi = net_gain / cash_requirement
+        return pd.DataFrame({"Asset Name": self._names, "Start Year": [self._start_years[name] for name in self._names],
+                             "Cash Requirement": cash_requirement, "Net Gain": net_gain, "ROI": roi,
+                             "IRR": internalRateOfReturn(net_cash_flows) if len(self) else []})
@@ -0,0 +1,170 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from assetreturns import annualisedReturn
+from assetreturns import generateLeaseholdPropertyForecast, mortgageFactory, TaxDeductibleMortgage, RepaymentMortgage
+
+
+HEADERS = ["Asset Name", "Initial Equity Cost", "Nominal ROI", "% ROI", "% ROI Year on Year", "Nominal Profit"]
+# Graph source columns and their types. "% ROI" is the change in percentage return over that year alone.
+GRAPH_COLUMNS = {"Asset Name": object, "Year": np.int64, "Nominal ROI": np.float64, "% ROI Year on Year": np.float64,
+                 "% ROI": np.float64, "Nominal Profit": np.float64}
+
+
+def assetColumns(investment, years_to_forecast=50, annual_price_change_percentage=0.01):
+    """An investment's graph source columns for years 1..years_to_forecast, all horizons in one vectorised pass."""
+    years = np.arange(1, years_to_forecast + 1)
+    nominal = np.broadcast_to(
+        investment.nominal_return_on_investment(years, annual_price_change_percentage, 0), years.shape)
+    percentage = nominal / investment.initial_equity_cost
+    return {"Year": years, "Nominal ROI": nominal, "% ROI Year on Year": annualisedReturn(percentage, years),
+            "% ROI": np.diff(percentage, prepend=0),
+            "Nominal Profit": np.broadcast_to(investment.profit_in_year(years), years.shape)}
+
+
+def summaryRow(asset_name, investment, years_to_forecast=50):
+    """The printed table's row: 25 year returns, and the profit in the last forecast year."""
+    return [asset_name, investment.initial_equity_cost, investment.nominal_return_on_investment(25, 0, 0),
+            investment.percentage_return_on_investment(25, 0.01, 0),
+            investment.annual_percentage_return_on_investment(25, 0.01, 0),
+            investment.profit_in_year(years_to_forecast)]
+
+
+def _graphFrame(asset_names, columns):
+    rows_per_asset = [len(asset_columns["Year"]) for asset_columns in columns]
+    frame = pd.DataFrame({"Asset Name": np.repeat(np.array(asset_names, dtype=object), rows_per_asset)})
+    for name, dtype in list(GRAPH_COLUMNS.items())[1:]:
+        frame[name] = np.concatenate([np.empty(0, dtype), *(asset_columns[name] for asset_columns in columns)])
+    return frame
+
+
+def streamReport(assets, years_to_forecast=50, annual_price_change_percentage=0.01, chunk_size=100):
+    """
+    The graph source in DataFrames of up to chunk_size assets each, one row per (asset, year). assets is a dictionary
+    of investments or any iterable of (name, investment) pairs, so a generator of assets is never held in memory all
+    at once.
+    """
+    asset_names, columns = [], []
+    for asset_name, investment in assets.items() if hasattr(assets, "items") else assets:
+        asset_names.append(asset_name)
+        columns.append(assetColumns(investment, years_to_forecast, annual_price_change_percentage))
+        if len(asset_names) == chunk_size:
+            yield _graphFrame(asset_names, columns)
+            asset_names, columns = [], []
+    if asset_names:
+        yield _graphFrame(asset_names, columns)
+
+
+def writeReport(assets, path, file_format="csv", **report_kwargs):
+    """
+    Streams the graph source to a CSV or Parquet (needs pyarrow) file chunk by chunk and returns the number of rows.
+    The file is written under a temporary name and renamed once complete.
+    """
+    temporary_path = path + ".partial"
+    rows = 0
+    if file_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet
+
+        writer = None
+        try:
+            for frame in streamReport(assets, **report_kwargs):
+                table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(temporary_path, table.schema)
+                writer.write_table(table)
+                rows += len(frame)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            _graphFrame([], []).to_parquet(temporary_path, index=False)
+    else:
+        with open(temporary_path, "w", newline="") as report_file:
+            for frame in streamReport(assets, **report_kwargs):
+                frame.to_csv(report_file, header=rows == 0, index=False)
+                rows += len(frame)
+            if rows == 0:
+                report_file.write(",".join(GRAPH_COLUMNS) + "\n")
+    os.replace(temporary_path, path)
+    return rows
+
+
+def reportChart(graph_source, y="Nominal ROI"):
+    """
+    One line per asset. graph_source is a DataFrame, or the path or URL of a CSV from writeReport, which the chart
+    then loads rather than embedding the rows.
+    """
+    import altair as alt
+
+    if isinstance(graph_source, str):
+        graph_source = alt.UrlData(graph_source, format=alt.CsvDataFormat(type="csv"))
+    return alt.Chart(graph_source).mark_line().encode(x="Year:Q", y=alt.Y(f"{y}:Q", title=y),
+                                                      color="Asset Name:N", strokeDash="Asset Name:N")
+
+
+def generateHeaderTableAndGraphSource(asset_dictionary, years_to_forecast=50):
+    table = [summaryRow(asset_name, investment, years_to_forecast)
+             for asset_name, investment in asset_dictionary.items()]
+    graph_source = pd.concat([_graphFrame([], []), *streamReport(asset_dictionary, years_to_forecast)],
+                             ignore_index=True)
+    return HEADERS, table, graph_source
+
+
+def examplePortfolio():
+    """The leaseholds the command line report compares."""
+    ltv_percentage = 0.75
+    interest_rate = 0.0259
+    asset_dictionary = {}
+    asset_dictionary["Cookham House"] = generateLeaseholdPropertyForecast(
+        True, 750000, ltv_percentage=ltv_percentage, monthly_gross_rental=700 + 700 * 3, rental_tax=0.45,
+        months_occupied_out_of_12=10, agency_percentage=.2, annual_service_charge=1500, annual_ground_rent=90,
+        mortgage_searcher=mortgageFactory, MortgageClass=TaxDeductibleMortgage,
+        MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2, length=25, interest_rate=interest_rate)
+
+    lixing_agency_percentage = (0.075 + 0.025) * 1.20
+    asset_dictionary["2 Bed 1 bath long and waterson"] = generateLeaseholdPropertyForecast(
+        True, 690000, ltv_percentage=ltv_percentage, monthly_gross_rental=625, rental_tax=0,
+        months_occupied_out_of_12=12, agency_percentage=lixing_agency_percentage, annual_service_charge=7 * 677,
+        annual_ground_rent=600, mortgage_searcher=mortgageFactory, MortgageClass=RepaymentMortgage, length=25,
+        interest_rate=interest_rate)
+
+    asset_dictionary["Heron - Studio"] = generateLeaseholdPropertyForecast(
+        True, 600000, ltv_percentage=ltv_percentage, monthly_gross_rental=0, rental_tax=0,
+        months_occupied_out_of_12=10, agency_percentage=0, annual_service_charge=3967, annual_ground_rent=300,
+        mortgage_searcher=mortgageFactory, MortgageClass=RepaymentMortgage, length=25, interest_rate=interest_rate)
+    return asset_dictionary
+
+
+# TODO model typical stocks, BRK.A / Index funds?
+# What interest rate (or rent, price, growth) a given property becomes not worth it: see breakeven.solveBreakEven.
+# Double check profit and loss maths are correct
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Returns table for the example portfolio.")
+    parser.add_argument("--output", metavar="PATH", help="also stream the graph source to a .csv or .parquet file")
+    parser.add_argument("--chart", metavar="PATH", help="also write the Nominal ROI chart to an HTML file")
+    arguments = parser.parse_args(argv)
+
+    asset_dictionary = examplePortfolio()
+    print(tabulate([summaryRow(asset_name, investment) for asset_name, investment in asset_dictionary.items()],
+                   HEADERS, tablefmt="presto"))
+    if arguments.output:
+        writeReport(asset_dictionary, arguments.output,
+                    "parquet" if arguments.output.endswith(".parquet") else "csv")
+    if arguments.chart:
+        if arguments.output and arguments.output.endswith(".csv"):
+            # Reference the CSV next to the chart rather than embedding its rows.
+            graph_source = os.path.relpath(arguments.output, os.path.dirname(os.path.abspath(arguments.chart)))
+        else:
+            graph_source = pd.concat(streamReport(asset_dictionary), ignore_index=True)
+        reportChart(graph_source).properties(width=700, height=700).save(arguments.chart)
+
+
+if __name__ == "__main__":
+    main()
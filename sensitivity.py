@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from assetreturns import generateLeaseholdPropertyForecast
+from breakeven import GROWTH, MortgageMemo
+
+BUMPS = {
+    "interest_rate": 0.0025,
+    GROWTH: 0.01,
+    "monthly_gross_rental": 50,
+    "months_occupied_out_of_12": 1,
+    "annual_service_charge": 500,
+}
+# Inputs the mortgage searcher never sees, so bumping them keeps the base forecast's mortgage as it is.
+RENTAL_INPUTS = ("rental_tax", "months_occupied_out_of_12", "agency_percentage", "annual_service_charge",
+                 "annual_ground_rent")
+BOUNDS = {"months_occupied_out_of_12": (0, 12)}
+
+
+def sensitivities(scenarios, years=(5, 10, 25), bumps=BUMPS, forecast_factory=generateLeaseholdPropertyForecast,
+                  metric="percentage", annual_price_change_percentage=0.01):
+    """
+    How far each asset's return moves when one input is bumped down and up by its step, at every horizon in years.
+
+    scenarios maps asset names to forecast_factory kwargs; bumps maps any of those kwargs, or
+    "annual_price_change_percentage", to its step (by default 0.25% on the rate, 1% on growth, £50 of rent, one
+    month of occupancy and £500 of service charge). Inputs a scenario doesn't have are left out, and bounded inputs
+    are clipped. metric is "nominal", "percentage" or "annual_percentage".
+
+    One row per (asset, horizon, input) ready for a tornado chart: Low and High are the returns with the input
+    stepped down and up, Sensitivity the change in return per step (a central difference) and Swing the width of the
+    bar; rows come biggest swing first within each asset and year.
+
+    Bumps to rental inputs reuse the base forecast's mortgage and growth bumps reuse the base forecast itself, so only
+    rate and rent bumps go back through the mortgage searcher, and identical loans it produces are shared.
+    """
+    years = np.asarray(years)
+    surface = f"{metric}_return_surface"
+    frames = []
+    for asset_name, scenario in scenarios.items():
+        scenario = dict(scenario)
+        if "mortgage_searcher" in scenario:
+            scenario["mortgage_searcher"] = MortgageMemo().wrap(scenario["mortgage_searcher"])
+        base = forecast_factory(**scenario)
+        growth_step = bumps.get(GROWTH, 0)
+        growths = [annual_price_change_percentage - growth_step, annual_price_change_percentage,
+                   annual_price_change_percentage + growth_step]
+        low_growth, base_returns, high_growth = getattr(base, surface)(years, growths)
+        rows = []
+        for name, step in bumps.items():
+            if name == GROWTH:
+                low_value, high_value = growths[0], growths[2]
+                low_returns, high_returns = low_growth, high_growth
+            elif name in scenario:
+                low_value, high_value = np.clip([scenario[name] - step, scenario[name] + step],
+                                                *BOUNDS.get(name, (-np.inf, np.inf)))
+                bumped = dict(scenario)
+                if name in RENTAL_INPUTS and "mortgage_searcher" in scenario:
+                    bumped["mortgage_searcher"] = lambda *args, **kwargs: base.mortgage
+                low_returns, high_returns = (
+                    getattr(forecast_factory(**{**bumped, name: value}), surface)(
+                        years, [annual_price_change_percentage])[0]
+                    for value in (low_value, high_value))
+            else:
+                continue
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sensitivity = (high_returns - low_returns) / (high_value - low_value) * step
+            rows.append(pd.DataFrame({"Asset Name": asset_name, "Year": years, "Input": name, "Step": step,
+                                      "Base": base_returns, "Low": low_returns, "High": high_returns,
+                                      "Sensitivity": sensitivity, "Swing": np.abs(high_returns - low_returns)}))
+        frame = pd.concat(rows, ignore_index=True)
+        frames.append(frame.sort_values(["Year", "Swing"], ascending=[True, False], kind="stable"))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from assetreturns import generateLeaseholdPropertyForecast
+
+
+def _describe(value):
+    # Stable text for fingerprinting sweep definitions; classes and functions by name rather than id.
+    if hasattr(value, "__qualname__"):
+        return f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+    if isinstance(value, dict):
+        return {key: _describe(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_describe(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _evaluateShard(forecast_factory, fixed_kwargs, parameter_names, parameter_values, indices, years,
+                   annual_price_change_percentage):
+    grid_shape = [len(values) for values in parameter_values]
+    points = np.unravel_index(indices, grid_shape)
+    years = np.asarray(years)
+    growth = [annual_price_change_percentage]
+    rows = []
+    for point in zip(*points):
+        scenario = {name: values[i] for name, values, i in zip(parameter_names, parameter_values, point)}
+        forecast = forecast_factory(**fixed_kwargs, **scenario)
+        initial_equity_cost = forecast.initial_equity_cost
+        nominal_returns = forecast.nominal_return_surface(years, growth)[0]
+        rows.append([*scenario.values(), initial_equity_cost, nominal_returns,
+                     nominal_returns / initial_equity_cost, forecast.annual_percentage_return_surface(years, growth)[0]])
+    columns = [*parameter_names, "Initial Equity Cost", "Nominal ROI", "% ROI", "% ROI Year on Year"]
+    # One row per (scenario, year); scalar columns repeat across the horizons.
+    frame = pd.DataFrame(rows, columns=columns).explode(["Nominal ROI", "% ROI", "% ROI Year on Year"])
+    frame.insert(len(parameter_names), "Year", np.tile(years, len(rows)))
+    return frame.astype({"Nominal ROI": float, "% ROI": float, "% ROI Year on Year": float}).reset_index(drop=True)
+
+
+class ScenarioSweep:
+    """
+    Evaluates a forecast factory over the cartesian grid of parameter_ranges, e.g.
+
+        ScenarioSweep({"interest_rate": rates, "ltv_percentage": ltvs, "monthly_gross_rental": rents},
+                      fixed_kwargs=dict(is_second_property=True, principle=690000, ...))
+
+    Each grid point calls forecast_factory(**fixed_kwargs, **point) and records returns at every horizon in years,
+    one row per (point, year). The grid is split into fixed shards of shard_size points which can run on a process
+    pool. With an output_directory every finished shard is written to its own file straight away, so memory stays
+    bounded and an interrupted sweep resumes from the shards that are missing.
+    """
+
+    def __init__(self, parameter_ranges, fixed_kwargs, forecast_factory=generateLeaseholdPropertyForecast,
+                 years=(5, 10, 25), annual_price_change_percentage=0.01, shard_size=1000):
+        self.parameter_names = list(parameter_ranges)
+        self.parameter_values = [list(values) for values in parameter_ranges.values()]
+        self.fixed_kwargs = fixed_kwargs
+        self.forecast_factory = forecast_factory
+        self.years = list(years)
+        self.annual_price_change_percentage = annual_price_change_percentage
+        self.shard_size = shard_size
+
+    @property
+    def point_count(self):
+        return int(np.prod([len(values) for values in self.parameter_values]))
+
+    @property
+    def shard_count(self):
+        return -(-self.point_count // self.shard_size)
+
+    def _shard_indices(self, shard):
+        return np.arange(shard * self.shard_size, min((shard + 1) * self.shard_size, self.point_count))
+
+    def fingerprint(self, file_format="parquet"):
+        definition = json.dumps(_describe({
+            "parameters": dict(zip(self.parameter_names, self.parameter_values)),
+            "fixed_kwargs": self.fixed_kwargs,
+            "forecast_factory": self.forecast_factory,
+            "years": self.years,
+            "annual_price_change_percentage": self.annual_price_change_percentage,
+            "shard_size": self.shard_size,
+            "file_format": file_format,
+        }), sort_keys=True, default=repr)
+        return hashlib.sha256(definition.encode()).hexdigest()
+
+    def _shard_path(self, output_directory, shard, file_format):
+        return os.path.join(output_directory, f"shard-{shard:06d}.{file_format}")
+
+    def _prepare_output(self, output_directory, file_format):
+        os.makedirs(output_directory, exist_ok=True)
+        manifest_path = os.path.join(output_directory, "sweep.json")
+        fingerprint = self.fingerprint(file_format)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest["fingerprint"] != fingerprint:
+                raise ValueError(f"{output_directory} holds a different sweep; use a new directory to start over")
+        else:
+            with open(manifest_path, "w") as manifest_file:
+                json.dump({"fingerprint": fingerprint, "shard_count": self.shard_count,
+                           "point_count": self.point_count}, manifest_file)
+
+    def _write_shard(self, frame, path, file_format):
+        # Written under a temporary name and renamed, so a shard file only exists once it is complete.
+        temporary_path = path + ".partial"
+        if file_format == "parquet":
+            frame.to_parquet(temporary_path, index=False)
+        else:
+            frame.to_csv(temporary_path, index=False)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def _read_shard(path, file_format):
+        return pd.read_parquet(path) if file_format == "parquet" else pd.read_csv(path)
+
+    def run(self, output_directory=None, file_format="parquet", processes=None, progress=None, collect=True):
+        """
+        Evaluates every shard not already on disk and returns the whole sweep as one DataFrame in grid order.
+        progress, if given, is called as progress(completed_shards, shard_count) after each shard.
+        file_format is "parquet" (needs pyarrow) or "csv". Pass collect=False to leave a large sweep on disk.
+        """
+        pending = list(range(self.shard_count))
+        if output_directory is not None:
+            self._prepare_output(output_directory, file_format)
+            pending = [shard for shard in pending
+                       if not os.path.exists(self._shard_path(output_directory, shard, file_format))]
+        completed = self.shard_count - len(pending)
+        if progress is not None:
+            progress(completed, self.shard_count)
+
+        frames = {}
+
+        def finish(shard, frame):
+            nonlocal completed
+            if output_directory is None:
+                frames[shard] = frame
+            else:
+                self._write_shard(frame, self._shard_path(output_directory, shard, file_format), file_format)
+            completed += 1
+            if progress is not None:
+                progress(completed, self.shard_count)
+
+        arguments = (self.forecast_factory, self.fixed_kwargs, self.parameter_names, self.parameter_values)
+        shard_arguments = (self.years, self.annual_price_change_percentage)
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = {executor.submit(_evaluateShard, *arguments, self._shard_indices(shard), *shard_arguments):
+                           shard for shard in pending}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+        else:
+            for shard in pending:
+                finish(shard, _evaluateShard(*arguments, self._shard_indices(shard), *shard_arguments))
+
+        if output_directory is None:
+            results = [frames[shard] for shard in range(self.shard_count)]
+        elif not collect:
+            return None
+        else:
+            results = [self._read_shard(self._shard_path(output_directory, shard, file_format), file_format)
+                       for shard in range(self.shard_count)]
+        return pd.concat(results, ignore_index=True)
+
+
+def printProgress(completed_shards, shard_count):
+    print(f"\r{completed_shards}/{shard_count} shards", end="\n" if completed_shards == shard_count else "", flush=True)
@@ -0,0 +1,44 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from allocation import AllocationOptimizer, propertyCandidate, stockCandidate
+from assetreturns import BTLmortgageFactory, RepaymentMortgage
+
+
+def _candidates():
+    candidates = {}
+    for i, (price, rent) in enumerate([(250000, 1200), (400000, 1500), (180000, 1000), (550000, 2600)]):
+        candidates[f"Flat {i}"] = propertyCandidate(
+            [0.5, 0.6, 0.75], is_second_property=True, principle=price, monthly_gross_rental=rent, rental_tax=0.4,
+            months_occupied_out_of_12=11, agency_percentage=0.1, annual_service_charge=1500, annual_ground_rent=200,
+            mortgage_searcher=BTLmortgageFactory, MortgageClass=RepaymentMortgage, length=25, interest_rate=0.0459)
+    candidates["Stocks"] = stockCandidate(range(25000, 100001, 25000))
+    return candidates
+
+
+def test_best_mixes_match_exhaustive_search():
+    optimizer = AllocationOptimizer(_candidates(), years=10)
+    result = optimizer.optimise(500000, horizon_years=10, runner_ups=3)
+    returns = optimizer.return_curves[:, 9]
+    affordable = np.ceil(optimizer.cash_required / 1000) * 1000
+    totals = sorted((returns[list(mix)].sum() for mix in (
+        [option for option in combination if option is not None]
+        for combination in itertools.product(*[[None, *range(start, stop)] for start, stop in
+                                               zip(optimizer._offsets[:-1], optimizer._offsets[1:])]))
+        if affordable[list(mix)].sum() <= 500000), reverse=True)
+    assert np.allclose(result["Nominal ROI"], totals[:4])
+    assert result["Nominal ROI"].is_monotonic_decreasing and len(result) == 4
+    assert (result["Capital Left"] >= 0).all()
+    assert len({tuple(holdings.items()) for holdings in result["Holdings"]}) == 4
+    with pytest.raises(ValueError):
+        optimizer.optimise(500000, horizon_years=11)
+
+
+def test_process_pool_matches_serial_evaluation():
+    serial = AllocationOptimizer(_candidates(), years=5)
+    pooled = AllocationOptimizer(_candidates(), years=5, processes=2, chunk_size=4)
+    assert np.array_equal(serial.return_curves, pooled.return_curves)
+    assert np.array_equal(serial.cash_required, pooled.cash_required)
+    assert serial.options()["Option"].tolist()[:3] == ["50% LTV", "60% LTV", "75% LTV"]
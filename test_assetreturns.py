@@ -2,9 +2,23 @@ from assetreturns import calculateSDLT, generatePropertyForecast, InterestOnlyMo
 from assetreturns import calculateCapitalGains
 from assetreturns import RepaymentMortgage
 from assetreturns import TaxDeductibleMortgage
-from assetreturns import Property
-from assetreturns import mortgageFactory
+from assetreturns import Property, LeaseholdProperty
+from assetreturns import mortgageFactory, BTLmortgageFactory, BTLmaxPrinciple, Mortgage
+from assetreturns import _mortgageFactory
 from assetreturns import HLStock
+from assetreturns import recurrenceSchedule, closedFormSchedule
+from assetreturns import MortgageBatch
+from assetreturns import loadTaxYears
+from assetreturns import AbstractMortgage, ScheduleCache
+from assetreturns import equityFutureValue, stockBenchmarkReturns
+from assetreturns import VariableRateMortgage, _segmentedSchedule
+from assetreturns import RefinanceChain
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+import numpy as np
 interest_rate = 0.0187
 interest_rate = 0.0359
 def test_calculateSDLT():
@@ -28,6 +42,26 @@ def test_calculateSDLT():
     # First-time buyer relief doesn't apply to second properties
     assert calculateSDLT(True, 300000, is_first_time_buyer=True) == calculateSDLT(True, 300000)
 
+def test_calculateSDLT_vectorised_and_versioned(tmp_path):
+    prices = np.array([100000, 125000, 200000, 300000, 400000, 500000, 600000, 2000000])
+    for second_property, is_first_time_buyer in [(False, False), (True, False), (False, True)]:
+        expected = [calculateSDLT(second_property, price, is_first_time_buyer) for price in prices]
+        assert np.allclose(calculateSDLT(second_property, prices, is_first_time_buyer), expected, rtol=0, atol=1e-9)
+    # Before April 2025: £250k nil band, 3% surcharge and first-time buyer relief up to £625k.
+    assert calculateSDLT(False, 300000, tax_year="2023-24") == 2500
+    assert calculateSDLT(True, 200000, tax_year="2023-24") == 6000
+    assert calculateSDLT(False, 600000, is_first_time_buyer=True, tax_year="2023-24") == 8750
+    assert calculateCapitalGains(True, 20000, tax_year="2025-26") == 4080
+
+    tax_years = tmp_path / "tax_years.json"
+    tax_years.write_text(json.dumps({"flat": {
+        "sdlt": {"thresholds": [0], "rates": [0.01], "additional_property_surcharge": 0.01,
+                 "first_time_buyer_thresholds": [0], "first_time_buyer_rates": [0], "first_time_buyer_max_price": 0},
+        "capital_gains": {"allowance": 0, "property_rate": 0.1, "other_rate": 0.1}}}))
+    loadTaxYears(tax_years)
+    assert calculateSDLT(True, 100000, tax_year="flat") == 2000
+    assert calculateCapitalGains(False, 1000, tax_year="flat") == 100
+
 def test_RepaymentMortgage():
     mortgage = RepaymentMortgage(75000, 25, interest_rate)
     assert mortgage.total_interest(25) == 38029.8398044053
@@ -102,9 +136,345 @@ def test_total_principle_paid():
     assert repayment_mortgage.total_payments(25) == 579974
 
 
+def test_closed_form_schedule_matches_recurrence():
+    early_repayments = {1 * 12: 0.1, 2 * 12: 0.1, 3 * 12: 0.1, 4 * 12: 1}
+    for args in [(372000, 300, 0.00294, 1900.0, {}), (372000, 300, 0.0008, 1400.0, early_repayments),
+                 (100000, 120, 0.0, 900.0, {60: 0.5})]:
+        for exact, closed_form in zip(recurrenceSchedule(*args), closedFormSchedule(*args)):
+            assert np.allclose(exact, closed_form, rtol=1e-9, atol=1e-6)
+
+
+def test_closed_form_mortgage_engine():
+    class ClosedFormRepaymentMortgage(RepaymentMortgage):
+        schedule_engine = staticmethod(closedFormSchedule)
+
+    mortgage = ClosedFormRepaymentMortgage(372000, 25, interest_rate)
+    assert abs(mortgage.total_interest(25) - 188628.00542985174) < 1e-6
+    assert abs(mortgage.total_principle_paid(25) - 372000) < 1e-6
+    property_forecast = Property(True, 400000, mortgage, monthly_gross_rental=1500, rental_tax=0.45,
+                                 months_occupied_out_of_12=10, agency_percentage=.2)
+    exact_property = Property(True, 400000, RepaymentMortgage(372000, 25, interest_rate), monthly_gross_rental=1500,
+                              rental_tax=0.45, months_occupied_out_of_12=10, agency_percentage=.2)
+    assert abs(property_forecast.sell_expenses(400000, 10) - exact_property.sell_expenses(400000, 10)) < 1e-6
+
+
+def test_mortgage_batch_matches_single_mortgages():
+    early_repayments = {1 * 12: 0.1, 2 * 12: 0.1, 3 * 12: 0.1, 4 * 12: 1}
+    batch = MortgageBatch([372000, 75000, 100000], [25, 25, 10], [0.01, interest_rate, 0.03],
+                          [early_repayments, None, None], interest_only=[False, False, True])
+    mortgages = [RepaymentMortgage(372000, 25, 0.01, early_repayments), RepaymentMortgage(75000, 25, interest_rate),
+                 InterestOnlyMortgage(100000, 10, 0.03)]
+    for years in [1, 5, 25]:
+        assert list(batch.total_interest(years)) == [mortgage.total_interest(years) for mortgage in mortgages]
+        assert list(batch.total_payments(years)) == [mortgage.total_payments(years) for mortgage in mortgages]
+    assert batch.total_interest(25)[0] == 11797.1536295663
+    assert np.array_equal(batch.total_principle_paid(np.array([1, 5, 25])),
+                          [mortgage.total_principle_paid(np.array([1, 5, 25])) for mortgage in mortgages])
+    assert batch.balances.shape == (3, 300)
+    assert list(batch.balance_at(120)) == [0, mortgages[1].payment_table.loc[119, "Principle"]
+                                           + mortgages[1].payment_table.loc[119, "Interest"]
+                                           - mortgages[1].payment_table.loc[119, "Payment"], 0]
+    assert batch.payment_table(2).equals(mortgages[2].payment_table)
+
+
+def test_lazy_schedule_and_cumulative_totals():
+    mortgage = TaxDeductibleMortgage(0.2, RepaymentMortgage, 372000, 25, interest_rate)
+    assert mortgage.wrapped_mortgage._schedule is None
+    assert mortgage.monthly_installment == mortgage.wrapped_mortgage.monthly_installment
+    assert mortgage.wrapped_mortgage._schedule is None
+    assert mortgage.total_interest(25) == 150902.40434388138
+    assert mortgage.cumulative_interest is mortgage.wrapped_mortgage.cumulative_interest
+    assert len(mortgage.cumulative_payments) == 25 * 12 + 1
+    assert mortgage.total_payments(0) == 0
+    assert mortgage.total_payments(50) == mortgage.total_payments(25)
+    assert RepaymentMortgage(372000, 25, 0.01, {12: 0.1}).total_early_repayments(2) == 0.1 * RepaymentMortgage(
+        372000, 25, 0.01, {12: 0.1}).payment_table.loc[11, "Principle"]
+
+
+def test_compact_payment_schedule():
+    mortgage = TaxDeductibleMortgage(0.2, RepaymentMortgage, 372000, 25, interest_rate)
+    schedule = mortgage.schedule
+    principles, interests, payments, early_repayments = schedule
+    assert schedule.columns.shape == (4, 300) and not schedule.columns.flags.writeable
+    assert not hasattr(mortgage.wrapped_mortgage, "__dict__")
+
+    payment_table = mortgage.payment_table
+    assert list(payment_table.columns) == ["Principle", "Interest", "Payment", "Early Repayment"]
+    assert np.shares_memory(payment_table["Interest"].to_numpy(), interests)
+    assert payment_table["Interest"].sum() == interests.sum()
+
+    forecast = Property(True, 400000, mortgage, monthly_gross_rental=1500, rental_tax=0.45,
+                        months_occupied_out_of_12=10, agency_percentage=.2)
+    row = payment_table.loc[59]
+    assert forecast.sell_expenses(450000, 5) == (calculateCapitalGains(True, 50000) + 4000
+                                                 + row["Principle"] + row["Interest"] - row["Payment"])
+
+
+def test_mortgage_memory_footprint():
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    mortgages = [RepaymentMortgage(372000 + i, 25, interest_rate) for i in range(200)]
+    for mortgage in mortgages:
+        mortgage.total_interest(25)
+        mortgage.payment_table
+    per_mortgage = (tracemalloc.get_traced_memory()[0] - before) / len(mortgages)
+    tracemalloc.stop()
+    # Within 10% of the float64 schedule and prefix sums themselves.
+    assert per_mortgage < 1.1 * (4 * 300 + 3 * 301) * 8
+
+
+def test_schedule_cache(tmp_path, monkeypatch):
+    cache = ScheduleCache(tmp_path)
+    monkeypatch.setattr(AbstractMortgage, "schedule_cache", cache)
+    mortgage = BTLmortgageFactory(RepaymentMortgage, 3000, 496000, 0.75, length=25, interest_rate=interest_rate,
+                                  early_repayment_months_and_amount={12: 0.1})
+    same_mortgage = RepaymentMortgage(mortgage.principle, 25, interest_rate, {12: 0.1})
+    assert same_mortgage.total_interest(25) == mortgage.total_interest(25)
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 1
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+    # A fresh process-level cache over the same directory memory-maps the stored schedule.
+    monkeypatch.setattr(AbstractMortgage, "schedule_cache", ScheduleCache(tmp_path))
+    reloaded = RepaymentMortgage(mortgage.principle, 25, interest_rate, {12: 0.1})
+    assert isinstance(reloaded.schedule.columns.base, np.memmap)
+    assert reloaded.total_interest(25) == mortgage.total_interest(25)
+    assert reloaded.payment_table.equals(mortgage.payment_table)
+    assert AbstractMortgage.schedule_cache.stats["disk_hits"] == 1
+
+    # Least recently used schedules go first once the cache is over its size.
+    small_cache = ScheduleCache(max_bytes=2 * 4 * 300 * 8)
+    monkeypatch.setattr(AbstractMortgage, "schedule_cache", small_cache)
+    for principle in [100000, 200000, 100000, 300000, 200000]:
+        RepaymentMortgage(principle, 25, interest_rate).schedule
+    assert small_cache.stats["entries"] == 2 and small_cache.stats["hits"] == 1 and small_cache.stats["misses"] == 4
+
+
+def test_property_ledger():
+    mortgage = TaxDeductibleMortgage(0.2, RepaymentMortgage, 75000, 25, interest_rate)
+    flat = Property(True, 100000, mortgage, monthly_gross_rental=750, rental_tax=0.45, months_occupied_out_of_12=10,
+                    agency_percentage=.2)
+    years = np.arange(0, 31)
+    ledger = flat.ledger()
+    assert ledger.years == 50 and flat.ledger(30) is ledger
+    assert np.allclose(ledger.net_rent(years) - mortgage.total_fees(years), flat.calculate_profits(years),
+                       rtol=1e-12, atol=1e-6)
+    assert list(flat.profit_in_year([1, 2, 30])) == [flat.calculate_profits(1),
+                                                     flat.calculate_profits(2) - flat.calculate_profits(1),
+                                                     flat.calculate_profits(30) - flat.calculate_profits(29)]
+    assert flat.ledger(60).years == 100
+
+    growing = LeaseholdProperty(True, 100000, mortgage, monthly_gross_rental=750, rental_tax=0.45,
+                                months_occupied_out_of_12=10, agency_percentage=.2, annual_service_charge=1200,
+                                annual_ground_rent=0, annual_rent_growth=0.03, void_months=[1, 7],
+                                annual_charge_indexation=0.05)
+    ledger = growing.ledger()
+    assert np.isclose(ledger.in_year("Gross Rent", 3), 750 * 1.03 ** 2 * 10)
+    assert ledger.columns[0, 1] == 0 and ledger.columns[0, 7] == 0 and ledger.columns[0, 13] == 0
+    assert np.isclose(ledger.in_year("Charges", 2), 1200 * 1.05)
+    assert np.isclose(ledger.in_year("Agency Fees", 3), 0.2 * ledger.in_year("Gross Rent", 3))
+    assert ledger.to_frame().shape == (50 * 12 + 1, 5)
+    # Rent growth is read from the ledger built once, not recomputed per call.
+    assert np.isclose(growing.calculate_profits(10), flat.calculate_profits(10) - ledger.total("Charges", 10) + (
+            ledger.net_rent(10) - 750 * 10 * 10 * (1 - 0.2 - 0.45)))
+    assert np.isclose(ledger.total("Charges", 10), 1200 * (1.05 ** 10 - 1) / 0.05)
+    assert growing.ledger() is ledger
+    assert np.array_equal(growing.monthly_cash_flows(5, 0)[1:60], ledger.net_cash_flows()[1:60])
+
+
+def test_btl_mortgage_factory_vectorised():
+    rents = np.array([800, 1500, 3000])
+    prices = np.array([200000, 300000, 400000])
+    principles = BTLmaxPrinciple(RepaymentMortgage, rents, prices, 0.75, length=25, interest_rate=0.03)
+    for rent, price, principle in zip(rents, prices, principles):
+        mortgage = BTLmortgageFactory(RepaymentMortgage, rent, price, 0.75, length=25, interest_rate=0.03)
+        assert mortgage.principle == principle
+        # The stress test binds for the lower rents; the top one is capped by LTV.
+        assert RepaymentMortgage(principle, 25, 0.05).monthly_installment < rent / 1.4 + 0.01
+    assert principles[2] == BTLmortgageFactory(TaxDeductibleMortgage, 3000, 400000, 0.75, tax_rate=0.2,
+                                               MortgageClassToDecorate=RepaymentMortgage, length=25,
+                                               interest_rate=0.03).principle
+
+
+def test_mortgage_factory_root_finding_fallback():
+    class PlainRepaymentMortgage(Mortgage):
+        def __init__(self, principle, length, interest_rate):
+            self._principle = principle
+            self.monthly_installment = RepaymentMortgage(principle, length, interest_rate).monthly_installment
+
+    for rent in [800, 1500, 3000]:
+        assert BTLmortgageFactory(PlainRepaymentMortgage, rent, 400000, 0.75, length=25,
+                                  interest_rate=0.03).principle == BTLmortgageFactory(
+            RepaymentMortgage, rent, 400000, 0.75, length=25, interest_rate=0.03).principle
+
+
+def test_mortgage_factory_terminates_when_floor_matches_installment():
+    floor = RepaymentMortgage(50000, 25, 0.05).monthly_installment
+    mortgage = _mortgageFactory(RepaymentMortgage, floor, 0, 100000, length=25, interest_rate=0.03)
+    assert abs(mortgage.principle - 50000) <= 2
+
+
+def test_return_surfaces_match_scalar_calls():
+    mortgage = TaxDeductibleMortgage(0.2, RepaymentMortgage, 75000, 10, interest_rate)
+    assets = [Property(True, 100000, mortgage, monthly_gross_rental=750, rental_tax=0.45,
+                       months_occupied_out_of_12=10, agency_percentage=.2),
+              LeaseholdProperty(True, 100000, mortgage, monthly_gross_rental=750, rental_tax=0.45,
+                                months_occupied_out_of_12=10, agency_percentage=.2, annual_service_charge=1500,
+                                annual_ground_rent=90),
+              HLStock(200000, 21.73, [1000, 2000])]
+    years = np.arange(1, 16)
+    growth_rates = np.array([-0.05, 0, 0.01, 0.03])
+    for asset in assets:
+        for surface, scalar in [(asset.nominal_return_surface, asset.nominal_return_on_investment),
+                                (asset.percentage_return_surface, asset.percentage_return_on_investment),
+                                (asset.annual_percentage_return_surface,
+                                 asset.annual_percentage_return_on_investment)]:
+            expected = [[scalar(int(year), growth_rate, 0) for year in years] for growth_rate in growth_rates]
+            assert surface(years, growth_rates).shape == (4, 15)
+            assert np.allclose(surface(years, growth_rates), expected, rtol=1e-12, atol=1e-9)
+
+
+def test_mortgage_batch_interest_rate_paths():
+    constant = MortgageBatch([372000], [25], [0.03], interest_rate_paths=np.full(300, 0.03))
+    assert constant.total_interest(25)[0] == RepaymentMortgage(372000, 25, 0.03).total_interest(25)
+    fixed_then_reverting = MortgageBatch([372000], [25], [0.03],
+                                         interest_rate_paths=np.r_[np.full(60, 0.03), np.full(240, 0.05)])
+    remortgage = RepaymentMortgage(fixed_then_reverting.balances[0, 60], 20, 0.05)
+    assert np.allclose(fixed_then_reverting.payments[0, 61:], remortgage.payment_table["Payment"][1:])
+    assert fixed_then_reverting.balance_at(300)[0] == 0
+
+
 #TODO build factory that generates mortgage based on monthly_gross_rental, and property value, and uses it to create a property.
 
 #print(Mortgage(75000, 25, 0.02).total_interest)
 #taxDeductibleMortgage = TaxDeductibleMortgage(75000, 25, 0.02, 0.2)
 #print(taxDeductibleMortgage.total_interest)
-#property = Property(True, 100000, taxDeductibleMortgage, monthly_gross_rental=800, rental_tax=0.45, months_occupied_out_of_12=8, agency_percentage=0.2) 
+#property = Property(True, 100000, taxDeductibleMortgage, monthly_gross_rental=800, rental_tax=0.45, months_occupied_out_of_12=8, agency_percentage=0.2)
+
+
+def test_core_import_skips_reporting_dependencies():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, assetreturns; print(sorted(set(sys.modules) & "
+                               "{'pandas', 'altair', 'tabulate', 'numpy_financial', 'report'}))"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert loaded.strip() == "[]"
+
+
+def test_vectorised_equity_model():
+    # The year by year loop HLStock used to run.
+    def loop(stock_value, price_to_earnings, yearly_topups, years):
+        future_value = stock_value
+        for year in range(1, years + 1):
+            future_value = future_value * (1 + 1.0 / price_to_earnings)
+            if len(yearly_topups) >= year:
+                future_value += yearly_topups[year - 1]
+        return future_value
+
+    years = np.arange(1, 41)
+    assert np.array_equal(HLStock(200000, 21.73).calculate_profits(years),
+                          [loop(200000, 21.73, [], year) - 200000 for year in years])
+    topups = [1000, 2000, 500] * 5
+    assert np.allclose(HLStock(50000, 15, topups).calculate_profits(years),
+                       [loop(50000, 15, topups, year) - 50000 for year in years], rtol=1e-14)
+
+    # Monthly contributions and the platform fee compound month by month at the net annual rate.
+    monthly_growth = ((1 + 1 / 20) * (1 - 0.0045)) ** (1 / 12)
+    value = 100000
+    for month in range(120):
+        value = value * monthly_growth + 250
+    assert np.isclose(equityFutureValue(100000, 1 / 20, 10, monthly_contribution=250, annual_platform_fee=0.0045),
+                      value, rtol=1e-12)
+    stock = HLStock(100000, 20, monthly_contribution=250)
+    assert np.isclose(stock.monthly_cash_flows(10, 0).sum(), stock.nominal_return_on_investment(10, 0, 0) - 30000)
+
+    price_to_earnings = np.array([10, 21.73, 40])
+    returns = stockBenchmarkReturns(200000, price_to_earnings, years, 0.01, topups)
+    assert returns.shape == (3, 40)
+    for row, pe in zip(returns, price_to_earnings):
+        assert np.allclose(row, HLStock(200000, pe, topups).nominal_return_on_investment(years, 0.01, 0), rtol=1e-14)
+
+
+def test_variable_rate_mortgage():
+    fixed = VariableRateMortgage(300000, 25, [(None, 0.0359)])
+    assert np.array_equal(fixed.schedule.columns, RepaymentMortgage(300000, 25, 0.0359).schedule.columns)
+
+    two_year_fix = VariableRateMortgage(300000, 25, [(24, 0.045), (None, 0.0799)], product_fees=999)
+    assert two_year_fix.segments == ((24, 0.045), (276, 0.0799))
+    principles, interests, payments, _ = two_year_fix.schedule
+    # The payment is reset at the reversion to repay what is left over the remaining 23 years.
+    assert np.allclose(payments[1:24], RepaymentMortgage(300000, 25, 0.045).monthly_installment)
+    reverted = RepaymentMortgage(principles[24], 23, 0.0799)
+    assert np.allclose(payments[24:-1], reverted.monthly_installment)
+    assert np.isclose(two_year_fix.total_interest(25), RepaymentMortgage(300000, 25, 0.045).total_interest(2)
+                      + reverted.total_interest(23))
+    assert two_year_fix.outstanding_balance(300) == 0
+    assert two_year_fix.total_fees(0) == 999
+
+    # Products sharing the five year fix compute it once.
+    _segmentedSchedule.cache_clear()
+    for reversion_rate in [0.06, 0.07, 0.08]:
+        VariableRateMortgage(250000, 30, [(60, 0.04), (None, reversion_rate)]).schedule
+    assert _segmentedSchedule.cache_info().hits == 2
+
+    rate_schedules = [[(24, 0.045), (None, 0.0799)], [(None, 0.0359)], np.linspace(0.03, 0.06, 300)]
+    batch = VariableRateMortgage.batch(np.full(3, 300000.0), 25, rate_schedules)
+    for row, rate_schedule in enumerate(rate_schedules):
+        principles, interests, payments, _ = VariableRateMortgage(300000, 25, rate_schedule).schedule
+        assert np.allclose(batch.interest[row], interests, rtol=1e-12)
+        assert np.allclose(batch.payments[row], payments, rtol=1e-12)
+
+
+
+def test_refinance_chain():
+    single = RefinanceChain(400000, 2000, [(None, 0.045)])
+    bought = BTLmortgageFactory(RepaymentMortgage, 2000, 400000, ltv_percentage=0.75, length=25, interest_rate=0.045)
+    assert np.array_equal(single.schedule.columns, bought.schedule.columns)
+    assert single.total_fees(10) == bought.total_fees(10)
+
+    # Residential lending only caps the LTV, so a five year fix on a grown value releases equity.
+    chain = RefinanceChain(400000, 2000, [(2, 0.045), (5, 0.05, 0.75, True), (None, 0.06)], ltv_percentage=0.6,
+                           annual_price_change_percentage=0.03, mortgage_searcher=mortgageFactory)
+    assert chain.start_months.tolist() == [0, 24, 84]
+    assert np.isclose(chain.mortgages[1].principle, 400000 * 1.03 ** 2 * 0.75, rtol=1e-6)
+    assert chain.equity_released[1] > 50000 and chain.equity_released[2] == 0
+    # The remortgage happens with the 25th payment, so selling after two years pays off the first product.
+    assert chain.outstanding_balance(24) == chain.mortgages[0].outstanding_balance(24)
+    assert np.isclose(chain.outstanding_balance(24) + chain.equity_released[1], chain.mortgages[1].principle)
+    assert chain.outstanding_balance(300) == 0
+    property_forecast = Property(True, 400000, chain, 2000, 0.2, 11, 0.1)
+    assert np.isclose(property_forecast.monthly_cash_flows(3, 0)[25] - property_forecast.monthly_cash_flows(3, 0)[24],
+                      chain.equity_released[1] - 1000, atol=1000)
+    for years in [1, 2, 5, 10, 25]:
+        # Fees and equity released reach the returns and the cash flows alike.
+        cash_flows = property_forecast.monthly_cash_flows(years, 0.03)
+        assert np.isclose(cash_flows.sum(), property_forecast.nominal_return_on_investment(years, 0.03, 0)
+                          - chain.total_principle_paid(years), rtol=0, atol=1e-6)
+
+    # Alternative futures after the same two year fix reuse its mortgage.
+    tails = [RefinanceChain(400000, 2000, [(2, 0.045), (None, rate)]) for rate in (0.05, 0.06)]
+    assert tails[0].mortgages[0] is tails[1].mortgages[0]
+    assert tails[0].mortgages[1] is not tails[1].mortgages[1]
+
+
+def test_refinance_chain_fixes_filling_the_term():
+    whole_term = RefinanceChain(400000, 2000, [(20, 0.04), (5, 0.05), (None, 0.06)])
+    overrunning = RefinanceChain(400000, 2000, [(20, 0.04), (10, 0.05), (None, 0.06)])
+    for chain in [whole_term, overrunning]:
+        assert chain.start_months.tolist() == [0, 240]
+        assert len(chain.schedule.columns[0]) == 300 and chain.outstanding_balance(300) == 0
+        assert np.isclose(chain.total_principle_paid(25), chain.principle)
+    assert np.array_equal(whole_term.schedule.columns, overrunning.schedule.columns)
+    single_fix = RefinanceChain(400000, 2000, [(25, 0.04), (5, 0.05)])
+    assert single_fix.start_months.tolist() == [0]
+    assert np.array_equal(single_fix.schedule.columns, RefinanceChain(400000, 2000, [(None, 0.04)]).schedule.columns)
+
+
+def test_refinance_chain_of_wrapped_mortgages():
+    products = [(2, 0.045), (5, 0.05), (None, 0.06)]
+    plain = RefinanceChain(400000, 2000, products)
+    relieved = RefinanceChain(400000, 2000, products, MortgageClass=TaxDeductibleMortgage,
+                              MortgageClassToDecorate=RepaymentMortgage, tax_rate=0.2)
+    # Carried balances are rebuilt with the same kwargs, so the wrapper only changes the interest reported.
+    assert all(isinstance(mortgage, TaxDeductibleMortgage) for mortgage in relieved.mortgages[1:])
+    assert relieved.mortgages[1].principle < relieved.mortgages[0].principle
+    assert np.array_equal(relieved.schedule.columns, plain.schedule.columns)
+    assert np.isclose(relieved.total_interest(25), 0.8 * plain.total_interest(25))
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from assetreturns import RepaymentMortgage, HLStock, LeaseholdProperty
+from backtest import Backtest, loadSeries
+
+
+def test_steady_history_reproduces_deterministic_forecast(leasehold_property):
+    months = 480
+    steady_index = 1.01 ** (np.arange(months) / 12)
+    backtest = Backtest(steady_index, np.full(months, 0.0259), steady_index, years=30, chunk_size=100)
+    for asset in [leasehold_property, HLStock(200000, 21.73)]:
+        returns = backtest.realised_returns(asset)
+        assert returns.shape == (months, 30)
+        expected = asset.percentage_return_surface(np.arange(1, 31), [0.01])[0]
+        # Windows that hold every horizon; later ones run out of history.
+        assert np.allclose(returns[:months - 360], expected, rtol=1e-9, atol=1e-12)
+        assert np.isnan(returns[months - 360, -1]) and not np.isnan(returns[months - 360, -2])
+
+    distribution = backtest.distribution({"Stock": HLStock(200000, 21.73)}, holding_periods=[1, 30])
+    assert distribution["Windows"].tolist() == [months - 12, months - 360]
+    assert np.allclose(distribution["P50"], HLStock(200000, 21.73).percentage_return_on_investment(
+        np.array([1, 30]), 0.01, 0))
+
+
+def test_series_load_once_and_align(tmp_path):
+    dates = pd.date_range("2000-01-01", periods=36, freq="MS")
+    pd.DataFrame({"Date": dates[::-1], "Index": np.arange(36, 0, -1.0)}).to_csv(tmp_path / "hpi.csv", index=False)
+    pd.DataFrame({"Date": dates[6:], "Rate": np.full(30, 0.05)}).to_csv(tmp_path / "rates.csv", index=False)
+    pd.DataFrame({"Month": dates[:24], "Price": np.linspace(100, 200, 24)}).to_csv(
+        tmp_path / "equity.csv", index=False)
+
+    first_month, values = loadSeries(str(tmp_path / "hpi.csv"), "Index")
+    assert first_month == 2000 * 12 and isinstance(values, np.memmap) and values[0] == 1 and values[-1] == 36
+    assert loadSeries(str(tmp_path / "hpi.csv"), "Index")[1].filename == values.filename
+
+    backtest = Backtest.from_files((str(tmp_path / "hpi.csv"), "Index"), (str(tmp_path / "rates.csv"), "Rate"),
+                                   (str(tmp_path / "equity.csv"), "Price", "Month"), years=1)
+    assert backtest.window_count == 18
+    assert backtest.start_months[0] == np.datetime64("2000-07") and backtest.house_price_index[0] == 7
+
+    pd.DataFrame({"Date": dates[[0, 2]], "Index": [1.0, 2.0]}).to_csv(tmp_path / "gap.csv", index=False)
+    with pytest.raises(ValueError):
+        loadSeries(str(tmp_path / "gap.csv"), "Index")
+
+
+def test_rent_growth_and_void_months_follow_the_ledger():
+    months = 240
+    steady_index = 1.01 ** (np.arange(months) / 12)
+    backtest = Backtest(steady_index, np.full(months, 0.0259), steady_index, years=10)
+    asset = LeaseholdProperty(True, 300000, RepaymentMortgage(225000, 25, 0.0259), 1400, 0.2, 12, 0.1,
+                              annual_service_charge=1000, annual_ground_rent=100, annual_rent_growth=0.03,
+                              void_months=[1, 2])
+    returns = backtest.realised_returns(asset)
+    expected = asset.percentage_return_surface(np.arange(1, 11), [0.01])[0]
+    assert np.allclose(returns[:months - 120], expected, rtol=1e-9, atol=1e-12)
+
+
+def test_equity_index_is_a_price_index():
+    # The price follows the index and the earnings yield (1 / 20) is added on top, as in the forecast.
+    equity_index = np.full(36, 100.0)
+    equity_index[12:] = 120.0
+    equity_index[24:] = 108.0
+    backtest = Backtest(np.ones(36), np.full(36, 0.03), equity_index, years=2)
+    returns = backtest.realised_returns(HLStock(100000, 20), metric="nominal")
+    fees = (0.00259669736 + 0.00998212157) * 100000 + 11.95 + 0.00998212157 * 100000 + 11.95
+    assert np.allclose(returns[0], [120000 + 5000 - fees - 100000, 108000 + 10250 - fees - 100000])
+    assert np.isclose(returns[12, 0], 90000 + 5000 - fees - 100000) and np.isnan(returns[12, 1])
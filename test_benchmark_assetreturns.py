@@ -0,0 +1,24 @@
+from benchmark_assetreturns import findRegressions, recordRun, loadHistory, measure
+
+
+def test_regression_gate(tmp_path):
+    history_path = str(tmp_path / "history.json")
+    assert loadHistory(history_path) == []
+    recordRun(history_path, {"report": {"seconds": 1.0, "operations_per_second": 1.0, "peak_bytes": 1000}})
+    recordRun(history_path, {"report": {"seconds": 0.8, "operations_per_second": 1.25, "peak_bytes": 1200}})
+    history = loadHistory(history_path)
+    assert len(history) == 2
+
+    assert findRegressions({"report": {"seconds": 0.9, "peak_bytes": 1000}}, history) == []
+    assert findRegressions({"new benchmark": {"seconds": 100, "peak_bytes": 10 ** 9}}, history) == []
+    # Compared with the best recent run: 0.8 s and 1000 bytes.
+    assert len(findRegressions({"report": {"seconds": 1.01, "peak_bytes": 1000}}, history)) == 1
+    assert len(findRegressions({"report": {"seconds": 1.01, "peak_bytes": 1300}}, history, threshold=0.5)) == 1
+    assert findRegressions({"report": {"seconds": 1.01, "peak_bytes": 1300}}, history, threshold=0.5,
+                           memory_threshold=0.5) == []
+
+
+def test_measure():
+    result = measure(lambda: [0] * 100000, operations=10, repeat=2)
+    assert result["operations_per_second"] == 10 / result["seconds"]
+    assert result["peak_bytes"] >= 100000 * 8
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from assetreturns import generateLeaseholdPropertyForecast, mortgageFactory, RepaymentMortgage, HLStock
+from breakeven import solveBreakEven, bracketedRoot, MortgageMemo
+
+
+def test_bracketed_root_vectorised():
+    targets = np.array([0.5, 2.0, 7.0, 20.0])
+    roots = bracketedRoot(lambda x, active: x ** 2 - targets, np.zeros(4), 4)
+    assert np.allclose(roots[:3], np.sqrt(targets[:3]))
+    assert np.isnan(roots[3])
+
+
+def test_break_even_interest_rate_for_each_scenario(leasehold_scenario):
+    scenarios = [dict(leasehold_scenario, monthly_gross_rental=rent) for rent in (1500, 2500, 3000)]
+    rates = solveBreakEven("interest_rate", 0, 0.3, scenarios)
+    assert np.all(np.diff(rates) > 0)
+    for scenario, rate in zip(scenarios, rates):
+        forecast = generateLeaseholdPropertyForecast(**dict(scenario, interest_rate=rate))
+        assert forecast.nominal_return_on_investment(25, 0.01, 0) == pytest.approx(0, abs=1)
+
+
+def test_break_even_against_stock_benchmark(leasehold_scenario):
+    stock = HLStock(200000, 21.73)
+    scenario = dict(leasehold_scenario, interest_rate=0.06)
+    rent, = solveBreakEven("monthly_gross_rental", 0, 10000, [scenario], target=stock, metric="annual_percentage")
+    forecast = generateLeaseholdPropertyForecast(**dict(scenario, monthly_gross_rental=rent))
+    assert forecast.annual_percentage_return_on_investment(25, 0.01, 0) == pytest.approx(
+        stock.annual_percentage_return_on_investment(25, 0.01, 0), abs=1e-8)
+
+    growth, = solveBreakEven("annual_price_change_percentage", -0.1, 0.1,
+                             [leasehold_scenario | {"monthly_gross_rental": 1500}], target=stock,
+                             metric="annual_percentage")
+    forecast = generateLeaseholdPropertyForecast(**dict(leasehold_scenario, monthly_gross_rental=1500))
+    assert forecast.annual_percentage_return_on_investment(25, growth, 0) == pytest.approx(
+        stock.annual_percentage_return_on_investment(25, growth, 0), abs=1e-8)
+
+
+def test_mortgage_memo_reuses_identical_loans():
+    memo = MortgageMemo()
+    searcher = memo.wrap(mortgageFactory)
+    first = searcher(RepaymentMortgage, 1500, 690000, ltv_percentage=0.75, length=25, interest_rate=0.03)
+    second = searcher(RepaymentMortgage, 2500, 690000, ltv_percentage=0.75, length=25, interest_rate=0.03)
+    assert first is second and memo.hits == 1
+    assert searcher(RepaymentMortgage, 2500, 690000, ltv_percentage=0.75, length=25, interest_rate=0.04) is not first
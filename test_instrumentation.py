@@ -0,0 +1,73 @@
+import json
+import pstats
+
+import pytest
+
+import assetreturns
+import instrumentation
+from assetreturns import BTLmortgageFactory, RepaymentMortgage, Property, HLStock, calculateSDLT
+from assetreturns import VariableRateMortgage, RefinanceChain
+
+
+def test_profile_counts_and_restores_hooks(tmp_path):
+    original_sdlt = assetreturns.calculateSDLT
+    original_init = assetreturns.AbstractMortgage.__init__
+    with instrumentation.profile(trace=True, cprofile=True) as recorder:
+        mortgage = BTLmortgageFactory(RepaymentMortgage, 1500, 300000, 0.75, length=25, interest_rate=0.03)
+        forecast = Property(True, 300000, mortgage, monthly_gross_rental=1500, rental_tax=0.2,
+                            months_occupied_out_of_12=11, agency_percentage=0.1)
+        for year in range(1, 11):
+            forecast.nominal_return_on_investment(year, 0.01, 0)
+        HLStock(100000, 20).percentage_return_on_investment(10, 0.01, 0)
+
+    assert recorder.calls["calculateSDLT"] == 1
+    assert recorder.calls["_mortgageFactory"] == 1
+    assert recorder.calls["AbstractMortgage.__init__"] == 1
+    assert recorder.calls["Investment.nominal_return_on_investment"] == 11
+    assert recorder.calls["Property.calculate_profits"] == 10
+    assert recorder.counters["_bisectionPrinciple steps"] > 0
+    table = recorder.table()
+    assert list(table.columns) == ["Function", "Calls", "Total Seconds", "Mean Seconds", "Max Seconds"]
+    assert table["Total Seconds"].is_monotonic_decreasing
+
+    recorder.write_trace(tmp_path / "trace.json")
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert len(events) == sum(recorder.calls.values())
+    recorder.dump_stats(tmp_path / "profile.pstats")
+    assert pstats.Stats(str(tmp_path / "profile.pstats")).total_calls > 0
+
+    assert assetreturns.calculateSDLT is original_sdlt
+    assert assetreturns.AbstractMortgage.__init__ is original_init
+    assert instrumentation.recorder is None
+
+
+def test_profile_does_not_nest():
+    with instrumentation.profile(hooks=()):
+        with pytest.raises(RuntimeError):
+            with instrumentation.profile(hooks=()):
+                pass
+    # Direct imports keep the unwrapped function and are not timed.
+    with instrumentation.profile(hooks=["calculateSDLT"]) as recorder:
+        calculateSDLT(True, 200000)
+        assetreturns.calculateSDLT(True, 200000)
+    assert recorder.calls["calculateSDLT"] == 1
+
+
+def test_schedule_overrides_are_timed():
+    original_schedule = assetreturns.VariableRateMortgage.schedule
+    with instrumentation.profile() as recorder:
+        VariableRateMortgage(300000, 25, [(24, 0.045), (None, 0.0799)]).total_interest(25)
+        RefinanceChain(400000, 2000, [(2, 0.045), (None, 0.06)]).total_interest(25)
+    assert recorder.calls["VariableRateMortgage.schedule"] >= 1
+    assert recorder.calls["RefinanceChain.schedule"] >= 1
+    assert assetreturns.VariableRateMortgage.schedule is original_schedule
+
+
+def test_unknown_hook_leaves_nothing_wrapped():
+    original_sdlt = assetreturns.calculateSDLT
+    with pytest.raises(AttributeError):
+        with instrumentation.profile(hooks=("calculateSDLT", "NoSuch.attr")):
+            pass
+    assert assetreturns.calculateSDLT is original_sdlt
+    assert not hasattr(assetreturns.calculateSDLT, "__wrapped__")
+    assert instrumentation.recorder is None
@@ -0,0 +1,51 @@
+import numpy as np
+
+from assetreturns import InterestOnlyMortgage, Property, HLStock, RefinanceChain, mortgageFactory
+from montecarlo import MonteCarloSimulation
+
+
+def test_zero_volatility_reproduces_deterministic_forecast(leasehold_property):
+    simulation = MonteCarloSimulation(path_count=20, years=30, seed=1, house_price_volatility=0,
+                                      equity_volatility=0, interest_rate_volatility=0, rental_voids=False)
+    assets = [leasehold_property,
+              Property(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), monthly_gross_rental=900,
+                       rental_tax=0.2, months_occupied_out_of_12=11, agency_percentage=0.1),
+              HLStock(200000, 21.73)]
+    # Product fees and equity released at each remortgage reach the paths as they do the forecast.
+    chain = RefinanceChain(400000, 2000, [(2, 0.045), (5, 0.05, 0.75, True), (None, 0.06)], ltv_percentage=0.6,
+                           mortgage_searcher=mortgageFactory)
+    assets.append(Property(True, 400000, chain, 2000, 0.2, 11, 0.1))
+    for asset in assets:
+        expected = asset.percentage_return_surface(np.arange(1, 31), [0.01])[0]
+        assert np.allclose(simulation.simulate(asset), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_percentile_bands_are_reproducible_and_ordered(leasehold_property):
+    simulation = MonteCarloSimulation(path_count=400, years=10, seed=42, chunk_size=150)
+    assets = {"Leasehold": leasehold_property, "Stock": HLStock(200000, 21.73)}
+    bands = simulation.percentile_bands(assets)
+    assert list(bands.columns) == ["Asset Name", "Year", "P5", "P50", "P95"]
+    assert len(bands) == 20
+    assert (bands["P5"] <= bands["P50"]).all() and (bands["P50"] <= bands["P95"]).all()
+    assert bands.equals(simulation.percentile_bands(assets))
+    assert bands.equals(simulation.percentile_bands(assets, processes=2))
+
+
+def test_rent_growth_and_void_months_follow_the_ledger():
+    simulation = MonteCarloSimulation(path_count=10, years=30, seed=3, house_price_volatility=0,
+                                      equity_volatility=0, interest_rate_volatility=0, rental_voids=False)
+    def asset():
+        return Property(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), monthly_gross_rental=900,
+                        rental_tax=0.2, months_occupied_out_of_12=11, agency_percentage=0.1, annual_rent_growth=0.02,
+                        void_months=[1])
+
+    simulated = simulation.simulate(asset())
+    assert np.allclose(simulated, asset().percentage_return_surface(np.arange(1, 31), [0.01])[0], rtol=1e-12,
+                       atol=1e-12)
+    # A ledger the asset has already built must not stand in for the simulated paths.
+    built = asset()
+    built.ledger(30)
+    assert np.array_equal(simulation.simulate(built), simulated)
+
+    voids = MonteCarloSimulation(path_count=200, years=10, seed=3).simulate(asset())
+    assert voids.shape == (200, 10) and np.isfinite(voids).all()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from assetreturns import RepaymentMortgage
+from overpayment import OverpaymentOptimizer
+
+
+def test_batched_plans_match_rebuilt_mortgages():
+    optimizer = OverpaymentOptimizer(300000, 25, 0.0459, cash_budget=60000)
+    plans = optimizer.candidate_plans(500, seed=1)
+    assert plans.shape == (500, 10) and plans.max() <= 0.1
+    outcomes = optimizer.evaluate(plans)
+    assert outcomes["Interest Saved"][np.all(plans == 0, axis=1)] == 0
+    unmodified = RepaymentMortgage(300000, 25, 0.0459)
+    for row in [0, 7, 250, 499]:
+        # The budget trims late overpayments; the applied percentages rebuild the same schedule.
+        mortgage = RepaymentMortgage(300000, 25, 0.0459, optimizer.early_repayment_plan(outcomes["Percentages"][row]))
+        assert np.isclose(outcomes["Cash Overpaid"][row], mortgage.total_early_repayments(25), rtol=1e-12)
+        assert np.isclose(outcomes["Interest Saved"][row],
+                          unmodified.total_interest(25) - mortgage.total_interest(25), rtol=1e-12)
+        assert outcomes["Payoff Month"][row] == np.flatnonzero(mortgage.schedule.columns[2])[-1] + 1
+    assert np.all(outcomes["Cash Overpaid"] <= 60000 + 1e-9)
+
+
+def test_frontier_trades_liquidity_for_interest():
+    optimizer = OverpaymentOptimizer(200000, 20, 0.05, cash_budget=30000, overpayment_years=5,
+                                     price_to_earnings=20)
+    frontier = optimizer.search(candidate_count=2000, seed=0)
+    assert frontier["Liquidity Kept"].iloc[0] == 30000 and frontier["Interest Saved"].iloc[0] == 0
+    assert frontier["Liquidity Kept"].is_monotonic_decreasing
+    assert frontier["Interest Saved"].is_monotonic_increasing
+    # One overpayment at month 13 grows for 19 years in the benchmark instead.
+    single = optimizer.evaluate([[0.1, 0, 0, 0, 0]])
+    overpaid = single["Cash Overpaid"][0]
+    assert np.isclose(single["Investment Growth"][0], overpaid * 1.05 ** 19 - overpaid)
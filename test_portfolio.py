@@ -0,0 +1,43 @@
+import numpy as np
+
+import instrumentation
+from assetreturns import Property, InterestOnlyMortgage, RepaymentMortgage, HLStock
+from portfolio import Portfolio
+
+
+def test_categories_add_up_to_each_assets_cash_flows(leasehold_property):
+    portfolio = Portfolio(years=25, annual_price_change_percentage=0.02)
+    freehold = Property(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), 900, 0.2, 11, 0.1)
+    stock = HLStock(200000, 21.73, [1000, 2000], monthly_contribution=100)
+    portfolio["Leasehold"] = leasehold_property
+    portfolio["Freehold"] = freehold
+    portfolio.add("Stock", stock, start_year=3)
+    for row, (asset, start_year) in enumerate([(leasehold_property, 0), (freehold, 0), (stock, 3)]):
+        cash_flows = portfolio._cash_flows[row].sum(axis=0)
+        assert np.allclose(cash_flows[start_year * 12:], asset.monthly_cash_flows(25 - start_year, 0.02))
+        assert not cash_flows[:start_year * 12].any()
+
+    timeline = portfolio.timeline()
+    assert len(timeline) == 301
+    assert np.isclose(timeline["Debt"][0], leasehold_property.mortgage.principle + 150000)
+    assert np.allclose(timeline["Equity"], timeline["Value"] - timeline["Debt"])
+    summary = portfolio.summary()
+    assert np.isclose(summary["Cash Requirement"], -timeline["Cumulative Cash"].min())
+    assert np.isclose(summary["Net Gain"], portfolio.asset_summary()["Net Gain"].sum())
+
+
+def test_only_changed_assets_are_evaluated():
+    portfolio = Portfolio(years=10)
+    for i in range(5):
+        portfolio[f"Stock {i}"] = HLStock(10000 * (i + 1), 21.73)
+    before = portfolio.summary()
+    with instrumentation.profile(hooks=()) as recorder:
+        portfolio["Flat"] = Property(True, 250000, RepaymentMortgage(187500, 10, 0.04), 1100, 0.2, 11, 0.1)
+        portfolio["Stock 2"].monthly_contribution = 50
+        portfolio.refresh("Stock 2")
+        del portfolio["Flat"]
+    assert recorder.counters["Portfolio asset evaluations"] == 2
+    assert portfolio.names == [f"Stock {i}" for i in range(5)]
+    assert np.isclose(portfolio.summary()["Net Gain"] - before["Net Gain"],
+                      HLStock(30000, 21.73, monthly_contribution=50).monthly_cash_flows(10, 0.01).sum()
+                      - HLStock(30000, 21.73).monthly_cash_flows(10, 0.01).sum())
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from assetreturns import generateLeaseholdPropertyForecast, mortgageFactory, RepaymentMortgage
+from assetreturns import InterestOnlyMortgage, Property, HLStock
+from report import generateHeaderTableAndGraphSource, streamReport, writeReport, GRAPH_COLUMNS
+
+
+def _assets():
+    return {
+        "Leasehold": generateLeaseholdPropertyForecast(True, 690000, ltv_percentage=0.75, monthly_gross_rental=2500,
+                                                       rental_tax=0.2, months_occupied_out_of_12=11,
+                                                       agency_percentage=0.12, annual_service_charge=4739,
+                                                       annual_ground_rent=600, mortgage_searcher=mortgageFactory,
+                                                       MortgageClass=RepaymentMortgage, length=25, interest_rate=0.0259),
+        "Freehold": Property(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), monthly_gross_rental=900,
+                             rental_tax=0.2, months_occupied_out_of_12=11, agency_percentage=0.1),
+        "Stock": HLStock(200000, 21.73),
+    }
+
+
+def test_graph_source_matches_per_year_evaluation():
+    assets = _assets()
+    headers, table, graph_source = generateHeaderTableAndGraphSource(assets, years_to_forecast=30)
+    assert list(graph_source.columns) == list(GRAPH_COLUMNS)
+    assert graph_source["Year"].dtype == np.int64 and graph_source["Nominal ROI"].dtype == np.float64
+    assert len(graph_source) == 90 and len(table) == 3
+    for asset_name, investment in assets.items():
+        rows = graph_source[graph_source["Asset Name"] == asset_name]
+        for year, row in zip(range(1, 31), rows.itertuples(index=False)):
+            percentage = investment.percentage_return_on_investment(year, 0.01, 0)
+            previous = investment.percentage_return_on_investment(year - 1, 0.01, 0) if year > 1 else 0
+            assert np.isclose(row[2], investment.nominal_return_on_investment(year, 0.01, 0), rtol=1e-12)
+            assert np.isclose(row[3], investment.annual_percentage_return_on_investment(year, 0.01, 0), rtol=1e-12)
+            assert np.isclose(row[4], percentage - previous, rtol=1e-9, atol=1e-12)
+            assert np.isclose(row[5], investment.profit_in_year(year), rtol=1e-12)
+
+
+def test_streamed_report_is_chunked_and_written_whole(tmp_path):
+    assets = _assets()
+    chunks = list(streamReport(iter(assets.items()), years_to_forecast=10, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [20, 10]
+    path = str(tmp_path / "report.csv")
+    assert writeReport(assets, path, years_to_forecast=10, chunk_size=2) == 30
+    written = pd.read_csv(path)
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert written["Asset Name"].tolist() == streamed["Asset Name"].tolist()
+    assert np.allclose(written.iloc[:, 1:].to_numpy(), streamed.iloc[:, 1:].to_numpy(), rtol=1e-15)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from assetreturns import generateLeaseholdPropertyForecast, mortgageFactory
+from sensitivity import sensitivities
+
+
+def test_bumps_match_rebuilt_forecasts(leasehold_scenario):
+    scenarios = {"Flat": dict(leasehold_scenario, months_occupied_out_of_12=11), "Full": leasehold_scenario}
+    table = sensitivities(scenarios, years=[5, 25])
+    assert len(table) == 2 * 2 * 5
+    flat = table[(table["Asset Name"] == "Flat") & (table["Year"] == 25)].set_index("Input")
+    assert flat["Swing"].is_monotonic_decreasing
+    for name, step in [("interest_rate", 0.0025), ("monthly_gross_rental", 50), ("annual_service_charge", 500),
+                       ("months_occupied_out_of_12", 1)]:
+        low, high = (generateLeaseholdPropertyForecast(**dict(scenarios["Flat"], **{name: value}))
+                     .percentage_return_on_investment(25, 0.01, 0)
+                     for value in (scenarios["Flat"][name] - step, scenarios["Flat"][name] + step))
+        assert np.isclose(flat.loc[name, "Low"], low) and np.isclose(flat.loc[name, "High"], high)
+        assert np.isclose(flat.loc[name, "Sensitivity"], (high - low) / 2)
+    base = generateLeaseholdPropertyForecast(**scenarios["Flat"])
+    assert np.isclose(flat.loc["annual_price_change_percentage", "High"],
+                      base.percentage_return_on_investment(25, 0.02, 0))
+    # A full year can't be more occupied, so only the step down counts.
+    full = table[(table["Asset Name"] == "Full") & (table["Input"] == "months_occupied_out_of_12")]
+    assert np.allclose(full["High"], full["Base"]) and np.allclose(full["Sensitivity"], full["Base"] - full["Low"])
+
+
+def test_only_rate_and_rent_bumps_search_for_a_mortgage(leasehold_scenario):
+    searches = []
+
+    def searcher(*args, **kwargs):
+        searches.append(kwargs["interest_rate"])
+        return mortgageFactory(*args, **kwargs)
+
+    table = sensitivities({"Flat": dict(leasehold_scenario, mortgage_searcher=searcher)}, years=[25])
+    assert len(searches) == 5 and len(table) == 5
+    assert sorted(set(searches)) == [leasehold_scenario["interest_rate"] - 0.0025, leasehold_scenario["interest_rate"],
+                                     leasehold_scenario["interest_rate"] + 0.0025]
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from assetreturns import mortgageFactory, RepaymentMortgage, generateLeaseholdPropertyForecast
+from sweep import ScenarioSweep
+
+FIXED_KWARGS = dict(is_second_property=True, principle=690000, rental_tax=0, agency_percentage=0.12,
+                    annual_ground_rent=600, mortgage_searcher=mortgageFactory, MortgageClass=RepaymentMortgage,
+                    length=25)
+PARAMETER_RANGES = {"interest_rate": [0.02, 0.04, 0.06], "ltv_percentage": [0.6, 0.75],
+                    "monthly_gross_rental": [1500, 2500], "annual_service_charge": [2000],
+                    "months_occupied_out_of_12": [10, 12]}
+
+
+def test_sweep_matches_forecasts():
+    results = ScenarioSweep(PARAMETER_RANGES, FIXED_KWARGS, years=(5, 25), shard_size=7).run()
+    assert len(results) == 3 * 2 * 2 * 2 * 2
+    row = results.iloc[5]
+    forecast = generateLeaseholdPropertyForecast(**FIXED_KWARGS, interest_rate=0.02, ltv_percentage=0.6,
+                                                 monthly_gross_rental=2500, annual_service_charge=2000,
+                                                 months_occupied_out_of_12=10)
+    assert row["Year"] == 25 and row["monthly_gross_rental"] == 2500 and row["months_occupied_out_of_12"] == 10
+    assert row["% ROI"] == pytest.approx(forecast.percentage_return_on_investment(25, 0.01, 0))
+    assert row["% ROI Year on Year"] == pytest.approx(forecast.annual_percentage_return_on_investment(25, 0.01, 0))
+
+
+def test_sweep_resumes_missing_shards(tmp_path):
+    sweep = ScenarioSweep(PARAMETER_RANGES, FIXED_KWARGS, years=(5, 25), shard_size=7)
+    in_memory = sweep.run()
+    on_disk = sweep.run(tmp_path, file_format="csv", processes=2)
+    assert np.allclose(on_disk["Nominal ROI"], in_memory["Nominal ROI"])
+
+    os.remove(tmp_path / "shard-000001.csv")
+    progress = []
+    resumed = sweep.run(tmp_path, file_format="csv", progress=lambda completed, total: progress.append(completed))
+    assert progress == [sweep.shard_count - 1, sweep.shard_count]
+    assert resumed.equals(on_disk)
+
+    with pytest.raises(ValueError):
+        ScenarioSweep(PARAMETER_RANGES, FIXED_KWARGS, years=(10,), shard_size=7).run(tmp_path, file_format="csv")
+    # Shards written as CSV can't resume a Parquet run of the same sweep.
+    assert sweep.fingerprint("csv") != sweep.fingerprint("parquet")
+    with pytest.raises(ValueError):
+        sweep.run(tmp_path, file_format="parquet")
@@ -0,0 +1,73 @@
+import numpy as np
+import numpy_financial
+
+from assetreturns import TaxDeductibleMortgage
+from assetreturns import RepaymentMortgage, InterestOnlyMortgage, Property, LeaseholdProperty, HLStock
+from valuation import internalRateOfReturn, netPresentValue, cashFlowMatrix, valueInvestments, realRate
+
+
+def test_cash_flows_reconcile_with_nominal_returns():
+    mortgage = RepaymentMortgage(150000, 10, 0.04)
+    property_forecast = Property(True, 200000, mortgage, monthly_gross_rental=900, rental_tax=0.2,
+                                 months_occupied_out_of_12=11, agency_percentage=0.1)
+    for years in [1, 5, 10, 25]:
+        cash_flows = property_forecast.monthly_cash_flows(years, 0.02)
+        assert len(cash_flows) == years * 12 + 1
+        # The nominal return doesn't charge principal repaid; the cash flows do.
+        assert np.isclose(cash_flows.sum(), property_forecast.nominal_return_on_investment(years, 0.02, 0)
+                          - mortgage.total_principle_paid(years), rtol=0, atol=1e-6)
+
+    stock = HLStock(200000, 21.73, yearly_topups=[1000, 2000])
+    assert np.isclose(stock.monthly_cash_flows(10, 0.01).sum(),
+                      stock.nominal_return_on_investment(10, 0.01, 0) - 3000, rtol=0, atol=1e-6)
+    assert stock.monthly_cash_flows(10, 0.01)[24] == -2000
+
+    # Tax relief on interest comes back each month.
+    relieved = Property(True, 200000, TaxDeductibleMortgage(0.2, InterestOnlyMortgage, 150000, 10, 0.04), 900, 0.2,
+                        11, 0.1)
+    plain = Property(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), 900, 0.2, 11, 0.1)
+    assert np.isclose(relieved.monthly_cash_flows(5, 0)[1] - plain.monthly_cash_flows(5, 0)[1], 0.2 * 500)
+
+    leasehold = LeaseholdProperty(True, 200000, InterestOnlyMortgage(150000, 10, 0.04), 900, 0.2, 11, 0.1,
+                                  annual_service_charge=1200, annual_ground_rent=0, will_you_live_in_this=True)
+    assert np.isclose(plain.monthly_cash_flows(5, 0)[1] - leasehold.monthly_cash_flows(5, 0)[1], 100)
+
+    # Leasehold charges are paid every year, indexed, in the returns as in the cash flows.
+    indexed = LeaseholdProperty(False, 200000, mortgage, 900, 0.2, 11, 0.1, annual_service_charge=1500,
+                                annual_ground_rent=90, will_you_live_in_this=False, annual_charge_indexation=0.05)
+    for years in [1, 5, 25]:
+        assert np.isclose(indexed.monthly_cash_flows(years, 0.02).sum(), indexed.nominal_return_on_investment(
+            years, 0.02, 0) - mortgage.total_principle_paid(years), rtol=0, atol=1e-6)
+    flat_charges = LeaseholdProperty(False, 200000, mortgage, 900, 0.2, 11, 0.1, annual_service_charge=1500,
+                                     annual_ground_rent=90, will_you_live_in_this=False)
+    assert np.isclose(flat_charges.nominal_return_on_investment(5, 0.02, 0)
+                      - indexed.nominal_return_on_investment(5, 0.02, 0), 1590 * 0.8 * (1.05 ** 5 - 1 - 0.05 * 5) / 0.05)
+
+
+def test_batched_irr_and_npv_match_numpy_financial(leasehold_property):
+    forecast = leasehold_property
+    growth = np.linspace(-0.03, 0.06, 8)
+    cash_flows = cashFlowMatrix([forecast] * len(growth), 25, growth)
+    irr = internalRateOfReturn(cash_flows)
+    expected = [(1 + numpy_financial.irr(series)) ** 12 - 1 for series in cash_flows]
+    assert np.allclose(irr, expected, rtol=0, atol=1e-10)
+    assert internalRateOfReturn(cash_flows[0]) == irr[0]
+    assert np.isnan(internalRateOfReturn([-100, -100]))
+
+    monthly_rate = 1.05 ** (1 / 12) - 1
+    assert np.isclose(netPresentValue(cash_flows[3], 0.05), numpy_financial.npv(monthly_rate, cash_flows[3]))
+    assert np.allclose(netPresentValue(cash_flows, 0.05), [numpy_financial.npv(monthly_rate, series)
+                                                           for series in cash_flows])
+
+
+def test_value_investments(leasehold_property):
+    assets = {"Leasehold": leasehold_property, "Stock": HLStock(200000, 21.73)}
+    table = valueInvestments(assets, [5, 25], 0.01, annual_inflation_percentage=0.02)
+    assert list(table.columns) == ["Asset Name", "Year", "IRR", "Real IRR", "NPV", "Real Gain"]
+    assert list(table["Asset Name"]) == ["Leasehold", "Leasehold", "Stock", "Stock"]
+    stock_flows = assets["Stock"].monthly_cash_flows(25, 0.01)
+    assert np.isclose(table["IRR"][3], internalRateOfReturn(stock_flows))
+    assert np.isclose(table["Real IRR"][3], realRate(table["IRR"][3], 0.02))
+    assert np.isclose(table["Real Gain"][3], netPresentValue(stock_flows, 0.02))
+    # At zero inflation the real gain is just the undiscounted total.
+    assert np.isclose(valueInvestments(assets, [25], 0.01)["Real Gain"][1], stock_flows.sum())
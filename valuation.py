@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+
+def _monthlyRate(annual_rate):
+    # Same compounding convention as RepaymentMortgage.
+    return (1 + np.asarray(annual_rate, dtype=float)) ** (1 / 12) - 1
+
+
+def netPresentValue(cash_flows, annual_discount_rate):
+    """
+    Present value of monthly cash flows (month 0 first) at an annual discount rate. cash_flows may be a
+    (series x months) array, with one rate for every series or one per series.
+    """
+    cash_flows = np.asarray(cash_flows, dtype=float)
+    monthly_rate = _monthlyRate(annual_discount_rate)[..., np.newaxis]
+    return (cash_flows * (1 + monthly_rate) ** -np.arange(cash_flows.shape[-1])).sum(axis=-1)[()]
+
+
+def internalRateOfReturn(cash_flows, tolerance=1e-12, max_iterations=100, low=-0.5, high=1.0):
+    """
+    Annual IRR of monthly cash flows, for every row of a (series x months) array at once. Newton steps on the
+    monthly rate, falling back to bisection whenever a step would leave the bracket [low, high] (monthly rates) that
+    holds the sign change. Series with no sign change in the bracket come back as NaN.
+    """
+    single_series = np.ndim(cash_flows) == 1
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    months = np.arange(cash_flows.shape[1])
+
+    def value_and_slope(rate):
+        discount = (1 + rate[:, np.newaxis]) ** -months
+        return (cash_flows * discount).sum(axis=1), -(cash_flows * months * discount / (1 + rate[:, np.newaxis])).sum(
+            axis=1)
+
+    series_count = len(cash_flows)
+    low = np.full(series_count, float(low))
+    high = np.full(series_count, float(high))
+    low_value, _ = value_and_slope(low)
+    high_value, _ = value_and_slope(high)
+    active = np.sign(low_value) * np.sign(high_value) < 0
+    rate = np.where(low_value == 0, low, np.where(high_value == 0, high, np.nan))
+    # Most investments land well inside the bracket; start Newton from 0.5% a month.
+    trial = np.clip(np.full(series_count, 0.005), low, high)
+    previous_step = high - low
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        value, slope = value_and_slope(trial)
+        # Shrink the bracket around the sign change.
+        below = np.sign(value) == np.sign(low_value)
+        low = np.where(active & below, trial, low)
+        low_value = np.where(active & below, value, low_value)
+        high = np.where(active & ~below, trial, high)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = trial - value / slope
+        # Bisect when Newton would leave the bracket or isn't at least halving its step, as it crawls where the
+        # discounting is steep.
+        bisect = (~np.isfinite(newton) | (newton <= low) | (newton >= high)
+                  | (np.abs(newton - trial) > np.abs(previous_step) / 2))
+        step = np.where(bisect, (low + high) / 2, newton)
+        converged = active & ((np.abs(step - trial) <= tolerance) | (value == 0))
+        rate = np.where(converged, step, rate)
+        active &= ~converged
+        previous_step = step - trial
+        trial = step
+    rate = np.where(active, trial, rate)
+    annual_rate = (1 + rate) ** 12 - 1
+    return annual_rate[0] if single_series else annual_rate
+
+
+def realRate(annual_rate, annual_inflation_percentage):
+    """Nominal annual rate net of inflation (Fisher)."""
+    return (1 + np.asarray(annual_rate)) / (1 + np.asarray(annual_inflation_percentage)) - 1
+
+
+def cashFlowMatrix(investments, years, annual_price_change_percentage):
+    """
+    monthly_cash_flows of each investment stacked into one (investments x years*12+1) array.
+    annual_price_change_percentage is one growth rate for all or one per investment.
+    """
+    growth = np.broadcast_to(np.asarray(annual_price_change_percentage, dtype=float), len(investments))
+    return np.array([investment.monthly_cash_flows(years, rate) for investment, rate in zip(investments, growth)])
+
+
+def valueInvestments(asset_dictionary, years, annual_price_change_percentage, annual_inflation_percentage=0,
+                     annual_discount_rate=0.05):
+    """
+    IRR, NPV and inflation adjusted figures from each asset's monthly cash flows, one row per (asset, year) like the
+    report's graph source. Every (asset, year) series is solved in one batched IRR call.
+
+    Real IRR strips inflation from the IRR; Real Gain is the net of all cash flows in today's money, i.e. their NPV
+    discounted at inflation.
+    """
+    years = [int(year) for year in np.atleast_1d(years)]
+    asset_names = list(asset_dictionary)
+    longest = max(years) * 12 + 1
+    cash_flows = np.zeros((len(asset_names) * len(years), longest))
+    for i, investment in enumerate(asset_dictionary.values()):
+        for j, year in enumerate(years):
+            # Shorter horizons are padded with zeros, which change neither IRR nor NPV.
+            cash_flows[i * len(years) + j, :year * 12 + 1] = investment.monthly_cash_flows(
+                year, annual_price_change_percentage)
+    irr = internalRateOfReturn(cash_flows)
+    return pd.DataFrame({
+        "Asset Name": np.repeat(asset_names, len(years)),
+        "Year": np.tile(years, len(asset_names)),
+        "IRR": irr,
+        "Real IRR": realRate(irr, annual_inflation_percentage),
+        "NPV": netPresentValue(cash_flows, annual_discount_rate),
+        "Real Gain": netPresentValue(cash_flows, annual_inflation_percentage),
+    })